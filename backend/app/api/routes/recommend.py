@@ -1,10 +1,22 @@
-from backend.app.services.recommendation_service import recommend_play
-from typing import Literal
-from pydantic import BaseModel
-from fastapi import APIRouter, Request
+from backend.app.services.compact import CODE_TABLE, JSON_MEDIA_TYPE, compact_results, dumps_json, encode, negotiate
+from backend.app.services.recommendation_service import (
+    SWEEP_AXES,
+    lookup_recommendation,
+    recommend_plays,
+    recommend_sweep,
+    sweep_values,
+)
+from typing import Annotated, Any, Dict, List, Literal
+from pydantic import BaseModel, Field, model_validator
+from fastapi import APIRouter, Request, Response
 
 router = APIRouter()
 
+# Upper bound on situations per batch call (each one expands to ~138 candidate rows)
+MAX_BATCH_SIZE = 1000
+# Upper bound on points per sweep call
+MAX_SWEEP_POINTS = 200
+
 class Situation(BaseModel):
     down: int
     distance: int
@@ -17,7 +29,103 @@ class Situation(BaseModel):
     defteam_timeouts_remaining: int = 3
 
 
+class SweepRequest(BaseModel):
+    situation: Situation
+    # Field of situation to vary; timeRemaining is given in seconds left in the quarter
+    axis: Literal[SWEEP_AXES]
+    start: int
+    stop: int
+    step: int = 1
+
+    @model_validator(mode="after")
+    def _check_range(self) -> "SweepRequest":
+        values = sweep_values(self.start, self.stop, self.step)
+        if not values:
+            raise ValueError("the range is empty; use a negative step to sweep downwards")
+        if len(values) > MAX_SWEEP_POINTS:
+            raise ValueError(f"at most {MAX_SWEEP_POINTS} points per sweep, got {len(values)}")
+        return self
+
+
+# The code table never changes while the process runs: encoded once
+_CODE_TABLE_BODY = dumps_json(CODE_TABLE)
+
+
+def _render(request: Request, payload: Any, results: List[Dict[str, Any]], **columns: Any) -> Response:
+    # Regular JSON shape by default; the columnar, integer-coded form when the Accept header asks for it.
+    # Either way the body is encoded here directly, skipping FastAPI's jsonable_encoder pass.
+    media_type = negotiate(request.headers.get("accept"))
+    if media_type == JSON_MEDIA_TYPE:
+        return Response(dumps_json(payload), media_type=media_type)
+    return Response(encode({**columns, **compact_results(results)}, media_type), media_type=media_type)
+
+
+@router.get("/recommend/codes")
+def recommend_codes(request: Request):
+    # Play / risk-level code table for compact responses; its version is echoed in each of them
+    etag = f'"{CODE_TABLE["version"]}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(_CODE_TABLE_BODY, media_type=JSON_MEDIA_TYPE, headers={"ETag": etag})
+
 
 @router.post("/recommend")
-def recommend(s: Situation, request: Request):
-    return recommend_play(s.model_dump(), request.app.state.success_model, request.app.state.yards_model)
+async def recommend(s: Situation, request: Request):
+    state = request.app.state
+    await state.models_ready.wait()
+    situation = s.model_dump()
+    # One read of the serving pair: a hot swap mid-request can't mix models with another pair's cache / table
+    models = state.models
+    # Table / cache hits are answered on the event loop; misses are coalesced into batched model calls
+    result = lookup_recommendation(
+        situation, models.success_model, models.yards_model, models.recommendation_cache, models.recommendation_table
+    )
+    version = models.version
+    if result is None:
+        result, version = await state.coalescer.submit(situation)
+    if state.shadow is not None:
+        # Only queued here; the candidate pair scores it on the shadow thread, off this request's path
+        state.shadow.submit([situation], [result], version)
+    return _render(request, result, [result])
+
+
+@router.post("/recommend/batch")
+async def recommend_batch(situations: Annotated[List[Situation], Field(max_length=MAX_BATCH_SIZE)], request: Request):
+    # One response per situation, in request order
+    state = request.app.state
+    await state.models_ready.wait()
+    models = state.models
+    situations = [s.model_dump() for s in situations]
+    results = await state.coalescer.run(
+        recommend_plays,
+        situations,
+        models.success_model,
+        models.yards_model,
+        models.recommendation_cache,
+        models.recommendation_table,
+        models.scorer,
+    )
+    if state.shadow is not None:
+        state.shadow.submit(situations, results, models.version)
+    return _render(request, results, results)
+
+
+@router.post("/recommend/sweep")
+async def recommend_sweep_route(sweep: SweepRequest, request: Request):
+    # The situation re-scored at each point of one axis, e.g. distance 1..15: one response per point, in order
+    state = request.app.state
+    await state.models_ready.wait()
+    models = state.models
+    values = sweep_values(sweep.start, sweep.stop, sweep.step)
+    points = await state.coalescer.run(
+        recommend_sweep,
+        sweep.situation.model_dump(),
+        sweep.axis,
+        values,
+        models.success_model,
+        models.yards_model,
+        models.recommendation_cache,
+        models.recommendation_table,
+        models.scorer,
+    )
+    return _render(request, {"axis": sweep.axis, "points": points}, points, axis=sweep.axis, value=values)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .services.metrics import REQUEST_SECONDS, RESPONSES
+
+# Per-request sampling profiler, off unless PROFILE_REQUESTS=1. When enabled, a request carrying an
+# "X-Profile: 1" header is sampled and its stacks are written to PROFILE_DIR in collapsed-stack format
+# (one "frame;frame;... count" line per distinct stack -- flamegraph.pl / speedscope read it directly).
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "/tmp/playcalling-profiles"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+
+# Routes get their own latency series; anything else is grouped so label cardinality stays bounded
+TRACKED_ROUTES = ("/recommend", "/recommend/batch", "/recommend/sweep", "/recommend/codes", "/models", "/health", "/metrics")
+
+# Threads that run request work besides the event loop: the inference pool (coalescer.py), the yards-model
+# helper (inference.py) and Starlette's pool for sync endpoints. Shadow scoring and other background
+# threads are left out of profiles.
+REQUEST_THREAD_PREFIXES = ("inference", "yards-model", "AnyIO worker thread")
+
+# Leaf frames of threads that are parked rather than working (event loop select, idle pool workers)
+_IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"), ("thread.py", "_worker"), ("queue.py", "get")}
+
+
+class SamplingProfiler:
+    # Samples the Python stacks of the threads a request can run on, at a fixed interval: the thread that
+    # starts the profiler (the event loop) and the REQUEST_THREAD_PREFIXES pools; parked ones are dropped.
+    # Those threads are shared, so other requests in flight at the same time show up in the profile too --
+    # profile on an otherwise idle worker for a clean single-request picture.
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self._owner = threading.get_ident()
+        self.stacks: StackCounter = StackCounter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self) -> None:
+        names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                if ident != self._owner and not names.get(ident, "").startswith(REQUEST_THREAD_PREFIXES):
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()))
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware (no BaseHTTPMiddleware task / stream overhead): request latency per route,
+    # response status counts, and the opt-in per-request profiler.
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        route = path if path in TRACKED_ROUTES else "other"
+        status = 500
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profiler is not None:
+                    message.setdefault("headers", []).append((b"x-profile", profile_path.name.encode()))
+            await send(message)
+
+        profiler: Optional[SamplingProfiler] = None
+        if PROFILE_REQUESTS and (b"x-profile", b"1") in scope.get("headers", []):
+            profile_path = PROFILE_DIR / f"{route.strip('/').replace('/', '_') or 'root'}-{time.time_ns()}.folded"
+            profiler = SamplingProfiler().start()
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+            RESPONSES.inc(str(status))
+            if profiler is not None:
+                profiler.stop()
+                profiler.write(profile_path)
@@ -1,41 +1,199 @@
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import os
 from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
 
 from .api.routes.recommend import router
-from .services.recommendation_service import _load_models
+from .instrumentation import MetricsMiddleware
+from .rate_limit import RateLimitMiddleware, build_buckets
+from .serve import format_memory, memory_stats, process_age
+from .services.coalescer import InferenceCoalescer
+from .services.inference import DualModelScorer
+from .services.metrics import render, render_values
+from .services.model_registry import ServingModels, active_version, load_active, load_version, shadow_version
+from .services.recommendation_service import preloaded_models, recommend_plays
+from .services.recommendation_table import load_table
+from .services.result_cache import RecommendationCache
+from .services.shadow import ShadowScorer, shadow_score
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+
+# pandas / catboost are not imported yet: they load with the models
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+# "eager": load and warm the models before accepting requests.
+# "lazy": accept requests (e.g. /health) immediately and load + warm in the background;
+# /recommend waits until the models are ready.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager")
+
+WARMUP_SITUATION = {
+    "down": 1,
+    "distance": 10,
+    "fieldPosition": 75,
+    "quarter": 1,
+    "timeRemaining": "15:00",
+    "scoreDifference": 0,
+    "posteam_type": "home",
+}
+
+
+# Hot swap: every MODEL_REGISTRY_POLL_SECONDS the worker checks which registry version is ACTIVE (see
+# services/model_registry.py); a new one is loaded and warmed while the current pair keeps serving, then
+# switched in with one assignment. 0 disables polling.
+MODEL_POLL_SECONDS = float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "10"))
+# How long the replaced pair's scorer threads are kept for requests that were already using it
+MODEL_RETIRE_SECONDS = float(os.getenv("MODEL_RETIRE_SECONDS", "30"))
+
+
+def _load_serving_models(version: Optional[str] = None) -> Tuple[ServingModels, Dict[str, float]]:
+    timings: Dict[str, float] = {}
+
+    started = time.perf_counter()
+    if version is None:
+        # Under backend/app/serve.py the models were loaded before fork and are shared with the parent
+        success_model, yards_model, metadata = preloaded_models() or load_active()
+    else:
+        success_model, yards_model, metadata = load_version(version)
+    models = ServingModels(
+        version=metadata.get("version"),
+        success_model=success_model,
+        yards_model=yards_model,
+        # Entries are tied to this model pair; 0 disables caching
+        recommendation_cache=RecommendationCache(int(os.getenv("RECOMMEND_CACHE_SIZE", "4096"))),
+        # Optional precomputed grid (see recommendation_table.py); None when absent or built from other models
+        recommendation_table=load_table(success_model, yards_model),
+        scorer=DualModelScorer(success_model, yards_model),
+        metadata=metadata,
+    )
+    timings["model_load"] = time.perf_counter() - started
+
+    # One full uncached inference so the first real request doesn't pay for lazy initialisation
+    started = time.perf_counter()
+    recommend_plays([WARMUP_SITUATION], success_model, yards_model, scorer=models.scorer)
+    timings["warmup"] = time.perf_counter() - started
+    return models, timings
 
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
-from fastapi.responses import JSONResponse
 
+async def swap_models(app: FastAPI, version: str) -> None:
+    async with app.state.swap_lock:
+        retired = app.state.models
+        models, timings = await app.state.coalescer.run(_load_serving_models, version)
+        app.state.models = models
+        print(
+            f"worker {os.getpid()} switched models {retired.version} -> {version}: "
+            f"load {timings['model_load']:.2f}s, warmup {timings['warmup']:.2f}s",
+            flush=True,
+        )
+    # close() waits for the retired pair's in-flight predictions, so it runs off the event loop
+    loop = asyncio.get_running_loop()
+    loop.call_later(MODEL_RETIRE_SECONDS, loop.run_in_executor, None, retired.scorer.close)
 
 
+def _load_shadow(version: str) -> ShadowScorer:
+    success_model, yards_model, _ = load_version(version)
+    shadow = ShadowScorer(version, success_model, yards_model)
+    shadow_score([WARMUP_SITUATION], shadow.scorer)
+    return shadow
+
+
+async def sync_shadow(app: FastAPI) -> None:
+    # Start, switch or stop shadow scoring to match registry/SHADOW
+    version = shadow_version()
+    current = app.state.shadow
+    if version == (current.version if current is not None else None) or (version and version == app.state.rejected_shadow):
+        return
+    try:
+        app.state.shadow = await app.state.coalescer.run(_load_shadow, version) if version is not None else None
+    except Exception as exc:
+        app.state.rejected_shadow = version
+        print(f"worker {os.getpid()} not shadowing model version {version}: {exc!r}", flush=True)
+        return
+    print(f"worker {os.getpid()} shadow models: {current.version if current else None} -> {version}", flush=True)
+    if current is not None:
+        # Lets queued comparisons finish and closes the log files
+        await asyncio.get_running_loop().run_in_executor(None, current.close)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.success_model, app.state.yards_model = _load_models()
-    yield
+    app.state.models_ready = asyncio.Event()
+    app.state.swap_lock = asyncio.Lock()
+    app.state.shadow = None
+    app.state.rejected_shadow = None
+
+    def run_batch(situations):
+        # Coalesced /recommend misses; they already missed the table, so only the cache is consulted again.
+        # Each result comes back with the version that scored it: a hot swap since the request read
+        # app.state.models means this batch ran on the new pair.
+        models = app.state.models
+        results = recommend_plays(
+            situations, models.success_model, models.yards_model, models.recommendation_cache, None, models.scorer
+        )
+        return [(result, models.version) for result in results]
+
+    # All model work runs on this bounded pool rather than Starlette's default threadpool
+    app.state.coalescer = InferenceCoalescer(
+        run_batch,
+        max_workers=int(os.getenv("INFERENCE_WORKERS", "2")),
+        window_ms=float(os.getenv("COALESCE_WINDOW_MS", "2")),
+        max_batch=int(os.getenv("COALESCE_MAX_BATCH", "64")),
+    )
 
+    async def load_models():
+        app.state.models, timings = await app.state.coalescer.run(_load_serving_models)
+        app.state.models_ready.set()
+        age = process_age()
+        print(
+            f"worker {os.getpid()} startup ({STARTUP_MODE}, {'shared' if preloaded_models() else 'own'} models, "
+            f"version {app.state.models.version or 'unversioned'}): "
+            f"imports {IMPORT_SECONDS:.2f}s, model load {timings['model_load']:.2f}s, warmup {timings['warmup']:.2f}s"
+            + (f", ready {age:.2f}s after process start" if age is not None else "")
+            + f"; {format_memory(memory_stats())}",
+            flush=True,
+        )
+        await sync_shadow(app)
 
-def get_real_ip(request: Request):
-    # X-Forwarded-For may contain a list: "client, proxy1, proxy2"
-    forwarded = request.headers.get("x-forwarded-for")
-    if forwarded:
-        return forwarded.split(",")[0].strip()
-    return get_remote_address(request)
+    async def watch_registry():
+        await loading
+        rejected = None
+        while True:
+            await asyncio.sleep(MODEL_POLL_SECONDS)
+            await sync_shadow(app)
+            version = active_version()
+            if version is None or version in (app.state.models.version, rejected):
+                continue
+            try:
+                await swap_models(app, version)
+            except Exception as exc:
+                # Keep serving the current pair; a bad version isn't retried until ACTIVE changes again
+                rejected = version
+                print(f"worker {os.getpid()} not switching to model version {version}: {exc!r}", flush=True)
+
+    loading = asyncio.create_task(load_models())
+    watcher = asyncio.create_task(watch_registry()) if MODEL_POLL_SECONDS > 0 else None
+    if STARTUP_MODE != "lazy":
+        await loading
+    yield
+    await loading
+    if watcher is not None:
+        watcher.cancel()
+    app.state.coalescer.close()
+    app.state.models.scorer.close()
+    if app.state.shadow is not None:
+        app.state.shadow.close()
 
 
-##rate limiting 
-limiter = Limiter(key_func=get_real_ip, default_limits=["60/minute"])
+##rate limiting (RATE_LIMIT, default 60/minute per client; see rate_limit.py)
+limiter = build_buckets()
 
 app = FastAPI(lifespan=lifespan)
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, lambda request, exc: JSONResponse({"detail": "Rate limit exceeded"}, status_code=429))
-app.add_middleware(SlowAPIMiddleware)
+app.add_middleware(RateLimitMiddleware, buckets=limiter)
 
 app.add_middleware(
     CORSMiddleware,
@@ -44,9 +202,67 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so request latency includes the rate limiter and CORS
+app.add_middleware(MetricsMiddleware)
 app.include_router(router)
 
 @app.api_route("/health", methods=["GET","HEAD"])
 def health():
     return {"ok": True}
 
+
+@app.get("/models")
+def models(request: Request):
+    # Registry metadata of the pair currently being served
+    serving = getattr(request.app.state, "models", None)
+    if serving is None:
+        return {"ready": False}
+    shadow = request.app.state.shadow
+    return {
+        "ready": True,
+        "version": serving.version,
+        "active": active_version(),
+        "shadow": shadow.version if shadow is not None else None,
+        **serving.metadata,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    # Prometheus text format; counters kept by the cache / table / coalescer are read at scrape time
+    state = request.app.state
+    serving = getattr(state, "models", None)
+    extra = []
+    if serving is not None:
+        extra += render_values(
+            "playcalling_model_info", "Model version being served", "gauge", [(serving.version or "unversioned", 1)], label="version"
+        )
+    cache = getattr(serving, "recommendation_cache", None)
+    if cache is not None:
+        stats = cache.stats()
+        extra += render_values(
+            "playcalling_cache_events_total",
+            "Result cache lookups and evictions",
+            "counter",
+            [(event, stats[event]) for event in ("hits", "misses", "evictions", "invalidations")],
+            label="event",
+        )
+        extra += render_values("playcalling_cache_entries", "Result cache entries", "gauge", [("", stats["size"])])
+    table = getattr(serving, "recommendation_table", None)
+    if table is not None:
+        extra += render_values(
+            "playcalling_table_lookups_total",
+            "Precomputed table lookups",
+            "counter",
+            [("hit", table.hits), ("miss", table.misses)],
+            label="result",
+        )
+    extra += render_values("playcalling_rate_limit_keys", "Clients in the rate limiter's key table", "gauge", [("", len(limiter))])
+    extra += render_values(
+        "playcalling_rate_limit_evictions_total", "Clients evicted from the full rate limiter key table", "counter", [("", limiter.evictions)]
+    )
+    coalescer = getattr(state, "coalescer", None)
+    if coalescer is not None:
+        extra += render_values("playcalling_coalesced_batches_total", "Batched model calls made for /recommend", "counter", [("", coalescer.batches)])
+        extra += render_values("playcalling_coalesced_situations_total", "Situations answered by those calls", "counter", [("", coalescer.coalesced)])
+    return render(extra)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .instrumentation import TRACKED_ROUTES
+from .services.metrics import RATE_LIMITED
+
+# Per-client token buckets, checked by a plain ASGI middleware before anything else runs. A client
+# (first X-Forwarded-For address, else the socket peer) gets RATE_LIMIT requests per period as a burst,
+# refilled continuously, so "60/minute" means 60 at once and then one a second.
+# The key table has a fixed number of slots (RATE_LIMIT_KEYS); when it's full the least recently seen
+# client is evicted. An evicted client starts over with a full bucket. That is also where an idle
+# client's bucket would have refilled to anyway.
+# With RATE_LIMIT_SHARED=1, the buckets live in an anonymous shared mapping created at import. The
+# workers of the pre-fork server (serve.py) inherit it, so a client's limit covers all of them.
+# Workers started any other way each get their own table.
+RATE_LIMIT = os.getenv("RATE_LIMIT", "60/minute")
+RATE_LIMIT_KEYS = int(os.getenv("RATE_LIMIT_KEYS", "65536"))
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "0") == "1"
+# Paths answered without touching the table (the uptime ping, Prometheus scrapes)
+RATE_LIMIT_EXEMPT = tuple(path for path in os.getenv("RATE_LIMIT_EXEMPT", "/health,/metrics").split(",") if path)
+
+PERIODS = {"second": 1.0, "minute": 60.0, "hour": 3600.0, "day": 86400.0}
+
+_REJECTED_BODY = b'{"detail":"Rate limit exceeded"}'
+
+
+def parse_rate(rate: str) -> Tuple[float, float]:
+    # "60/minute" -> (burst 60, refill 1 token per second)
+    count, _, period = rate.partition("/")
+    if period not in PERIODS or int(count) <= 0:
+        raise ValueError(f"rate limit should look like 60/minute, got {rate!r}")
+    return float(count), float(count) / PERIODS[period]
+
+
+class TokenBuckets:
+    # One process's table: an OrderedDict in recency order, so lookup, refresh and eviction are O(1).
+    # Only the event loop thread calls acquire(), so there is nothing to lock.
+
+    def __init__(self, burst: float, refill_per_second: float, capacity: int = RATE_LIMIT_KEYS):
+        self.burst = burst
+        self.rate = refill_per_second
+        self.capacity = capacity
+        self.enabled = True
+        self.evictions = 0
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def acquire(self, key: str, now: float) -> float:
+        # 0 if the request may go ahead, else seconds until the client has a token again
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.capacity:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            self._buckets[key] = [self.burst - 1.0, now]
+            return 0.0
+        self._buckets.move_to_end(key)
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / self.rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SharedTokenBuckets:
+    # The same buckets in a MAP_SHARED anonymous mapping, as a set-associative table: a key hashes to one
+    # set of WAYS slots and takes a free slot there, else the set's least recently seen one.
+    # Each set is guarded by one of LOCK_STRIPES process-shared locks, so workers only contend when
+    # two of them update keys of the same stripe at the same moment. Layout: a u64 key hash per slot
+    # (0 = free), then (tokens, last seen) as two f64 per slot.
+    WAYS = 8
+    LOCK_STRIPES = 64
+
+    def __init__(self, burst: float, refill_per_second: float, capacity: int = RATE_LIMIT_KEYS):
+        self.burst = burst
+        self.rate = refill_per_second
+        self.sets = max(1, capacity // self.WAYS)
+        self.capacity = self.sets * self.WAYS
+        self.enabled = True
+        self.evictions = 0
+        self._state_offset = self.capacity * 8
+        self._map = mmap.mmap(-1, self.capacity * 24)
+        self._keys_format = f"<{self.WAYS}Q"
+        self._state_format = f"<{2 * self.WAYS}d"
+        self._locks = [multiprocessing.Lock() for _ in range(min(self.LOCK_STRIPES, self.sets))]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        # Stable across processes (str hash() isn't guaranteed to be); 0 marks a free slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    def acquire(self, key: str, now: float) -> float:
+        h = self._hash(key)
+        index = h % self.sets
+        first = index * self.WAYS
+        with self._locks[index % len(self._locks)]:
+            keys = struct.unpack_from(self._keys_format, self._map, first * 8)
+            if h in keys:
+                slot = first + keys.index(h)
+                tokens, last = struct.unpack_from("<2d", self._map, self._state_offset + slot * 16)
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+            else:
+                if 0 in keys:
+                    way = keys.index(0)
+                else:
+                    seen = struct.unpack_from(self._state_format, self._map, self._state_offset + first * 16)[1::2]
+                    way = seen.index(min(seen))
+                    self.evictions += 1
+                slot = first + way
+                struct.pack_into("<Q", self._map, slot * 8, h)
+                tokens = self.burst
+            wait = 0.0 if tokens >= 1.0 else (1.0 - tokens) / self.rate
+            struct.pack_into("<2d", self._map, self._state_offset + slot * 16, tokens - 1.0 if wait == 0.0 else tokens, now)
+        return wait
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(np.frombuffer(self._map, dtype=np.uint64, count=self.capacity)))
+
+
+def build_buckets(rate: str = RATE_LIMIT, capacity: int = RATE_LIMIT_KEYS, shared: bool = RATE_LIMIT_SHARED) -> Any:
+    burst, refill = parse_rate(rate)
+    return (SharedTokenBuckets if shared else TokenBuckets)(burst, refill, capacity)
+
+
+def client_key(scope: Dict[str, Any]) -> str:
+    # X-Forwarded-For may contain a list: "client, proxy1, proxy2"
+    for name, value in scope["headers"]:
+        if name == b"x-forwarded-for":
+            return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "127.0.0.1"
+
+
+class RateLimitMiddleware:
+    # Plain ASGI middleware: exempt paths and non-HTTP traffic pass straight through; otherwise one
+    # table update per request, and a 429 with Retry-After once the client's bucket is empty.
+
+    def __init__(self, app: Any, buckets: Optional[Any] = None, exempt: Tuple[str, ...] = RATE_LIMIT_EXEMPT):
+        self.app = app
+        self.buckets = buckets
+        self.exempt = frozenset(exempt)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        buckets = self.buckets
+        if scope["type"] != "http" or buckets is None or not buckets.enabled or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+
+        # CLOCK_MONOTONIC is system-wide, so shared buckets can compare timestamps from different workers
+        wait = buckets.acquire(client_key(scope), time.monotonic())
+        if not wait:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        RATE_LIMITED.inc(path if path in TRACKED_ROUTES else "other")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(_REJECTED_BODY)).encode()),
+                    (b"retry-after", str(math.ceil(wait)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": _REJECTED_BODY})
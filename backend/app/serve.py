@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional, Sequence
+
+# Pre-fork multi-worker server: the app, its heavy imports and both CatBoost models are loaded once in
+# this parent process, then N workers are forked and serve one shared listening socket. The workers
+# inherit the parent's memory copy-on-write, so model and library pages exist once on the box instead
+# of once per worker, and a worker (re)start skips the model load entirely.
+#
+#   python -m backend.app.serve --workers 4 --port 8000
+
+
+def memory_stats() -> Dict[str, float]:
+    # MiB for this process. Pss splits shared pages between the processes mapping them, so summing
+    # Pss over the workers gives the real footprint; Rss counts shared pages in every worker.
+    stats: Dict[str, float] = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                    stats[name] = int(value.split()[0]) / 1024
+    except OSError:
+        # Not Linux: fall back to peak RSS from getrusage
+        import resource
+
+        stats["Rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    if "Shared_Clean" in stats:
+        stats["Shared"] = stats.pop("Shared_Clean") + stats.pop("Shared_Dirty")
+        stats["Private"] = stats.pop("Private_Clean") + stats.pop("Private_Dirty")
+    return stats
+
+
+def process_age() -> Optional[float]:
+    # Seconds since this process started (Linux), so startup reports include interpreter + uvicorn boot
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+
+
+def format_memory(stats: Dict[str, float]) -> str:
+    return " ".join(f"{name.lower()}={value:.0f}MiB" for name, value in stats.items())
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, host: str, port: int) -> None:
+    import uvicorn
+
+    # Workers exit on SIGTERM/SIGINT through uvicorn's own handlers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, host=host, port=port, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the API from N forked workers sharing one copy of the models")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    from .main import app
+    from .services.recommendation_service import preload_models
+
+    imported = time.perf_counter()
+    preload_models()
+    loaded = time.perf_counter()
+    # Move everything allocated so far out of the collector's reach, so GC passes in the workers
+    # don't write to (and un-share) these pages
+    gc.freeze()
+    print(
+        f"parent {os.getpid()}: imports {imported - started:.2f}s, model load {loaded - imported:.2f}s, "
+        f"{format_memory(memory_stats())}",
+        flush=True,
+    )
+
+    sock = _bind(args.host, args.port)
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app, sock, args.host, args.port)
+            finally:
+                os._exit(0)
+        children[pid] = slot
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(args.workers):
+        spawn(slot)
+
+    # Replace workers that die unexpectedly; they fork from the already-loaded parent, so this is fast
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"worker {pid} exited with status {status}, restarting", flush=True)
+            spawn(slot)
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# pandas and catboost are imported where they're first needed, so importing the app stays cheap
+if TYPE_CHECKING:
+    import pandas as pd
+    from catboost import Pool
+
+
+def _candidate_geometry() -> List[Dict[str, str]]:
+    candidates: List[Dict[str, str]] = []
+
+    run_locations = ["left", "middle", "right"]
+    run_gaps = ["guard", "tackle", "end"]
+    run_players = ["D.Swift", "K.Monangai"]
+    pass_locations = ["left", "middle", "right"]
+    pass_depths = ["short", "medium", "deep"]
+    shotgun = ["shotgun", "under_center"]
+    offense_personnel = ["11", "12", "13"]
+
+    for personnel in offense_personnel:
+        for formation in shotgun:
+            for location in run_locations:
+                # Middle runs have no gap in NFL PBP (null → "unknown"); left/right have guard/tackle/end
+                gaps = ["unknown"] if location == "middle" else run_gaps
+                for gap in gaps:
+                    for player in run_players:
+                        candidates.append(
+                            {
+                                "play_type": "run",
+                                "run_location": location,
+                                "run_gap": gap,
+                                "run_player": player,
+                                "pass_location": "unknown",
+                                "pass_depth_bucket": "not_pass",
+                                "shotgun": formation,
+                                "offense_personnel": personnel,
+                            }
+                        )
+
+    for personnel in offense_personnel:
+        for formation in shotgun:
+            for location in pass_locations:
+                for depth in pass_depths:
+                    candidates.append(
+                        {
+                            "play_type": "pass",
+                            "run_location": "unknown",
+                            "run_gap": "unknown",
+                            "run_player": "not_run",
+                            "pass_location": location,
+                            "pass_depth_bucket": depth,
+                            "shotgun": formation,
+                            "offense_personnel": personnel,
+                        }
+                    )
+
+    return candidates
+
+
+# Play geometry never changes between requests, so it is enumerated once at import
+CANDIDATE_GEOMETRY = _candidate_geometry()
+
+# Columns filled per request from _base_features; everything else comes from the geometry template
+SITUATION_COLUMNS = [
+    "down",
+    "ydstogo",
+    "yardline_100",
+    "game_seconds_remaining",
+    "half_seconds_remaining",
+    "score_differential",
+    "posteam_timeouts_remaining",
+    "defteam_timeouts_remaining",
+    "no_huddle",
+    "posteam_type",
+]
+
+
+@lru_cache(maxsize=None)
+def _candidate_template(feature_names: Tuple[str, ...]) -> pd.DataFrame:
+    # Columnar candidate geometry in the model's feature order, built once per feature layout (i.e. at model load).
+    # Columns the geometry doesn't define get "unknown", same as the reindex fill it replaces;
+    # situation columns are placeholders overwritten on every request.
+    import pandas as pd
+
+    columns: Dict[str, Any] = {}
+    for column in feature_names:
+        if column in SITUATION_COLUMNS:
+            columns[column] = np.zeros(len(CANDIDATE_GEOMETRY), dtype=np.int64)
+        else:
+            columns[column] = [candidate.get(column, "unknown") for candidate in CANDIDATE_GEOMETRY]
+    return pd.DataFrame(columns, columns=list(feature_names))
+
+
+def _generate_candidates(bases: List[Dict[str, Any]], feature_names: List[str]) -> pd.DataFrame:
+    # One block of len(CANDIDATE_GEOMETRY) rows per situation: the template is tiled and only the
+    # situation columns are filled in
+    template = _candidate_template(tuple(feature_names))
+    n_candidates = len(template)
+
+    frame = template.take(np.tile(np.arange(n_candidates), len(bases))).reset_index(drop=True)
+    for column in SITUATION_COLUMNS:
+        if column in frame.columns:
+            frame[column] = np.repeat([base[column] for base in bases], n_candidates)
+    return frame
+
+
+@dataclass(frozen=True)
+class _PoolLayout:
+    # Candidate geometry pre-split into CatBoost's numeric / categorical blocks for one model feature layout
+    num_names: List[str]
+    cat_names: List[str]
+    num_template: np.ndarray
+    cat_template: np.ndarray
+    num_situation: List[Tuple[int, str]]
+    cat_situation: List[Tuple[int, str]]
+
+
+@lru_cache(maxsize=None)
+def _pool_layout(feature_names: Tuple[str, ...], cat_indices: Tuple[int, ...]) -> Optional[_PoolLayout]:
+    # FeaturesData always puts numeric features before categorical ones, so it only matches
+    # models whose categorical features are the trailing block (true for the trained artifacts)
+    n_num = len(feature_names) - len(cat_indices)
+    if list(cat_indices) != list(range(n_num, len(feature_names))):
+        return None
+
+    num_names, cat_names = list(feature_names[:n_num]), list(feature_names[n_num:])
+    n_candidates = len(CANDIDATE_GEOMETRY)
+    num_template = np.zeros((n_candidates, len(num_names)), dtype=np.float32)
+    cat_template = np.empty((n_candidates, len(cat_names)), dtype=object)
+    for j, column in enumerate(cat_names):
+        cat_template[:, j] = [str(candidate.get(column, "unknown")) for candidate in CANDIDATE_GEOMETRY]
+
+    return _PoolLayout(
+        num_names=num_names,
+        cat_names=cat_names,
+        num_template=num_template,
+        cat_template=cat_template,
+        num_situation=[(j, column) for j, column in enumerate(num_names) if column in SITUATION_COLUMNS],
+        cat_situation=[(j, column) for j, column in enumerate(cat_names) if column in SITUATION_COLUMNS],
+    )
+
+
+def _candidate_pool(bases: List[Dict[str, Any]], model: Any) -> Optional[Pool]:
+    # Same rows as _generate_candidates, fed to CatBoost as raw float32 / string blocks with no DataFrame in between.
+    # None when the model's layout can't be expressed as FeaturesData.
+    from catboost import FeaturesData, Pool
+
+    layout = _pool_layout(tuple(model.feature_names_), tuple(model.get_cat_feature_indices()))
+    if layout is None:
+        return None
+
+    n_candidates = len(CANDIDATE_GEOMETRY)
+    num = np.tile(layout.num_template, (len(bases), 1))
+    for j, column in layout.num_situation:
+        num[:, j] = np.repeat([base[column] for base in bases], n_candidates)
+    cat = np.tile(layout.cat_template, (len(bases), 1))
+    for j, column in layout.cat_situation:
+        cat[:, j] = np.repeat([str(base[column]) for base in bases], n_candidates)
+
+    return Pool(
+        FeaturesData(
+            num_feature_data=num,
+            cat_feature_data=cat,
+            num_feature_names=layout.num_names,
+            cat_feature_names=layout.cat_names,
+        )
+    )
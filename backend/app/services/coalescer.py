@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class InferenceCoalescer:
+    # Owns the bounded thread pool all model work runs on, and merges single-situation requests that
+    # arrive within `window_ms` of each other into one batched call (at most `max_batch` situations).
+    # The batch function receives the situations in arrival order and must return one result per situation;
+    # each caller gets its own result back as is.
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Dict[str, Any]]], List[Any]],
+        max_workers: int = 2,
+        window_ms: float = 2.0,
+        max_batch: int = 64,
+    ):
+        self._run_batch = run_batch
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+
+        self._pending: List[Tuple[Dict[str, Any], "asyncio.Future[Any]"]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        self.batches = 0
+        self.coalesced = 0
+
+    async def submit(self, situation: Dict[str, Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[Any]" = loop.create_future()
+        self._pending.append((situation, future))
+
+        # The first request of a window arms the timer; a full batch goes out immediately
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        # Uncoalesced work (e.g. an explicit batch request) on the same bounded pool
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(fn, *args))
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        self.batches += 1
+        self.coalesced += len(batch)
+        situations = [situation for situation, _ in batch]
+        futures = [future for _, future in batch]
+        task = asyncio.get_running_loop().run_in_executor(self._executor, self._run_batch, situations)
+        task.add_done_callback(partial(self._fan_out, futures))
+
+    @staticmethod
+    def _fan_out(futures: List["asyncio.Future[Any]"], task: "asyncio.Future[List[Any]]") -> None:
+        # Callers that went away (client disconnect) have cancelled futures; skip them
+        error = task.exception()
+        for i, future in enumerate(futures):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(task.result()[i])
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
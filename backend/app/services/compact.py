@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+from .recommendation_service import CANDIDATE_ARRAYS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Compact response format for batch / replay clients, chosen per request by the Accept header.
+# Each play is sent as an integer code: its index in the fixed candidate set. The code table is served
+# once (GET /recommend/codes), and the numbers are laid out as columns, one entry per situation:
+#   {"codesVersion": "...", "play": [17, 3], "successProbability": [61.2, 58.0], ...,
+#    "alternativeCounts": [6, 6], "alternatives": {"play": [...12 codes], "successProb": [...], ...}}
+# Alternatives are flattened in situation order; alternativeCounts says how many belong to each.
+# A situation with no recommendation has play -1.
+JSON_MEDIA_TYPE = "application/json"
+COMPACT_JSON_MEDIA_TYPE = "application/vnd.playcalling.compact+json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# Fields identifying a play; a code maps back to these values
+PLAY_KEYS = ("type", "run_location", "run_gap", "run_player", "pass_location", "pass_depth_bucket", "shotgun", "offense_personnel")
+RISK_LEVELS = ("low", "medium", "high")
+
+_PLAY_INDEX = {tuple(row[key] for key in PLAY_KEYS): i for i, row in enumerate(CANDIDATE_ARRAYS.rows)}
+_RISK_INDEX = {level: i for i, level in enumerate(RISK_LEVELS)}
+
+
+def play_code(play: Optional[Dict[str, Any]]) -> int:
+    if play is None:
+        return -1
+    return _PLAY_INDEX.get(tuple(play.get(key) for key in PLAY_KEYS), -1)
+
+
+def _build_code_table() -> Dict[str, Any]:
+    plays = [[row[key] for key in PLAY_KEYS] for row in CANDIDATE_ARRAYS.rows]
+    version = hashlib.sha256(json.dumps([PLAY_KEYS, plays, RISK_LEVELS]).encode()).hexdigest()[:16]
+    return {"version": version, "fields": list(PLAY_KEYS), "plays": plays, "riskLevels": list(RISK_LEVELS)}
+
+
+# Static for the life of the process: built once and reused by every response
+CODE_TABLE = _build_code_table()
+CODES_VERSION = CODE_TABLE["version"]
+
+
+def compact_results(results: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    alternatives: Dict[str, List[Any]] = {"play": [], "successProb": [], "expectedYards": [], "score": []}
+    counts = []
+    for result in results:
+        plays = result["alternativePlays"]
+        counts.append(len(plays))
+        alternatives["play"].extend(play_code(play) for play in plays)
+        alternatives["successProb"].extend(play["success_prob"] for play in plays)
+        alternatives["expectedYards"].extend(play["expected_yards"] for play in plays)
+        alternatives["score"].extend(play["score"] for play in plays)
+    return {
+        "codesVersion": CODES_VERSION,
+        "play": [play_code(result["recommendedPlay"]) for result in results],
+        "successProbability": [result["successProbability"] for result in results],
+        "expectedYards": [result["expectedYards"] for result in results],
+        "riskLevel": [_RISK_INDEX.get(result["riskLevel"], -1) for result in results],
+        "score": [(result["recommendedPlay"] or {}).get("score") for result in results],
+        "alternativeCounts": counts,
+        "alternatives": alternatives,
+    }
+
+
+def negotiate(accept: Optional[str]) -> str:
+    # First compact media type named in the Accept header (q-values aren't weighed); anything else,
+    # including msgpack without the msgpack package installed, gets the regular JSON response
+    for part in (accept or "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type == COMPACT_JSON_MEDIA_TYPE or (media_type in MSGPACK_MEDIA_TYPES and msgpack is not None):
+            return media_type
+        if media_type == JSON_MEDIA_TYPE:
+            break
+    return JSON_MEDIA_TYPE
+
+
+def dumps_json(payload: Any) -> bytes:
+    # orjson is several times faster than the stdlib encoder FastAPI uses; both emit the same document.
+    # Non-finite floats (scores of blocked plays) become null either way.
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(_finite(payload), separators=(",", ":")).encode()
+
+
+def _finite(value: Any) -> Any:
+    if isinstance(value, float):
+        return value if value == value and value not in (float("inf"), float("-inf")) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def encode(payload: Any, media_type: str) -> bytes:
+    if media_type in MSGPACK_MEDIA_TYPES:
+        return msgpack.packb(payload, use_bin_type=True)
+    return dumps_json(payload)
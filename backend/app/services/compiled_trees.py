@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .candidates import CANDIDATE_GEOMETRY, SITUATION_COLUMNS, _candidate_pool
+
+# Compiled evaluator for the fixed candidate layout ("compiled" inference backend, see inference.py).
+# Both models are oblivious trees: at each depth every row takes the same split, and a row's leaf is
+# the bit pattern of its split results. A split either compares one situation float feature to a border,
+# or looks at the candidate's categorical values (one-hot / CTR splits). A CTR can also combine those
+# values with a situation float border, or posteam_type, the one categorical situation feature.
+# Compiling takes each "context" (posteam_type x which interval every CTR-combined float lands in)
+# and asks CatBoost for the leaf index of every candidate, then masks out the float-split bits. That
+# leaves a (context, candidate, tree) table of categorical bits. Every tree has only a few float splits,
+# so at load time each (context, tree, float-bit pattern) gets its row of leaf values over candidates.
+# At request time only the float splits (a compare per tree depth) and the context are computed per
+# situation; the rest is one row gather per tree and a sum.
+#
+#   python -m backend.app.services.compiled_trees export        # compile the active pair to COMPILED_DIR
+#   python -m backend.app.services.compiled_trees check         # compare against CatBoost on real situations
+COMPILED_DIR = Path(os.getenv("COMPILED_TREES_DIR", Path(__file__).resolve().parents[2] / "ml" / "artifacts" / "compiled"))
+
+# Situation features with a categorical value, and every value the API can send
+SITUATION_CATEGORIES = {"posteam_type": ("home", "away")}
+# Cap on contexts; a model whose CTRs combine too many float borders isn't worth compiling
+MAX_CONTEXTS = 4096
+# Max |compiled - CatBoost| accepted by `check`; only the leaf summation order differs
+TOLERANCE = 1e-5
+
+
+class CompiledModel:
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.meta = meta
+        self.float_names: List[str] = meta["float_names"]
+        self.probability = meta["probability"]
+        self.scale, self.bias = meta["scale"], meta["bias"]
+        # Per (tree, depth): float feature position and border, or -1 where the split is categorical
+        self.split_feature = arrays["split_feature"]
+        self.split_border = arrays["split_border"]
+        self.split_weight = arrays["split_weight"]
+        # (contexts, candidates, trees): leaf-index bits of the categorical / CTR splits
+        self.candidate_bits = arrays["candidate_bits"]
+        self.leaf_values = arrays["leaf_values"]
+        self.tree_offsets = arrays["tree_offsets"]
+        # Context = posteam_type position, then for each CTR-combined float feature, its interval among
+        # that feature's borders (mixed radix: context_radix)
+        self.context_features = arrays["context_features"]
+        self.context_borders = [arrays[f"context_borders_{i}"] for i in range(len(self.context_features))]
+        self.context_radix = arrays["context_radix"]
+        self.category_values: Dict[str, Tuple[str, ...]] = {name: tuple(values) for name, values in meta["categories"].items()}
+        self._build_rows()
+
+    def _build_rows(self) -> None:
+        # (contexts, float patterns of all trees, candidates) leaf values. A tree with k float splits
+        # has 2**k patterns, numbered by its float splits in depth order (_pattern_weight) from
+        # _pattern_offsets[tree]. Categorical and float bits never overlap, so a leaf's flat position
+        # is tree offset + categorical bits + float bits.
+        is_float = self.split_feature >= 0
+        self._pattern_weight = np.where(is_float, 1 << np.maximum(np.cumsum(is_float, axis=1) - 1, 0), 0)
+        patterns = 1 << is_float.sum(axis=1)
+        self._pattern_offsets = np.concatenate([[0], np.cumsum(patterns)[:-1]]).astype(np.int64)
+        contexts, candidates, _ = self.candidate_bits.shape
+        self._rows = np.empty((contexts, int(patterns.sum()), candidates), dtype=np.float64)
+        for t, (offset, count) in enumerate(zip(self._pattern_offsets, patterns)):
+            depths = np.flatnonzero(is_float[t])
+            pattern = np.arange(count)[:, None]
+            float_bits = (((pattern >> np.arange(len(depths))) & 1) << depths).sum(axis=1)
+            leaf = self.tree_offsets[t] + self.candidate_bits[:, None, :, t].astype(np.int64) + float_bits[None, :, None]
+            self._rows[:, offset : offset + count] = self.leaf_values[leaf]
+
+    def _situation_arrays(self, bases: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        # float32, as CatBoost compares them; unknown categorical values fall back to the first one
+        x = np.array([[base[name] for name in self.float_names] for base in bases], dtype=np.float32)
+        context = np.zeros(len(bases), dtype=np.int64)
+        for name, values in self.category_values.items():
+            context = context * len(values) + np.array([values.index(base[name]) if base[name] in values else 0 for base in bases])
+        for i, feature in enumerate(self.context_features):
+            context = context * int(self.context_radix[i]) + np.searchsorted(self.context_borders[i], x[:, feature], side="left")
+        return x, context
+
+    def raw(self, bases: Sequence[Dict[str, Any]]) -> np.ndarray:
+        # Raw scores of every candidate for each situation, stacked like the Pool path: (len(bases) * candidates,)
+        x, context = self._situation_arrays(bases)
+        # (situations, trees): row of each tree's float-split pattern
+        features = np.maximum(self.split_feature, 0)
+        rows = ((x[:, features] > self.split_border) * self._pattern_weight).sum(axis=2) + self._pattern_offsets
+        values = self._rows[context[:, None], rows].sum(axis=1)
+        return (self.scale * values + self.bias).reshape(-1)
+
+    def predict(self, bases: Sequence[Dict[str, Any]]) -> np.ndarray:
+        raw = self.raw(bases)
+        return 1.0 / (1.0 + np.exp(-raw)) if self.probability else raw
+
+
+def _model_json(model: Any) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "model.json"
+        model.save_model(str(path), format="json")
+        return json.loads(path.read_text())
+
+
+def compile_model(model: Any) -> CompiledModel:
+    dump = _model_json(model)
+    feature_names = list(model.feature_names_)
+    info = dump["features_info"]
+    float_features = info.get("float_features", [])
+    cat_features = info.get("categorical_features", [])
+    float_names = [feature_names[f["flat_feature_index"]] for f in float_features]
+    cat_names = [feature_names[f["flat_feature_index"]] for f in cat_features]
+    if any(name not in SITUATION_COLUMNS for name in float_names):
+        raise ValueError("only situation features may be numeric for the compiled evaluator")
+    situation_cats = [name for name in cat_names if name in SITUATION_COLUMNS]
+    if any(name not in SITUATION_CATEGORIES for name in situation_cats):
+        raise ValueError(f"no known value set for situation features {situation_cats}")
+
+    trees = dump["oblivious_trees"]
+    depth = max((len(tree["splits"]) for tree in trees), default=0)
+    n_trees = len(trees)
+    split_feature = np.full((n_trees, depth), -1, dtype=np.int64)
+    split_border = np.zeros((n_trees, depth), dtype=np.float32)
+    for t, tree in enumerate(trees):
+        for d, split in enumerate(tree["splits"]):
+            if split["split_type"] == "FloatFeature":
+                split_feature[t, d] = split["float_feature_index"]
+                split_border[t, d] = split["border"]
+    split_weight = np.where(split_feature >= 0, 1 << np.arange(depth), 0).astype(np.int64)
+
+    # Float borders that CTRs combine with categorical values: candidate bits depend on which side a situation is
+    ctr_borders: Dict[int, set] = {}
+    for ctr in info.get("ctrs", []):
+        for element in ctr["elements"]:
+            if element["combination_element"] == "float_feature":
+                ctr_borders.setdefault(element["float_feature_index"], set()).add(element["border"])
+    context_features = sorted(ctr_borders)
+    context_borders = [np.array(sorted(ctr_borders[f]), dtype=np.float32) for f in context_features]
+    context_radix = np.array([len(b) + 1 for b in context_borders], dtype=np.int64)
+    categories = {name: SITUATION_CATEGORIES[name] for name in situation_cats}
+    n_contexts = int(np.prod([len(v) for v in categories.values()] + list(context_radix), dtype=np.int64))
+    if n_contexts > MAX_CONTEXTS:
+        raise ValueError(f"{n_contexts} contexts; the model's CTRs combine too many float borders to compile")
+
+    # One representative situation per context: every float feature inside the right interval
+    def representative(interval: int, borders: np.ndarray) -> float:
+        if interval == 0:
+            return float(borders[0]) - 1.0
+        if interval == len(borders):
+            return float(borders[-1]) + 1.0
+        return (float(borders[interval - 1]) + float(borders[interval])) / 2.0
+
+    bases = []
+    for combo in product(*[range(len(v)) for v in categories.values()], *[range(r) for r in context_radix]):
+        base: Dict[str, Any] = {column: 0 for column in SITUATION_COLUMNS}
+        base["posteam_type"] = "home"
+        for (name, values), position in zip(categories.items(), combo):
+            base[name] = values[position]
+        for feature, borders, interval in zip(context_features, context_borders, combo[len(categories) :]):
+            base[float_names[feature]] = representative(interval, borders)
+        bases.append(base)
+
+    pool = _candidate_pool(bases, model)
+    if pool is None:
+        raise ValueError("model feature layout isn't supported by the candidate Pool builder")
+    leaf_indexes = model.calc_leaf_indexes(pool).astype(np.int64)  # (contexts * candidates, trees)
+    categorical_mask = ((1 << depth) - 1) & ~split_weight.sum(axis=1)
+    candidate_bits = (leaf_indexes & categorical_mask).reshape(len(bases), len(CANDIDATE_GEOMETRY), n_trees)
+
+    leaf_values = np.concatenate([np.asarray(tree["leaf_values"], dtype=np.float64) for tree in trees])
+    tree_offsets = np.cumsum([0] + [len(tree["leaf_values"]) for tree in trees[:-1]]).astype(np.int64)
+    scale, bias = dump.get("scale_and_bias", [1.0, [0.0]])
+    arrays = {
+        "split_feature": split_feature,
+        "split_border": split_border,
+        "split_weight": split_weight,
+        "candidate_bits": candidate_bits.astype(np.uint16 if depth > 8 else np.uint8),
+        "leaf_values": leaf_values,
+        "tree_offsets": tree_offsets,
+        "context_features": np.array(context_features, dtype=np.int64),
+        "context_radix": context_radix,
+        **{f"context_borders_{i}": borders for i, borders in enumerate(context_borders)},
+    }
+    meta = {
+        "model_guid": model.get_metadata()["model_guid"],
+        "tree_count": int(model.tree_count_),
+        "float_names": float_names,
+        "categories": {name: list(values) for name, values in categories.items()},
+        "probability": type(model).__name__ == "CatBoostClassifier",
+        "scale": float(scale),
+        "bias": float(bias[0] if isinstance(bias, list) else bias),
+        "candidates": len(CANDIDATE_GEOMETRY),
+    }
+    return CompiledModel(arrays, meta)
+
+
+def _compiled_path(model: Any, directory: Path) -> Path:
+    return directory / f"{model.get_metadata()['model_guid']}-{model.tree_count_}.npz"
+
+
+def save_compiled(compiled: CompiledModel, model: Any, directory: Path = COMPILED_DIR) -> Path:
+    path = _compiled_path(model, directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    arrays = {
+        "split_feature": compiled.split_feature,
+        "split_border": compiled.split_border,
+        "split_weight": compiled.split_weight,
+        "candidate_bits": compiled.candidate_bits,
+        "leaf_values": compiled.leaf_values,
+        "tree_offsets": compiled.tree_offsets,
+        "context_features": compiled.context_features,
+        "context_radix": compiled.context_radix,
+        **{f"context_borders_{i}": borders for i, borders in enumerate(compiled.context_borders)},
+    }
+    np.savez(path, meta=np.array(json.dumps(compiled.meta)), **arrays)
+    return path
+
+
+def _load_saved(model: Any, directory: Path) -> Optional[CompiledModel]:
+    path = _compiled_path(model, directory)
+    if not path.exists():
+        return None
+    with np.load(path) as saved:
+        meta = json.loads(str(saved["meta"]))
+        if meta["candidates"] != len(CANDIDATE_GEOMETRY):
+            print(f"Ignoring {path}: compiled for a different candidate set")
+            return None
+        return CompiledModel({name: saved[name] for name in saved.files if name != "meta"}, meta)
+
+
+# Keyed by (model guid, tree count): models themselves are unhashable, and a hot swap brings new ones
+_compiled: Dict[Tuple[str, int], CompiledModel] = {}
+_compile_lock = threading.Lock()
+
+
+def compiled_for(model: Any, directory: Path = COMPILED_DIR) -> CompiledModel:
+    # Exported file if there is one for this exact model, else compiled in memory on first use
+    key = (model.get_metadata()["model_guid"], int(model.tree_count_))
+    compiled = _compiled.get(key)
+    if compiled is None:
+        with _compile_lock:
+            compiled = _compiled.get(key)
+            if compiled is None:
+                compiled = _compiled[key] = _load_saved(model, directory) or compile_model(model)
+    return compiled
+
+
+def check(success_model: Any, yards_model: Any, bases: List[Dict[str, Any]]) -> Dict[str, float]:
+    # Max absolute difference from CatBoost's own predictions on the same candidate rows
+    pool = _candidate_pool(bases, success_model)
+    return {
+        "success": float(np.abs(compiled_for(success_model).predict(bases) - success_model.predict_proba(pool)[:, 1]).max()),
+        "yards": float(np.abs(compiled_for(yards_model).predict(bases) - yards_model.predict(_candidate_pool(bases, yards_model))).max()),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    import time
+
+    import pandas as pd
+
+    from .model_registry import load_active
+    from .recommendation_service import _base_features
+
+    parser = argparse.ArgumentParser(description="Compile the served models into the candidate-layout tree evaluator")
+    parser.add_argument("command", choices=("export", "check"))
+    parser.add_argument("--out", type=Path, default=COMPILED_DIR)
+    parser.add_argument("--plays", type=Path, default=Path(__file__).resolve().parents[2] / "ml" / "artifacts" / "pbp_offense_chi_2025.parquet")
+    parser.add_argument("--situations", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    success_model, yards_model, metadata = load_active()
+    if args.command == "export":
+        for model in (success_model, yards_model):
+            started = time.perf_counter()
+            compiled = compile_model(model)
+            path = save_compiled(compiled, model, args.out)
+            print(
+                f"Compiled {model.tree_count_} trees, {compiled.candidate_bits.shape[0]} contexts "
+                f"in {time.perf_counter() - started:.2f}s -> {path}"
+            )
+        return
+
+    # Real situations from the play-by-play, both home and away, scored both ways
+    plays = pd.read_parquet(args.plays).dropna(subset=["down", "ydstogo", "yardline_100"]).head(args.situations)
+    situations = [
+        {
+            "down": int(play.down),
+            "distance": int(play.ydstogo),
+            "fieldPosition": int(play.yardline_100),
+            "quarter": int(play.qtr),
+            "timeRemaining": "%d:%02d" % divmod(int(play.quarter_seconds_remaining), 60),
+            "scoreDifference": int(play.score_differential or 0),
+            "posteam_type": "home" if i % 2 == 0 else "away",
+            "posteam_timeouts_remaining": int(play.posteam_timeouts_remaining),
+            "defteam_timeouts_remaining": int(play.defteam_timeouts_remaining),
+        }
+        for i, play in enumerate(plays.itertuples())
+    ]
+    bases = [_base_features(situation) for situation in situations]
+    errors = check(success_model, yards_model, bases)
+    print(
+        f"Version {metadata.get('version')}: {len(bases)} situations x {len(CANDIDATE_GEOMETRY)} candidates, "
+        f"max |compiled - CatBoost|: success {errors['success']:.2e}, yards {errors['yards']:.2e} (tolerance {TOLERANCE:g})"
+    )
+    if max(errors.values()) > TOLERANCE:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
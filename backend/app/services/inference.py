@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .candidates import _candidate_pool, _generate_candidates
+from .compiled_trees import compiled_for
+from .metrics import BATCH_SITUATIONS, STAGE_SECONDS
+
+# "pool" feeds CatBoost prebuilt arrays; "pandas" is the original DataFrame + reindex path;
+# "compiled" skips CatBoost at request time and evaluates the trees precompiled for the candidate set
+# (compiled_trees.py), equal to CatBoost up to float summation order
+INFERENCE_BACKENDS = ("pool", "pandas", "compiled")
+INFERENCE_BACKEND = os.getenv("RECOMMEND_INFERENCE_BACKEND", "pool")
+
+
+class DualModelScorer:
+    # Wraps the classifier / regressor pair from _load_models. Candidate features are prepared once
+    # (one Pool or DataFrame) and both models evaluate that same object. In concurrent mode the regressor
+    # runs on a helper thread while the classifier runs on the caller's -- CatBoost releases the GIL while
+    # predicting, so a request costs roughly the slower model rather than the sum of both.
+
+    def __init__(
+        self,
+        success_model: Any,
+        yards_model: Any,
+        backend: Optional[str] = None,
+        concurrent: Optional[bool] = None,
+        max_workers: int = 4,
+        thread_count: Optional[int] = None,
+    ):
+        self.success_model = success_model
+        self.yards_model = yards_model
+        self.backend = backend or INFERENCE_BACKEND
+        if self.backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend {self.backend!r}, expected one of {INFERENCE_BACKENDS}")
+
+        # Overlapping the two models only pays off with a spare core; split cores so they don't oversubscribe
+        cpus = os.cpu_count() or 1
+        self.concurrent = cpus > 1 if concurrent is None else concurrent
+        self._thread_count = thread_count or (max(1, cpus // 2) if self.concurrent else -1)
+        self._executor = (
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yards-model") if self.concurrent else None
+        )
+
+        # Both models were trained on the same feature layout, so one prepared input serves both
+        self._shared_pool = self.backend == "pool" and list(yards_model.feature_names_) == list(success_model.feature_names_)
+        if self.backend == "compiled":
+            # Compile (or load the exported tables) now rather than on the first request
+            self._compiled = (compiled_for(success_model), compiled_for(yards_model))
+
+    def prepare(self, bases: List[Dict[str, Any]]) -> Any:
+        # Candidate rows for every situation, stacked: rows i * len(CANDIDATE_GEOMETRY) onward belong to bases[i]
+        BATCH_SITUATIONS.observe(len(bases))
+        with STAGE_SECONDS.time("candidates"):
+            if self.backend == "compiled":
+                # The compiled tables already hold every candidate; only the situations are needed
+                return bases
+            if self._shared_pool:
+                pool = _candidate_pool(bases, self.success_model)
+                if pool is not None:
+                    return pool
+            return _generate_candidates(bases, self.success_model.feature_names_)
+
+    def _predict_success(self, features: Any) -> np.ndarray:
+        with STAGE_SECONDS.time("success_model"):
+            if self.backend == "compiled":
+                return self._compiled[0].predict(features)
+            return self.success_model.predict_proba(features, thread_count=self._thread_count)[:, 1]
+
+    def _predict_yards(self, features: Any) -> np.ndarray:
+        with STAGE_SECONDS.time("yards_model"):
+            if self.backend == "compiled":
+                return self._compiled[1].predict(features)
+            return self.yards_model.predict(features, thread_count=self._thread_count)
+
+    def score_prepared(self, features: Any) -> Tuple[np.ndarray, np.ndarray]:
+        if self._executor is None:
+            return self._predict_success(features), self._predict_yards(features)
+        yards = self._executor.submit(self._predict_yards, features)
+        success_probs = self._predict_success(features)
+        return success_probs, yards.result()
+
+    def score(self, bases: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        return self.score_prepared(self.prepare(bases))
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+def predict_candidates(
+    bases: List[Dict[str, Any]], success_model: Any, yards_model: Any, backend: Optional[str] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    # One-off scoring without a long-lived scorer (no helper threads to manage)
+    return DualModelScorer(success_model, yards_model, backend, concurrent=False).score(bases)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Minimal in-process metrics rendered in the Prometheus text format (served at /metrics).
+# Observations are a bisect and a few adds under a per-metric lock, cheap enough to leave on under load.
+# Each process (e.g. each serve.py worker) keeps its own numbers.
+
+# Seconds: 50us .. 5s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Situations per model call
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1000)
+
+
+def _labels(name: str, value: str) -> str:
+    return f'{{{name}="{value}"}}' if name else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label: str = ""):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label: str = "", amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label] = self._values.get(label, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.label, label)} {value:g}" for label, value in values)
+        return lines
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_label", "_started")
+
+    def __init__(self, histogram: "Histogram", label: str):
+        self._histogram = histogram
+        self._label = label
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._started, self._label)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS, label: str = ""):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        # Per label: [count per bucket (last one is +Inf)..., sum]
+        self._series: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label: str = "") -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [0.0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def time(self, label: str = "") -> _Timer:
+        return _Timer(self, label)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((label, list(values)) for label, values in self._series.items())
+        for label, values in series:
+            prefix = f'{self.label}="{label}",' if self.label else ""
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, "+Inf"), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative:g}')
+            lines.append(f"{self.name}_sum{_labels(self.label, label)} {values[-1]:g}")
+            lines.append(f"{self.name}_count{_labels(self.label, label)} {cumulative:g}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "playcalling_stage_seconds", "Time spent in each stage of scoring a batch of situations", label="stage"
+)
+BATCH_SITUATIONS = Histogram(
+    "playcalling_model_batch_situations", "Situations scored per model call", buckets=BATCH_BUCKETS
+)
+REQUEST_SECONDS = Histogram("playcalling_request_seconds", "HTTP request latency", label="route")
+RESPONSES = Counter("playcalling_responses_total", "HTTP responses by status code", label="status")
+RATE_LIMITED = Counter("playcalling_rate_limited_total", "Requests rejected by the rate limiter", label="route")
+SHADOW_EVENTS = Counter(
+    "playcalling_shadow_situations_total", "Situations compared against (or dropped by) the shadow models", label="event"
+)
+
+REGISTRY: Tuple[object, ...] = (STAGE_SECONDS, BATCH_SITUATIONS, REQUEST_SECONDS, RESPONSES, RATE_LIMITED, SHADOW_EVENTS)
+
+
+def render_values(name: str, help: str, kind: str, values: Iterable[Tuple[str, float]], label: str = "") -> List[str]:
+    # One family from values kept elsewhere (cache / coalescer / table counters), read at scrape time
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_labels(label, key)} {value:g}" for key, value in values)
+    return lines
+
+
+def render(extra: Optional[Iterable[str]] = None) -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())  # type: ignore[attr-defined]
+    if extra is not None:
+        lines.extend(extra)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .candidates import CANDIDATE_GEOMETRY, SITUATION_COLUMNS
+from .recommendation_service import ARTIFACTS_DIR, _load_models
+
+# Versioned model pairs: registry/<version>/ holds success.cbm, yards.cbm and model.json (feature names,
+# validation metrics, sha256 of each file). registry/ACTIVE names the version the API serves; workers
+# poll it and hot-swap when it changes. Without an ACTIVE file the API serves the loose artifacts.
+# registry/SHADOW optionally names a candidate version scored alongside it (see shadow.py).
+#
+#   python -m backend.app.services.model_registry list
+#   python -m backend.app.services.model_registry publish --success a.cbm --yards b.cbm --evaluate
+#   python -m backend.app.services.model_registry activate 20251019-101500
+#   python -m backend.app.services.model_registry shadow 20251019-101500   (--off to stop)
+REGISTRY_DIR = Path(os.getenv("MODEL_REGISTRY_DIR", ARTIFACTS_DIR / "registry"))
+ACTIVE_FILE = "ACTIVE"
+SHADOW_FILE = "SHADOW"
+METADATA_FILE = "model.json"
+MODEL_FILES = {"success": "success.cbm", "yards": "yards.cbm"}
+
+# Everything the service can fill in for a candidate row; a model needing anything else can't be served
+SERVED_FEATURES = set(SITUATION_COLUMNS) | set(CANDIDATE_GEOMETRY[0])
+
+
+class RegistryError(Exception):
+    pass
+
+
+@dataclass
+class ServingModels:
+    # Everything tied to one model pair. The API holds one of these and replaces it in a single
+    # assignment, so a request sees either the old pair with its cache / table / scorer or the new one.
+    version: Optional[str]
+    success_model: Any
+    yards_model: Any
+    recommendation_cache: Any = None
+    recommendation_table: Any = None
+    scorer: Any = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+def file_checksum(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def check_features(success_model: Any, yards_model: Any) -> None:
+    for name, model in (("success", success_model), ("yards", yards_model)):
+        missing = [col for col in model.feature_names_ if col not in SERVED_FEATURES]
+        if missing:
+            raise RegistryError(f"{name} model needs features the service doesn't produce: {', '.join(missing)}")
+
+
+def list_versions(registry: Path = REGISTRY_DIR) -> List[str]:
+    if not registry.exists():
+        return []
+    return sorted(path.name for path in registry.iterdir() if (path / METADATA_FILE).exists())
+
+
+def read_metadata(version: str, registry: Path = REGISTRY_DIR) -> Dict[str, Any]:
+    path = registry / version / METADATA_FILE
+    if not path.exists():
+        raise RegistryError(f"no model version {version!r} in {registry}")
+    return json.loads(path.read_text())
+
+
+def _read_pointer(name: str, registry: Path) -> Optional[str]:
+    try:
+        return (registry / name).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_pointer(name: str, version: Optional[str], registry: Path) -> None:
+    if version is None:
+        (registry / name).unlink(missing_ok=True)
+        return
+    verify(version, registry)
+    # Write-then-rename, so a polling worker never reads a half-written name
+    tmp = registry / f".{name}.{os.getpid()}"
+    tmp.write_text(version + "\n")
+    os.replace(tmp, registry / name)
+
+
+def active_version(registry: Path = REGISTRY_DIR) -> Optional[str]:
+    return _read_pointer(ACTIVE_FILE, registry)
+
+
+def activate(version: str, registry: Path = REGISTRY_DIR) -> None:
+    _write_pointer(ACTIVE_FILE, version, registry)
+
+
+def shadow_version(registry: Path = REGISTRY_DIR) -> Optional[str]:
+    return _read_pointer(SHADOW_FILE, registry)
+
+
+def set_shadow(version: Optional[str], registry: Path = REGISTRY_DIR) -> None:
+    _write_pointer(SHADOW_FILE, version, registry)
+
+
+def verify(version: str, registry: Path = REGISTRY_DIR) -> Dict[str, Any]:
+    metadata = read_metadata(version, registry)
+    for name, entry in metadata["files"].items():
+        checksum = file_checksum(registry / version / entry["path"])
+        if checksum != entry["sha256"]:
+            raise RegistryError(f"{version}/{entry['path']}: checksum {checksum[:12]} != {entry['sha256'][:12]}")
+    return metadata
+
+
+def publish(
+    success_model: Any,
+    yards_model: Any,
+    metrics: Dict[str, float],
+    version: Optional[str] = None,
+    notes: str = "",
+    extra: Optional[Dict[str, Any]] = None,
+    registry: Path = REGISTRY_DIR,
+) -> str:
+    check_features(success_model, yards_model)
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    target = registry / version
+    if target.exists():
+        raise RegistryError(f"model version {version!r} already exists")
+
+    # Built in a hidden directory and renamed into place: a version is either complete or absent
+    staging = registry / f".{version}.{os.getpid()}"
+    staging.mkdir(parents=True)
+    try:
+        files = {}
+        for name, model in (("success", success_model), ("yards", yards_model)):
+            path = staging / MODEL_FILES[name]
+            model.save_model(str(path), format="cbm")
+            files[name] = {"path": path.name, "sha256": file_checksum(path), "bytes": path.stat().st_size}
+        metadata = {
+            "version": version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "feature_names": {"success": list(success_model.feature_names_), "yards": list(yards_model.feature_names_)},
+            "metrics": {name: round(float(value), 6) for name, value in metrics.items()},
+            "files": files,
+            "notes": notes,
+            **(extra or {}),
+        }
+        (staging / METADATA_FILE).write_text(json.dumps(metadata, indent=1))
+        os.rename(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return version
+
+
+def load_version(version: str, registry: Path = REGISTRY_DIR) -> Tuple[Any, Any, Dict[str, Any]]:
+    from catboost import CatBoostClassifier, CatBoostRegressor
+
+    metadata = verify(version, registry)
+    success_model = CatBoostClassifier()
+    success_model.load_model(str(registry / version / MODEL_FILES["success"]), format="cbm")
+    yards_model = CatBoostRegressor()
+    yards_model.load_model(str(registry / version / MODEL_FILES["yards"]), format="cbm")
+    for name, model in (("success", success_model), ("yards", yards_model)):
+        if list(model.feature_names_) != metadata["feature_names"][name]:
+            raise RegistryError(f"{version}: {name} model features don't match its metadata")
+    check_features(success_model, yards_model)
+    return success_model, yards_model, metadata
+
+
+def load_active(registry: Path = REGISTRY_DIR) -> Tuple[Any, Any, Dict[str, Any]]:
+    # The ACTIVE version, or the loose artifacts in ml/artifacts when nothing has been activated
+    version = active_version(registry)
+    if version is None:
+        success_model, yards_model = _load_models()
+        return success_model, yards_model, {"version": None}
+    return load_version(version, registry)
+
+
+def _read_model(path: Path, regressor: bool) -> Any:
+    if path.suffix == ".cbm":
+        from catboost import CatBoostClassifier, CatBoostRegressor
+
+        model = CatBoostRegressor() if regressor else CatBoostClassifier()
+        model.load_model(str(path), format="cbm")
+        return model
+    import joblib
+
+    return joblib.load(path)
+
+
+def evaluate(success_model: Any, yards_model: Any) -> Dict[str, float]:
+    # Validation metrics on train.py's game_id holdout of the feature store
+    from backend.ml.training.data import holdout_masks, load_training_frame
+
+    dftrain, _ = load_training_frame()
+    _, val_mask = holdout_masks(dftrain)
+    return pair_metrics(success_model, yards_model, dftrain[val_mask])
+
+
+def pair_metrics(success_model: Any, yards_model: Any, val: Any) -> Dict[str, float]:
+    # AUC / MAE / RMSE of a pair on a frame of feature-store rows
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, roc_auc_score
+
+    yards = yards_model.predict(val[list(yards_model.feature_names_)])
+    return {
+        "auc": roc_auc_score(val["success"], success_model.predict_proba(val[list(success_model.feature_names_)])[:, 1]),
+        "mae": mean_absolute_error(val["yards_gained"], yards),
+        "rmse": mean_squared_error(val["yards_gained"], yards) ** 0.5,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Versioned model registry for the API")
+    parser.add_argument("--registry", type=Path, default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    publish_parser = commands.add_parser("publish", help="register a success / yards model pair (.cbm or .pkl)")
+    publish_parser.add_argument("--success", type=Path, required=True)
+    publish_parser.add_argument("--yards", type=Path, required=True)
+    publish_parser.add_argument("--version")
+    publish_parser.add_argument("--notes", default="")
+    publish_parser.add_argument("--auc", type=float)
+    publish_parser.add_argument("--mae", type=float)
+    publish_parser.add_argument("--evaluate", action="store_true", help="compute AUC / MAE / RMSE on the training holdout")
+    publish_parser.add_argument("--activate", action="store_true")
+    for name in ("activate", "verify"):
+        commands.add_parser(name).add_argument("version")
+    shadow_parser = commands.add_parser("shadow", help="score a candidate version alongside the active one")
+    shadow_parser.add_argument("version", nargs="?")
+    shadow_parser.add_argument("--off", action="store_true")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "list":
+            active, shadow = active_version(args.registry), shadow_version(args.registry)
+            for version in list_versions(args.registry):
+                metadata = read_metadata(version, args.registry)
+                metrics = " ".join(f"{name}={value:.3f}" for name, value in metadata["metrics"].items())
+                marker = "*" if version == active else "s" if version == shadow else " "
+                print(f"{marker} {version}  {metadata['created']}  {metrics}  {metadata['notes']}")
+        elif args.command == "publish":
+            success_model = _read_model(args.success, regressor=False)
+            yards_model = _read_model(args.yards, regressor=True)
+            metrics = evaluate(success_model, yards_model) if args.evaluate else {}
+            metrics.update({name: getattr(args, name) for name in ("auc", "mae") if getattr(args, name) is not None})
+            version = publish(success_model, yards_model, metrics, args.version, args.notes, registry=args.registry)
+            print(f"Published {version}: " + " ".join(f"{name}={value:.3f}" for name, value in metrics.items()))
+            if args.activate:
+                activate(version, args.registry)
+                print("Activated", version)
+        elif args.command == "shadow":
+            if args.off == (args.version is not None):
+                parser.error("shadow takes a version or --off")
+            set_shadow(args.version, args.registry)
+            print(f"Shadowing {args.version}" if args.version else "Shadow scoring off")
+        elif args.command == "activate":
+            activate(args.version, args.registry)
+            print("Activated", args.version)
+        else:
+            verify(args.version, args.registry)
+            print(args.version, "OK")
+    except RegistryError as exc:
+        parser.exit(1, f"error: {exc}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,17 @@
+import os
 from dataclasses import dataclass
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .situation_grids import SituationGrids, load_grids
+
+# "static": the hand-tuned success / yards weights below. "grids": weights from the expected-points grids
+# (build them with python -m backend.ml.features.build_situation_grids), loaded once at import.
+POLICY_WEIGHTS = os.getenv("POLICY_WEIGHTS", "static")
+_situation_grids = load_grids() if POLICY_WEIGHTS == "grids" else None
+if POLICY_WEIGHTS == "grids" and _situation_grids is None:
+    raise RuntimeError("POLICY_WEIGHTS=grids but no situation grids were found; build them first")
 
 
 @dataclass
@@ -18,18 +30,48 @@ def _normalize_probability(value: float) -> float:
     return value
 
 
+def policy_fingerprint() -> str:
+    # Identifies the weighting in use, so results precomputed under other weights aren't served
+    if _situation_grids is None:
+        return ""
+    return f"grids:{_situation_grids.checksum}"
+
+
+def _grid_weights(s: GameSituation, grids: SituationGrids) -> Tuple[float, float]:
+    # Expected points a successful play is worth over an unsuccessful one, vs. what 10 yards are worth.
+    # Success follows the label's definition: 40% / 60% of the distance on 1st / 2nd, conversion on 3rd / 4th.
+    down, distance, yardline = s.down, s.distance, s.yardline_100
+    if down <= 2:
+        needed = (0.4 if down == 1 else 0.6) * distance
+        ep_success = grids.ep(down + 1, distance - needed, yardline - needed)
+    elif distance >= yardline:
+        ep_success = 7.0
+    else:
+        ep_success = grids.ep(1, min(10.0, yardline - distance), yardline - distance)
+    # Failing on 4th down hands the ball over at this spot
+    ep_failure = grids.ep(down + 1, distance, yardline) if down < 4 else -grids.ep(1, 10, 100 - yardline)
+    success_value = max(ep_success - ep_failure, 0.05)
+
+    yards_value = max(grids.ep(down, distance - 5, yardline - 5) - grids.ep(down, distance + 5, yardline + 5), 0.02)
+    total = success_value + yards_value
+    return success_value / total, yards_value / total
+
+
 def _context_weights(s: GameSituation) -> Dict[str, float]:
-    # Base: success drives decisions, yards provides a small tie-breaker
-    success_w, yards_w = 0.80, 0.20
+    if _situation_grids is not None:
+        success_w, yards_w = _grid_weights(s, _situation_grids)
+    else:
+        # Base: success drives decisions, yards provides a small tie-breaker
+        success_w, yards_w = 0.80, 0.20
 
-    # 3rd/4th: your success label = conversion, so lean hard into it
-    if s.down >= 3:
-        success_w, yards_w = 0.95, 0.05
+        # 3rd/4th: your success label = conversion, so lean hard into it
+        if s.down >= 3:
+            success_w, yards_w = 0.95, 0.05
 
-    # Red zone: efficiency / avoiding negatives matters more than raw yards
-    if s.yardline_100 <= 20:
-        success_w += 0.05
-        yards_w -= 0.05
+        # Red zone: efficiency / avoiding negatives matters more than raw yards
+        if s.yardline_100 <= 20:
+            success_w += 0.05
+            yards_w -= 0.05
 
     # Leading late (Q4 late or OT): reduce volatility
     if (((s.quarter == 4) and (s.time_remaining_seconds <= 480)) or (s.quarter == 5)) and s.score_difference > 0:
@@ -94,15 +136,25 @@ def score_candidate(situation: GameSituation, candidate: Dict[str, Any]) -> floa
     return score
 
 
+def _empty_recommendation() -> Dict[str, Any]:
+    return {
+        "recommendedPlay": None,
+        "successProbability": 0,
+        "expectedYards": 0,
+        "riskLevel": "medium",
+        "alternativePlays": [],
+    }
+
+
+def _concept_key(c: Dict[str, Any]) -> tuple:
+    if c.get("type") == "run":
+        return ("run", c.get("run_location"), c.get("run_gap"))
+    return ("pass", c.get("pass_location"), c.get("pass_depth_bucket"))
+
+
 def recommend_best_play(situation: GameSituation, candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
     if not candidates:
-        return {
-            "recommendedPlay": None,
-            "successProbability": 0,
-            "expectedYards": 0,
-            "riskLevel": "medium",
-            "alternativePlays": [],
-        }
+        return _empty_recommendation()
 
     scored = []
     for candidate in candidates:
@@ -113,11 +165,6 @@ def recommend_best_play(situation: GameSituation, candidates: List[Dict[str, Any
     scored.sort(key=lambda c: c["score"], reverse=True)
     best = scored[0]
 
-    def _concept_key(c: Dict[str, Any]) -> tuple:
-        if c.get("type") == "run":
-            return ("run", c.get("run_location"), c.get("run_gap"))
-        return ("pass", c.get("pass_location"), c.get("pass_depth_bucket"))
-
     concept_counts: Dict[tuple, int] = {}
     alternatives = []
     for c in scored[1:40]:
@@ -137,3 +184,138 @@ def recommend_best_play(situation: GameSituation, candidates: List[Dict[str, Any
         "riskLevel": risk_level,
         "alternativePlays": alternatives,
     }
+
+
+
+@dataclass
+class CandidateArrays:
+    # Column view of a fixed candidate set, built once so per-request policy work is array math.
+    # rows keep each candidate's dict layout; success_prob / expected_yards / score are filled in on output.
+    rows: List[Dict[str, Any]]
+    is_run: np.ndarray
+    is_short_pass: np.ndarray
+    is_medium_or_deep_pass: np.ndarray
+    concept_code: np.ndarray
+
+    @classmethod
+    def from_candidates(cls, candidates: List[Dict[str, Any]]) -> "CandidateArrays":
+        types = [c.get("type") for c in candidates]
+        depths = [c.get("pass_depth_bucket") for c in candidates]
+
+        concept_codes: Dict[tuple, int] = {}
+        for c in candidates:
+            concept_codes.setdefault(_concept_key(c), len(concept_codes))
+
+        return cls(
+            rows=[dict(c) for c in candidates],
+            is_run=np.array([t == "run" for t in types], dtype=bool),
+            is_short_pass=np.array([t == "pass" and d == "short" for t, d in zip(types, depths)], dtype=bool),
+            is_medium_or_deep_pass=np.array(
+                [t == "pass" and str(d).lower() in {"medium", "deep"} for t, d in zip(types, depths)],
+                dtype=bool,
+            ),
+            concept_code=np.array([concept_codes[_concept_key(c)] for c in candidates], dtype=np.int64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+def score_candidates(situation: GameSituation, candidates: CandidateArrays, success_probs: np.ndarray, expected_yards: np.ndarray) -> np.ndarray:
+    # Array form of score_candidate: same weights and hard constraints, applied to every candidate at once
+    weights = _context_weights(situation)
+    success_probs = np.asarray(success_probs, dtype=np.float64)
+    expected_yards = np.asarray(expected_yards, dtype=np.float64)
+    success_probs = np.where(success_probs > 1, success_probs / 100.0, success_probs)
+
+    scores = (weights["success_weight"] * success_probs) + (weights["yards_weight"] * (expected_yards / 10.0))
+
+    blocked = np.zeros(len(candidates), dtype=bool)
+    ##No deep or medium passes within the 5 yard line
+    if situation.yardline_100 <= 5 and situation.distance <= 5:
+        blocked |= candidates.is_medium_or_deep_pass
+
+    ###2 minute drill behavior
+    if situation.quarter in {2, 4, 5} and situation.time_remaining_seconds <= 120 and situation.score_difference < 0:
+        if situation.distance > 2:
+            blocked |= candidates.is_run
+        if situation.distance >= 10:
+            blocked |= candidates.is_short_pass
+
+    scores[blocked] = float("-inf")
+    return scores
+
+
+def _ranked_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # Indices of the k best scores, ordered like a stable descending sort (ties keep candidate order)
+    n = len(scores)
+    if k < n:
+        top = np.argpartition(-scores, k - 1)[:k]
+        kth = scores[top].min()
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)[: k - len(above)]
+        top = np.concatenate([above, tied])
+    else:
+        top = np.arange(n)
+    return top[np.lexsort((top, -scores[top]))]
+
+
+def rank_candidates(
+    situation: GameSituation, candidates: CandidateArrays, success_probs: np.ndarray, expected_yards: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Indices of the best play followed by its (up to 6) deduplicated alternatives, plus every candidate's score
+    scores = score_candidates(situation, candidates, success_probs, expected_yards)
+    ranked = _ranked_top_k(scores, 40)
+
+    concept_counts = np.zeros(int(candidates.concept_code.max()) + 1, dtype=np.int64)
+    picks = [ranked[0]]
+    for i in ranked[1:]:
+        code = candidates.concept_code[i]
+        if concept_counts[code] < 2:
+            concept_counts[code] += 1
+            picks.append(i)
+            if len(picks) == 7:
+                break
+
+    return np.array(picks, dtype=np.int64), scores
+
+
+def build_recommendation(
+    candidates: CandidateArrays,
+    picks: Sequence[int],
+    success_probs: Sequence[float],
+    expected_yards: Sequence[float],
+    scores: Sequence[float],
+) -> Dict[str, Any]:
+    # Response for ranked picks; the value sequences are aligned with picks (best first)
+    plays = [
+        {
+            **candidates.rows[int(i)],
+            "success_prob": float(p),
+            "expected_yards": float(y),
+            "score": float(sc),
+        }
+        for i, p, y, sc in zip(picks, success_probs, expected_yards, scores)
+    ]
+    best = plays[0]
+    risk_level = _estimate_risk_level(best)
+    success_prob = _normalize_probability(float(best.get("success_prob", 0)))
+
+    return {
+        "recommendedPlay": best,
+        "successProbability": success_prob * 100,
+        "expectedYards": float(best.get("expected_yards", 0)),
+        "riskLevel": risk_level,
+        "alternativePlays": plays[1:],
+    }
+
+
+def recommend_best_play_arrays(
+    situation: GameSituation, candidates: CandidateArrays, success_probs: np.ndarray, expected_yards: np.ndarray
+) -> Dict[str, Any]:
+    # Same result as recommend_best_play over the equivalent candidate dicts, without per-candidate Python work
+    if len(candidates) == 0:
+        return _empty_recommendation()
+
+    picks, scores = rank_candidates(situation, candidates, success_probs, expected_yards)
+    return build_recommendation(candidates, picks, success_probs[picks], expected_yards[picks], scores[picks])
@@ -2,16 +2,23 @@ from __future__ import annotations
 
 from dataclasses import asdict
 from pathlib import Path
-from typing import Any, Dict, List
-import pandas as pd
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
-import joblib
+from .candidates import CANDIDATE_GEOMETRY, SITUATION_COLUMNS
+from .inference import DualModelScorer, predict_candidates
+from .metrics import STAGE_SECONDS
+from .policy_layer import CandidateArrays, GameSituation, recommend_best_play_arrays
+from .result_cache import RecommendationCache
 
-from .policy_layer import GameSituation, recommend_best_play
+if TYPE_CHECKING:
+    from .recommendation_table import RecommendationTable
 
 ARTIFACTS_DIR = Path(__file__).resolve().parents[2] / "ml" / "artifacts"
 SUCCESS_MODEL_PATH = ARTIFACTS_DIR / "success_classifier_CatBoost_pipeline.pkl"
 YARDS_MODEL_PATH = ARTIFACTS_DIR / "yards_gained_pipeline.pkl"
+# CatBoost's native binary format: loads without unpickling (or importing joblib); preferred when present
+SUCCESS_MODEL_NATIVE_PATH = ARTIFACTS_DIR / "success_classifier_CatBoost.cbm"
+YARDS_MODEL_NATIVE_PATH = ARTIFACTS_DIR / "yards_gained.cbm"
 
 
 def _parse_time_remaining(time_remaining: str) -> int:
@@ -23,11 +30,48 @@ def _parse_time_remaining(time_remaining: str) -> int:
 
 
 def _load_models() -> tuple[Any, Any]:
+    if SUCCESS_MODEL_NATIVE_PATH.exists() and YARDS_MODEL_NATIVE_PATH.exists():
+        from catboost import CatBoostClassifier, CatBoostRegressor
+
+        success_model = CatBoostClassifier()
+        success_model.load_model(str(SUCCESS_MODEL_NATIVE_PATH), format="cbm")
+        yards_model = CatBoostRegressor()
+        yards_model.load_model(str(YARDS_MODEL_NATIVE_PATH), format="cbm")
+        return success_model, yards_model
+
+    import joblib
+
     success_model = joblib.load(SUCCESS_MODEL_PATH)
     yards_model = joblib.load(YARDS_MODEL_PATH)
     return success_model, yards_model
 
 
+def export_native_models() -> None:
+    # Re-save the pickled artifacts in .cbm format next to them
+    import joblib
+
+    joblib.load(SUCCESS_MODEL_PATH).save_model(str(SUCCESS_MODEL_NATIVE_PATH), format="cbm")
+    joblib.load(YARDS_MODEL_PATH).save_model(str(YARDS_MODEL_NATIVE_PATH), format="cbm")
+    print("Saved native models to:", SUCCESS_MODEL_NATIVE_PATH.resolve(), YARDS_MODEL_NATIVE_PATH.resolve())
+
+
+# Set by a pre-fork server (backend/app/serve.py) so forked workers share the parent's models:
+# (success model, yards model, registry metadata)
+_preloaded_models: Optional[Tuple[Any, Any, Dict[str, Any]]] = None
+
+
+def preload_models() -> Tuple[Any, Any, Dict[str, Any]]:
+    from .model_registry import load_active
+
+    global _preloaded_models
+    _preloaded_models = load_active()
+    return _preloaded_models
+
+
+def preloaded_models() -> Optional[Tuple[Any, Any, Dict[str, Any]]]:
+    return _preloaded_models
+
+
 def _base_features(situation: Dict[str, Any]) -> Dict[str, Any]:
     time_remaining_seconds = _parse_time_remaining(situation.get("timeRemaining", "0:00"))
 
@@ -45,86 +89,30 @@ def _base_features(situation: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def _generate_candidates(base: Dict[str, Any]) -> List[Dict[str, Any]]:
-    candidates: List[Dict[str, Any]] = []
-
-    run_locations = ["left", "middle", "right"]
-    run_gaps = ["guard", "tackle", "end"]
-    run_players = ["D.Swift", "K.Monangai"]
-    pass_locations = ["left", "middle", "right"]
-    pass_depths = ["short", "medium", "deep"]
-    shotgun = ["shotgun", "under_center"]
-    offense_personnel = ["11", "12", "13"]
-
-    for personnel in offense_personnel:
-        for formation in shotgun:
-            for location in run_locations:
-                # Middle runs have no gap in NFL PBP (null → "unknown"); left/right have guard/tackle/end
-                gaps = ["unknown"] if location == "middle" else run_gaps
-                for gap in gaps:
-                    for player in run_players:
-                        candidates.append(
-                            {
-                                **base,
-                                "play_type": "run",
-                                "run_location": location,
-                                "run_gap": gap,
-                                "run_player": player,
-                                "pass_location": "unknown",
-                                "pass_depth_bucket": "not_pass",
-                                "shotgun": formation,
-                                "offense_personnel": personnel,
-                            }
-                        )
-
-    for personnel in offense_personnel:
-        for formation in shotgun:
-            for location in pass_locations:
-                for depth in pass_depths:
-                    candidates.append(
-                        {
-                            **base,
-                            "play_type": "pass",
-                            "run_location": "unknown",
-                            "run_gap": "unknown",
-                            "run_player": "not_run",
-                            "pass_location": location,
-                            "pass_depth_bucket": depth,
-                            "shotgun": formation,
-                            "offense_personnel": personnel,
-                        }
-                    )
-
-    return candidates
-
-
-def recommend_play(situation: Dict[str, Any], success_model: Any, yards_model: Any) -> Dict[str, Any]:
-    base = _base_features(situation)
-    candidates = _generate_candidates(base)
-
-    # Batch scoring: build one DataFrame, reindex to trained feature order, score once each
-    df_all = pd.DataFrame(candidates).reindex(columns=success_model.feature_names_, fill_value="unknown")
-    success_probs = success_model.predict_proba(df_all)[:, 1]
-    expected_yards_arr = yards_model.predict(df_all)
-
-    scored_candidates: List[Dict[str, Any]] = []
-    for i, candidate in enumerate(candidates):
-        scored_candidates.append(
-            {
-                "type": candidate["play_type"],
-                "run_location": candidate.get("run_location"),
-                "run_gap": candidate.get("run_gap"),
-                "run_player": candidate.get("run_player"),
-                "pass_location": candidate.get("pass_location"),
-                "pass_depth_bucket": candidate.get("pass_depth_bucket"),
-                "shotgun": candidate.get("shotgun"),
-                "success_prob": float(success_probs[i]),
-                "expected_yards": float(expected_yards_arr[i]),
-                "offense_personnel": candidate.get("offense_personnel"),
-            }
-        )
+def _candidate_rows() -> List[Dict[str, Any]]:
+    # Response layout of each candidate; the policy layer fills in success_prob / expected_yards / score
+    return [
+        {
+            "type": candidate["play_type"],
+            "run_location": candidate.get("run_location"),
+            "run_gap": candidate.get("run_gap"),
+            "run_player": candidate.get("run_player"),
+            "pass_location": candidate.get("pass_location"),
+            "pass_depth_bucket": candidate.get("pass_depth_bucket"),
+            "shotgun": candidate.get("shotgun"),
+            "success_prob": 0.0,
+            "expected_yards": 0.0,
+            "offense_personnel": candidate.get("offense_personnel"),
+        }
+        for candidate in CANDIDATE_GEOMETRY
+    ]
+
+
+CANDIDATE_ARRAYS = CandidateArrays.from_candidates(_candidate_rows())
+
 
-    policy_situation = GameSituation(
+def _policy_situation(situation: Dict[str, Any], base: Dict[str, Any]) -> GameSituation:
+    return GameSituation(
         down=int(base["down"]),
         distance=float(base["ydstogo"]),
         yardline_100=float(base["yardline_100"]),
@@ -134,11 +122,172 @@ def recommend_play(situation: Dict[str, Any], success_model: Any, yards_model: A
     )
 
 
+def _cache_key(situation: Dict[str, Any], base: Dict[str, Any]) -> Tuple[Any, ...]:
+    # Model inputs plus the raw quarter / clock the policy layer reads
+    return (
+        *(base[column] for column in SITUATION_COLUMNS),
+        situation.get("quarter", 1),
+        _parse_time_remaining(situation.get("timeRemaining", "0:00")),
+    )
+
+
+def _score_situations(
+    situations: List[Dict[str, Any]],
+    bases: List[Dict[str, Any]],
+    success_model: Any,
+    yards_model: Any,
+    scorer: Optional[DualModelScorer] = None,
+) -> List[Dict[str, Any]]:
+    if scorer is not None:
+        success_probs, expected_yards_arr = scorer.score(bases)
+    else:
+        success_probs, expected_yards_arr = predict_candidates(bases, success_model, yards_model)
+
+    # Split the stacked predictions back out per situation, in request order
+    results: List[Dict[str, Any]] = []
+    n_candidates = len(CANDIDATE_GEOMETRY)
+    with STAGE_SECONDS.time("policy"):
+        for i, (situation, base) in enumerate(zip(situations, bases)):
+            rows = slice(i * n_candidates, (i + 1) * n_candidates)
+            results.append(
+                recommend_best_play_arrays(
+                    _policy_situation(situation, base), CANDIDATE_ARRAYS, success_probs[rows], expected_yards_arr[rows]
+                )
+            )
+
+    return results
 
-    return recommend_best_play(policy_situation, scored_candidates)
+
+def recommend_plays(
+    situations: List[Dict[str, Any]],
+    success_model: Any,
+    yards_model: Any,
+    cache: Optional[RecommendationCache] = None,
+    table: Optional["RecommendationTable"] = None,
+    scorer: Optional[DualModelScorer] = None,
+) -> List[Dict[str, Any]]:
+    if not situations:
+        return []
+
+    with STAGE_SECONDS.time("features"):
+        bases = [_base_features(situation) for situation in situations]
+    models = (success_model, yards_model)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(situations)
+
+    # Precomputed grid first, then the LRU cache; anything left is scored live
+    if table is not None:
+        for i, situation in enumerate(situations):
+            results[i] = table.lookup(situation)
+
+    pending: Dict[Tuple[Any, ...], List[int]] = {}
+    for i, (situation, base) in enumerate(zip(situations, bases)):
+        if results[i] is not None:
+            continue
+        key = _cache_key(situation, base)
+        if key in pending:
+            pending[key].append(i)
+            continue
+        cached = cache.get(key, models) if cache is not None else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending[key] = [i]
+
+    # Only distinct misses go to the models
+    if pending:
+        misses = [indices[0] for indices in pending.values()]
+        scored = _score_situations(
+            [situations[i] for i in misses], [bases[i] for i in misses], success_model, yards_model, scorer
+        )
+        for (key, indices), result in zip(pending.items(), scored):
+            if cache is not None:
+                cache.put(key, models, result)
+            for i in indices:
+                results[i] = result
+
+    return results  # type: ignore[return-value]
+
+
+def lookup_recommendation(
+    situation: Dict[str, Any],
+    success_model: Any,
+    yards_model: Any,
+    cache: Optional[RecommendationCache] = None,
+    table: Optional["RecommendationTable"] = None,
+) -> Optional[Dict[str, Any]]:
+    # Precomputed table / LRU cache only, never the models: cheap enough to call on the event loop
+    if table is not None:
+        result = table.lookup(situation)
+        if result is not None:
+            return result
+    if cache is not None:
+        return cache.peek(_cache_key(situation, _base_features(situation)), (success_model, yards_model))
+    return None
+
+
+# Situation fields a sweep can vary. timeRemaining is swept in seconds left in the quarter.
+SWEEP_AXES = (
+    "down",
+    "distance",
+    "fieldPosition",
+    "quarter",
+    "timeRemaining",
+    "scoreDifference",
+    "posteam_timeouts_remaining",
+    "defteam_timeouts_remaining",
+)
+
+
+def sweep_values(start: int, stop: int, step: int = 1) -> List[int]:
+    # Inclusive of stop when the step lands on it, in either direction
+    if step == 0:
+        raise ValueError("step must be non-zero")
+    return list(range(start, stop + (1 if step > 0 else -1), step))
+
+
+def sweep_situations(situation: Dict[str, Any], axis: str, values: List[int]) -> List[Dict[str, Any]]:
+    if axis not in SWEEP_AXES:
+        raise ValueError(f"can't sweep {axis!r}; choose one of {', '.join(SWEEP_AXES)}")
+    if axis == "timeRemaining":
+        return [{**situation, axis: f"{value // 60}:{value % 60:02d}"} for value in values]
+    return [{**situation, axis: value} for value in values]
+
+
+def recommend_sweep(
+    situation: Dict[str, Any],
+    axis: str,
+    values: List[int],
+    success_model: Any,
+    yards_model: Any,
+    cache: Optional[RecommendationCache] = None,
+    table: Optional["RecommendationTable"] = None,
+    scorer: Optional[DualModelScorer] = None,
+) -> List[Dict[str, Any]]:
+    # One situation per value along the axis; every point that misses the table / cache goes into the
+    # same stacked candidate matrix, so the whole curve costs one call per model
+    situations = sweep_situations(situation, axis, values)
+    results = recommend_plays(situations, success_model, yards_model, cache, table, scorer)
+    return [{"value": value, **result} for value, result in zip(values, results)]
+
+
+def recommend_play(
+    situation: Dict[str, Any],
+    success_model: Any,
+    yards_model: Any,
+    cache: Optional[RecommendationCache] = None,
+    table: Optional["RecommendationTable"] = None,
+    scorer: Optional[DualModelScorer] = None,
+) -> Dict[str, Any]:
+    return recommend_plays([situation], success_model, yards_model, cache, table, scorer)[0]
 
 
 if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["--export-native"]:
+        export_native_models()
+        sys.exit(0)
+
     sample = {
         "down": 1,
         "distance": 10,
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .inference import predict_candidates
+from .model_registry import load_active
+from .policy_layer import build_recommendation, policy_fingerprint, rank_candidates
+from .recommendation_service import (
+    ARTIFACTS_DIR,
+    CANDIDATE_ARRAYS,
+    CANDIDATE_GEOMETRY,
+    _base_features,
+    _parse_time_remaining,
+    _policy_situation,
+)
+
+TABLE_PATH = Path(os.getenv("RECOMMEND_TABLE_PATH", ARTIFACTS_DIR / "recommendation_table.npy"))
+
+# Best play + up to 6 alternatives
+TOP_K = 7
+
+RECORD_DTYPE = np.dtype(
+    [
+        ("count", "u1"),
+        ("rank", "u1", (TOP_K,)),
+        ("success_prob", "f8", (TOP_K,)),
+        ("expected_yards", "f8", (TOP_K,)),
+        ("score", "f8", (TOP_K,)),
+    ]
+)
+
+# Axis order is the table's mixed-radix layout; clock is seconds left in the quarter
+GRID_AXES = (
+    "down",
+    "distance",
+    "fieldPosition",
+    "quarter",
+    "clock_seconds",
+    "scoreDifference",
+    "posteam_timeouts_remaining",
+    "defteam_timeouts_remaining",
+    "posteam_type",
+)
+
+# The whole discretized situation space (~2e11 cells) -- far too big to build, kept as the reference for subsets
+FULL_GRID: Dict[str, List[Any]] = {
+    "down": list(range(1, 5)),
+    "distance": list(range(1, 31)),
+    "fieldPosition": list(range(1, 100)),
+    "quarter": list(range(1, 6)),
+    "clock_seconds": list(range(0, 901, 5)),
+    "scoreDifference": list(range(-30, 31)),
+    "posteam_timeouts_remaining": list(range(0, 4)),
+    "defteam_timeouts_remaining": list(range(0, 4)),
+    "posteam_type": ["home", "away"],
+}
+
+# Opening drives of each half: every down / distance (1-20) / yardline, tied, all timeouts -- 31,680 cells
+DEFAULT_GRID: Dict[str, List[Any]] = {
+    **FULL_GRID,
+    "distance": list(range(1, 21)),
+    "quarter": [1, 3],
+    "clock_seconds": [900],
+    "scoreDifference": [0],
+    "posteam_timeouts_remaining": [3],
+    "defteam_timeouts_remaining": [3],
+}
+
+
+def models_fingerprint(success_model: Any, yards_model: Any) -> str:
+    # Training GUID + tree count of each model. Stable across .pkl / .cbm loading, unlike the
+    # serialized bytes, which change on every load/save round trip. Non-default policy weights are
+    # part of it too: the table stores ranked picks.
+    digest = hashlib.sha256()
+    for model in (success_model, yards_model):
+        digest.update(f"{model.get_metadata()['model_guid']}:{model.tree_count_};".encode())
+    digest.update(policy_fingerprint().encode())
+    return digest.hexdigest()
+
+
+def _grid_values(situation: Dict[str, Any]) -> Tuple[Any, ...]:
+    # Same defaults as _base_features / _policy_situation, so a hit is exactly what live inference would use
+    return (
+        situation.get("down"),
+        situation.get("distance"),
+        situation.get("fieldPosition"),
+        situation.get("quarter", 1),
+        _parse_time_remaining(situation.get("timeRemaining", "0:00")),
+        situation.get("scoreDifference"),
+        situation.get("posteam_timeouts_remaining", 3),
+        situation.get("defteam_timeouts_remaining", 3),
+        situation.get("posteam_type", "home"),
+    )
+
+
+def _situation_at(values: Sequence[Any]) -> Dict[str, Any]:
+    down, distance, field_position, quarter, clock, score_diff, pos_to, def_to, posteam_type = values
+    return {
+        "down": int(down),
+        "distance": int(distance),
+        "fieldPosition": int(field_position),
+        "quarter": int(quarter),
+        "timeRemaining": f"{int(clock) // 60:02d}:{int(clock) % 60:02d}",
+        "scoreDifference": int(score_diff),
+        "posteam_type": str(posteam_type),
+        "posteam_timeouts_remaining": int(pos_to),
+        "defteam_timeouts_remaining": int(def_to),
+    }
+
+
+def _metadata_path(path: Path) -> Path:
+    return path.with_suffix(".json")
+
+
+class RecommendationTable:
+    # Read-only, memory-mapped view of a built table. Worker processes that open the same file
+    # share one page-cache copy of it.
+
+    def __init__(self, records: np.ndarray, axes: Dict[str, List[Any]], fingerprint: str):
+        self.records = records
+        self.axes = axes
+        self.fingerprint = fingerprint
+        self._positions = [{value: i for i, value in enumerate(axes[name])} for name in GRID_AXES]
+        self._shape = tuple(len(axes[name]) for name in GRID_AXES)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def open(cls, path: Path = TABLE_PATH) -> "RecommendationTable":
+        metadata = json.loads(_metadata_path(path).read_text())
+        records = np.load(path, mmap_mode="r")
+        if records.dtype != RECORD_DTYPE or metadata["n_candidates"] != len(CANDIDATE_GEOMETRY):
+            raise ValueError(f"{path} was built for a different record layout or candidate set")
+        return cls(records, metadata["axes"], metadata["fingerprint"])
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def index_of(self, situation: Dict[str, Any]) -> Optional[int]:
+        index = 0
+        for value, positions, size in zip(_grid_values(situation), self._positions, self._shape):
+            position = positions.get(value)
+            if position is None:
+                return None
+            index = index * size + position
+        return index
+
+    def lookup(self, situation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        index = self.index_of(situation)
+        if index is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        record = self.records[index]
+        count = int(record["count"])
+        return build_recommendation(
+            CANDIDATE_ARRAYS,
+            record["rank"][:count],
+            record["success_prob"][:count],
+            record["expected_yards"][:count],
+            record["score"][:count],
+        )
+
+
+def load_table(success_model: Any, yards_model: Any, path: Path = TABLE_PATH) -> Optional[RecommendationTable]:
+    # The table is only served if it was built from exactly these models; otherwise everything is live
+    if not path.exists():
+        return None
+    try:
+        table = RecommendationTable.open(path)
+    except (OSError, ValueError, KeyError) as exc:
+        # Missing sidecar, or a table from another record layout / candidate set: served live, like stale models
+        print(f"Ignoring {path}: {exc}, rebuild it")
+        return None
+    if table.fingerprint != models_fingerprint(success_model, yards_model):
+        print(f"Ignoring {path}: built from different models, rebuild it")
+        return None
+    print(f"Serving {len(table)} precomputed situations from {path}")
+    return table
+
+
+def build_table(
+    success_model: Any,
+    yards_model: Any,
+    axes: Dict[str, List[Any]],
+    path: Path = TABLE_PATH,
+    chunk_size: int = 2000,
+) -> None:
+    shape = tuple(len(axes[name]) for name in GRID_AXES)
+    n_cells = int(np.prod(shape))
+    records = np.lib.format.open_memmap(path, mode="w+", dtype=RECORD_DTYPE, shape=(n_cells,))
+    n_candidates = len(CANDIDATE_GEOMETRY)
+
+    started = time.perf_counter()
+    for start in range(0, n_cells, chunk_size):
+        stop = min(start + chunk_size, n_cells)
+        positions = np.unravel_index(np.arange(start, stop), shape)
+        situations = [
+            _situation_at([axes[name][int(positions[a][j])] for a, name in enumerate(GRID_AXES)])
+            for j in range(stop - start)
+        ]
+        bases = [_base_features(situation) for situation in situations]
+        success_probs, expected_yards = predict_candidates(bases, success_model, yards_model)
+
+        chunk = records[start:stop]
+        for j, (situation, base) in enumerate(zip(situations, bases)):
+            rows = slice(j * n_candidates, (j + 1) * n_candidates)
+            sp, ey = success_probs[rows], expected_yards[rows]
+            picks, scores = rank_candidates(_policy_situation(situation, base), CANDIDATE_ARRAYS, sp, ey)
+            count = len(picks)
+            chunk["count"][j] = count
+            chunk["rank"][j, :count] = picks
+            chunk["success_prob"][j, :count] = sp[picks]
+            chunk["expected_yards"][j, :count] = ey[picks]
+            chunk["score"][j, :count] = scores[picks]
+
+        print(f"  {stop}/{n_cells} situations ({time.perf_counter() - started:.1f}s)")
+
+    records.flush()
+    del records
+
+    _metadata_path(path).write_text(
+        json.dumps(
+            {
+                "axes": axes,
+                "axis_order": list(GRID_AXES),
+                "n_candidates": n_candidates,
+                "fingerprint": models_fingerprint(success_model, yards_model),
+            }
+        )
+    )
+
+
+def _parse_axis(spec: str) -> Tuple[str, List[Any]]:
+    # "distance=1:20" (inclusive range), "clock_seconds=0:900:5" (with step) or "posteam_type=home,away"
+    name, _, values = spec.partition("=")
+    if name not in GRID_AXES:
+        raise argparse.ArgumentTypeError(f"unknown axis {name!r}, expected one of {', '.join(GRID_AXES)}")
+    if name == "posteam_type":
+        return name, values.split(",")
+    if ":" in values:
+        bounds = [int(v) for v in values.split(":")]
+        step = bounds[2] if len(bounds) == 3 else 1
+        return name, list(range(bounds[0], bounds[1] + 1, step))
+    return name, [int(v) for v in values.split(",")]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Precompute recommendations over a discretized situation grid")
+    parser.add_argument("--grid", choices=["default", "full"], default="default")
+    parser.add_argument("--axis", action="append", type=_parse_axis, default=[], help="override one axis, e.g. distance=1:20")
+    parser.add_argument("--out", type=Path, default=TABLE_PATH)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    axes = dict(FULL_GRID if args.grid == "full" else DEFAULT_GRID)
+    axes.update(dict(args.axis))
+    n_cells = int(np.prod([len(axes[name]) for name in GRID_AXES]))
+    print(f"Building {n_cells} situations ({n_cells * RECORD_DTYPE.itemsize / 2**20:.1f} MiB) -> {args.out}")
+
+    # Built for the models the API serves: the active registry version, else the loose artifacts
+    success_model, yards_model, _ = load_active()
+    build_table(success_model, yards_model, axes, args.out, args.chunk_size)
+    print("Saved table to:", args.out.resolve())
+
+
+if __name__ == "__main__":
+    main()
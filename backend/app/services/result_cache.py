@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class RecommendationCache:
+    # Bounded LRU of finished recommendations, keyed on the normalized situation tuple.
+    # Entries belong to one model pair: seeing a different pair drops everything cached for the old one.
+    # Cached results are shared between callers and must be treated as read-only.
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = max(0, int(maxsize))
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._models: Optional[Tuple[Any, Any]] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_models(self, models: Tuple[Any, Any]) -> None:
+        # Identity check: a reload in lifespan (or a hot swap) produces new model objects
+        if self._models is None or any(a is not b for a, b in zip(self._models, models)):
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._models = models
+
+    def get(self, key: Hashable, models: Tuple[Any, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._check_models(models)
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def peek(self, key: Hashable, models: Tuple[Any, Any]) -> Optional[Dict[str, Any]]:
+        # Like get, but a miss isn't counted -- for fast-path probes whose misses are looked up again later
+        with self._lock:
+            self._check_models(models)
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return result
+
+    def put(self, key: Hashable, models: Tuple[Any, Any], result: Dict[str, Any]) -> None:
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._check_models(models)
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
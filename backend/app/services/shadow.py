@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter as PlayCounter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .compact import PLAY_KEYS, play_code
+from .inference import DualModelScorer
+from .metrics import SHADOW_EVENTS
+from .policy_layer import recommend_best_play_arrays
+from .recommendation_service import CANDIDATE_ARRAYS, _base_features, _parse_time_remaining, _policy_situation
+
+# Shadow scoring: every served situation (or a SHADOW_SAMPLE_RATE fraction) is scored again by a
+# candidate pair (registry/SHADOW, see model_registry.py) on a background thread, after the live
+# response has been produced, and the two recommendations are appended to SHADOW_DIR as fixed-size
+# binary records. Work beyond SHADOW_MAX_PENDING queued situations is dropped rather than delayed.
+#
+#   python -m backend.app.services.shadow report [--dir /tmp/playcalling-shadow]
+SHADOW_DIR = Path(os.getenv("SHADOW_DIR", "/tmp/playcalling-shadow"))
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "1"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "256"))
+# CatBoost threads for shadow predicts, so the comparison doesn't compete with live requests for every core
+SHADOW_THREADS = int(os.getenv("SHADOW_THREADS", "1"))
+
+# Plays are stored as their code: the position in CANDIDATE_ARRAYS (see compact.py).
+# 47 bytes per situation. *_on_live: the shadow pair's predictions for the play the live pair picked.
+RECORD_DTYPE = np.dtype(
+    [
+        ("time", "<f8"),
+        ("down", "i1"),
+        ("quarter", "i1"),
+        ("home", "i1"),
+        ("distance", "<i2"),
+        ("yardline_100", "<i2"),
+        ("seconds_remaining", "<i2"),
+        ("score_differential", "<i2"),
+        ("live_play", "<i2"),
+        ("shadow_play", "<i2"),
+        ("live_success", "<f4"),
+        ("live_yards", "<f4"),
+        ("shadow_success", "<f4"),
+        ("shadow_yards", "<f4"),
+        ("shadow_success_on_live", "<f4"),
+        ("shadow_yards_on_live", "<f4"),
+    ]
+)
+
+
+def _describe(play: List[str]) -> str:
+    # Candidate key from a log header -> "run left tackle D.Swift" / "pass right deep"
+    fields = dict(zip(PLAY_KEYS, play))
+    if fields["type"] == "run":
+        return f"run {fields['run_location']} {fields['run_gap']} {fields['run_player']}"
+    return f"pass {fields['pass_location']} {fields['pass_depth_bucket']}"
+
+
+def shadow_score(
+    situations: List[Dict[str, Any]], scorer: DualModelScorer
+) -> Tuple[List[Dict[str, Any]], np.ndarray, np.ndarray]:
+    # The candidate pair's recommendations, plus its raw predictions for every candidate of every situation
+    bases = [_base_features(situation) for situation in situations]
+    success_probs, expected_yards = scorer.score(bases)
+    n = len(CANDIDATE_ARRAYS)
+    results = [
+        recommend_best_play_arrays(
+            _policy_situation(situation, base),
+            CANDIDATE_ARRAYS,
+            success_probs[i * n : (i + 1) * n],
+            expected_yards[i * n : (i + 1) * n],
+        )
+        for i, (situation, base) in enumerate(zip(situations, bases))
+    ]
+    return results, success_probs.reshape(len(situations), n), expected_yards.reshape(len(situations), n)
+
+
+def compare(
+    situations: List[Dict[str, Any]],
+    live: List[Dict[str, Any]],
+    shadow: List[Dict[str, Any]],
+    shadow_success: np.ndarray,
+    shadow_yards: np.ndarray,
+) -> np.ndarray:
+    records = np.zeros(len(situations), dtype=RECORD_DTYPE)
+    records["time"] = time.time()
+    for i, (record, situation, live_result, shadow_result) in enumerate(zip(records, situations, live, shadow)):
+        live_best, shadow_best = live_result["recommendedPlay"], shadow_result["recommendedPlay"]
+        record["down"] = situation.get("down", 0)
+        record["quarter"] = situation.get("quarter", 1)
+        record["home"] = situation.get("posteam_type", "home") == "home"
+        record["distance"] = situation.get("distance", 0)
+        record["yardline_100"] = situation.get("fieldPosition", 0)
+        record["seconds_remaining"] = _parse_time_remaining(situation.get("timeRemaining", "0:00"))
+        record["score_differential"] = situation.get("scoreDifference", 0)
+        record["live_play"] = play_code(live_best)
+        record["shadow_play"] = play_code(shadow_best)
+        record["live_success"] = live_best.get("success_prob", np.nan)
+        record["live_yards"] = live_best.get("expected_yards", np.nan)
+        record["shadow_success"] = shadow_best.get("success_prob", np.nan)
+        record["shadow_yards"] = shadow_best.get("expected_yards", np.nan)
+        live_play = record["live_play"]
+        record["shadow_success_on_live"] = shadow_success[i, live_play] if live_play >= 0 else np.nan
+        record["shadow_yards_on_live"] = shadow_yards[i, live_play] if live_play >= 0 else np.nan
+    return records
+
+
+class ShadowScorer:
+    # Holds the candidate pair and the single background thread that scores it. submit() only samples
+    # and enqueues, so it is safe to call on the event loop after a response is ready.
+
+    def __init__(self, version: str, success_model: Any, yards_model: Any, log_dir: Path = SHADOW_DIR):
+        self.version = version
+        self.success_model = success_model
+        self.yards_model = yards_model
+        self.scorer = DualModelScorer(success_model, yards_model, concurrent=False, thread_count=SHADOW_THREADS)
+        self.log_dir = log_dir
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._files: Dict[Optional[str], Any] = {}
+
+    def submit(self, situations: List[Dict[str, Any]], live: List[Dict[str, Any]], live_version: Optional[str]) -> None:
+        if SHADOW_SAMPLE_RATE < 1:
+            sampled = [i for i in range(len(situations)) if random.random() < SHADOW_SAMPLE_RATE]
+            situations, live = [situations[i] for i in sampled], [live[i] for i in sampled]
+        if not situations:
+            return
+        with self._lock:
+            if self._pending + len(situations) > SHADOW_MAX_PENDING:
+                SHADOW_EVENTS.inc("dropped", len(situations))
+                return
+            self._pending += len(situations)
+        self._executor.submit(self._run, situations, live, live_version)
+
+    def _run(self, situations: List[Dict[str, Any]], live: List[Dict[str, Any]], live_version: Optional[str]) -> None:
+        try:
+            shadow, success_probs, expected_yards = shadow_score(situations, self.scorer)
+            self._log(live_version).write(compare(situations, live, shadow, success_probs, expected_yards).tobytes())
+            SHADOW_EVENTS.inc("compared", len(situations))
+        except Exception as exc:
+            SHADOW_EVENTS.inc("errors", len(situations))
+            print(f"shadow scoring failed: {exc!r}", flush=True)
+        finally:
+            with self._lock:
+                self._pending -= len(situations)
+
+    def _log(self, live_version: Optional[str]) -> Any:
+        # One file per (live, shadow) pair and process, so concurrent workers never interleave records
+        f = self._files.get(live_version)
+        if f is None:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            stem = f"{live_version or 'unversioned'}--{self.version}--{os.getpid()}"
+            header = {
+                "live": live_version,
+                "shadow": self.version,
+                "pid": os.getpid(),
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "dtype": RECORD_DTYPE.descr,
+                "plays": [[row[key] for key in PLAY_KEYS] for row in CANDIDATE_ARRAYS.rows],
+            }
+            (self.log_dir / f"{stem}.json").write_text(json.dumps(header))
+            # Unbuffered appends: each batch of records reaches the file in one write
+            f = self._files[live_version] = open(self.log_dir / f"{stem}.bin", "ab", buffering=0)
+        return f
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.scorer.close()
+        for f in self._files.values():
+            f.close()
+
+
+def load_records(log_dir: Path = SHADOW_DIR) -> Dict[Tuple[Optional[str], str], Tuple[np.ndarray, List[List[str]]]]:
+    # (live, shadow) -> all records for that pair across processes, and the candidate list they index
+    grouped: Dict[Tuple[Optional[str], str], List[np.ndarray]] = {}
+    plays: Dict[Tuple[Optional[str], str], List[List[str]]] = {}
+    for header_path in sorted(log_dir.glob("*.json")):
+        header = json.loads(header_path.read_text())
+        data = header_path.with_suffix(".bin")
+        if not data.exists():
+            continue
+        dtype = np.dtype([tuple(field) for field in header["dtype"]])
+        # A record cut short by a crash mid-write is ignored
+        raw = data.read_bytes()
+        records = np.frombuffer(raw[: len(raw) - len(raw) % dtype.itemsize], dtype=dtype)
+        key = (header["live"], header["shadow"])
+        grouped.setdefault(key, []).append(records)
+        plays[key] = header["plays"]
+    return {key: (np.concatenate(parts), plays[key]) for key, parts in grouped.items()}
+
+
+def summarize(records: np.ndarray, plays: List[List[str]]) -> Dict[str, Any]:
+    n = len(records)
+    if n == 0:
+        return {"situations": 0}
+    same_play = records["live_play"] == records["shadow_play"]
+    play_types = np.array([play[0] for play in plays] + [""])
+    live_type, shadow_type = play_types[records["live_play"]], play_types[records["shadow_play"]]
+    on_live = ~np.isnan(records["shadow_success_on_live"])
+    success_diff = records["shadow_success_on_live"][on_live] - records["live_success"][on_live]
+    yards_diff = records["shadow_yards_on_live"][on_live] - records["live_yards"][on_live]
+    by_down = {
+        int(down): round(float(same_play[records["down"] == down].mean()), 4) for down in np.unique(records["down"])
+    }
+    switches = PlayCounter(
+        (_describe(plays[a]), _describe(plays[b]))
+        for a, b in zip(records["live_play"][~same_play], records["shadow_play"][~same_play])
+    )
+    return {
+        "situations": n,
+        "first": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(records["time"].min())),
+        "last": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(records["time"].max())),
+        "same_top_play": round(float(same_play.mean()), 4),
+        "same_play_type": round(float((live_type == shadow_type).mean()), 4),
+        "same_top_play_by_down": by_down,
+        "top_success_prob": {
+            "live_mean": round(float(records["live_success"].mean()), 4),
+            "shadow_mean": round(float(records["shadow_success"].mean()), 4),
+        },
+        "top_expected_yards": {
+            "live_mean": round(float(records["live_yards"].mean()), 3),
+            "shadow_mean": round(float(records["shadow_yards"].mean()), 3),
+        },
+        # Same play, both pairs: how far the shadow pair's estimates move
+        "live_play_rescored": {
+            "situations": int(on_live.sum()),
+            "success_prob_diff_mean": round(float(success_diff.mean()), 4) if len(success_diff) else None,
+            "success_prob_absdiff_p95": round(float(np.percentile(np.abs(success_diff), 95)), 4) if len(success_diff) else None,
+            "expected_yards_diff_mean": round(float(yards_diff.mean()), 3) if len(yards_diff) else None,
+            "expected_yards_absdiff_p95": round(float(np.percentile(np.abs(yards_diff), 95)), 3) if len(yards_diff) else None,
+        },
+        "top_switches": [f"{a} -> {b}: {count}" for (a, b), count in switches.most_common(5)],
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Summarize shadow-scoring logs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser("report")
+    report.add_argument("--dir", type=Path, default=SHADOW_DIR)
+    report.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    groups = load_records(args.dir)
+    if not groups:
+        print(f"No shadow records in {args.dir}")
+        return
+    reports = {f"{live or 'unversioned'} vs {shadow}": summarize(*data) for (live, shadow), data in groups.items()}
+    if args.json:
+        print(json.dumps(reports, indent=1))
+        return
+    for name, summary in reports.items():
+        print(f"== {name}")
+        for key, value in summary.items():
+            if isinstance(value, list):
+                print(f"  {key}:")
+                for line in value:
+                    print(f"    {line}")
+            else:
+                print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from .inference import DualModelScorer
+from .policy_layer import GameSituation, score_candidates
+from .recommendation_service import ARTIFACTS_DIR, CANDIDATE_ARRAYS, _base_features, _parse_time_remaining
+
+# Monte Carlo drive simulation. Every trajectory follows the policy layer's recommended play; the
+# play's outcome is sampled from the two model outputs (success probability, median yards) plus an
+# empirical yards-around-the-median distribution, and down / distance / yardline / clock are rolled
+# forward until the drive ends. Each step scores the distinct states of all live trajectories in one
+# batched model call.
+#
+#   python -m backend.app.services.simulation --down 1 --distance 10 --yardline 75 --rollouts 10000
+
+# Historical plays the outcome distribution is fitted on (yards residuals, turnover rates): the training
+# slice (TRAIN_SEASONS / TRAIN_TEAMS) of the feature store
+OUTCOME_PLAYS_PATH = Path(os.getenv("SIMULATION_PLAYS_PATH", ARTIFACTS_DIR / "feature_store"))
+
+# Average seconds a play takes off the clock, including the time until the next snap
+PLAY_SECONDS = {"run": 38, "pass": 30}
+# Same fractions of ydstogo as the success label in build_features.py (1st: 40%, 2nd: 60%, 3rd/4th: 100%)
+SUCCESS_FRACTION = np.array([0.0, 0.4, 0.6, 1.0, 1.0])
+# Field goals: attempted on 4th down from the opponent's 37 or closer (kick distance = yardline_100 + 17)
+FIELD_GOAL_RANGE = 37
+MAX_PLAYS = 40
+
+END_REASONS = (
+    "live",
+    "touchdown",
+    "field_goal",
+    "missed_field_goal",
+    "punt",
+    "turnover_on_downs",
+    "turnover",
+    "safety",
+    "end_of_half",
+    "max_plays",
+)
+_END = {name: code for code, name in enumerate(END_REASONS)}
+POINTS = np.zeros(len(END_REASONS))
+POINTS[_END["touchdown"]] = 7
+POINTS[_END["field_goal"]] = 3
+POINTS[_END["safety"]] = -2
+
+
+@dataclass(frozen=True)
+class OutcomeModel:
+    # Sorted residuals (yards gained - predicted median) per play type, and per-play turnover rates
+    run_residuals: np.ndarray
+    pass_residuals: np.ndarray
+    run_turnover_rate: float
+    pass_turnover_rate: float
+
+
+# Keyed like recommendation_table.models_fingerprint: training GUID + tree count
+_outcome_models: Dict[tuple, OutcomeModel] = {}
+
+
+def outcome_model(yards_model: Any, path: Path = OUTCOME_PLAYS_PATH) -> OutcomeModel:
+    key = (yards_model.get_metadata()["model_guid"], yards_model.tree_count_, str(path))
+    if key not in _outcome_models:
+        _outcome_models[key] = _fit_outcome_model(yards_model, path)
+    return _outcome_models[key]
+
+
+def _fit_outcome_model(yards_model: Any, path: Path) -> OutcomeModel:
+    import pandas as pd
+
+    from backend.ml.training.data import load_store_columns
+
+    columns = list(yards_model.feature_names_)
+    plays = load_store_columns(dict.fromkeys(columns + ["yards_gained", "interception", "fumble_lost"]), store=path)
+    plays = plays.dropna(subset=["yards_gained", "down"])
+    for column in columns:
+        if not pd.api.types.is_numeric_dtype(plays[column]):
+            plays[column] = plays[column].fillna("unknown")
+
+    residuals = plays["yards_gained"].to_numpy(dtype=np.float64) - yards_model.predict(plays[columns])
+    is_pass = (plays["play_type"] == "pass").to_numpy()
+    turnovers = (plays["interception"].fillna(0) + plays["fumble_lost"].fillna(0)).clip(upper=1).to_numpy()
+    return OutcomeModel(
+        run_residuals=np.sort(residuals[~is_pass]),
+        pass_residuals=np.sort(residuals[is_pass]),
+        run_turnover_rate=float(turnovers[~is_pass].mean()),
+        pass_turnover_rate=float(turnovers[is_pass].mean()),
+    )
+
+
+def field_goal_probability(yardline_100: np.ndarray) -> np.ndarray:
+    # Logistic in kick distance: ~99% from 20 yards, ~90% from 40, ~75% from 50
+    kick = yardline_100 + 17.0
+    return 1.0 / (1.0 + np.exp(-(6.5 - 0.105 * kick)))
+
+
+def _sample_yards(
+    rng: np.random.Generator, residuals: np.ndarray, median: np.ndarray, threshold: np.ndarray, success: np.ndarray
+) -> np.ndarray:
+    # Yards = median + a residual, drawn from the part of the residual distribution consistent with the
+    # sampled success label (at least `threshold` yards on success, fewer on failure)
+    needed = np.ceil(threshold - 1e-9)
+    if len(residuals) == 0:
+        return np.where(success, np.maximum(np.rint(median), needed), np.minimum(np.rint(median), needed - 1))
+    k = np.searchsorted(residuals, needed - median)
+    n = len(residuals)
+    u = rng.random(len(median))
+    index = np.where(success, k + np.floor(u * (n - k)), np.floor(u * k)).astype(np.int64)
+    yards = np.rint(median + residuals[np.clip(index, 0, n - 1)])
+    return np.where(success, np.maximum(yards, needed), np.minimum(yards, needed - 1))
+
+
+def _choose_plays(
+    states: np.ndarray, start: Dict[str, Any], scorer: DualModelScorer
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # states: one row (down, distance, yardline_100, quarter, seconds left in quarter) per distinct state.
+    # One model call for all of them, then the policy layer's pick for each.
+    situations = [
+        {
+            **start,
+            "down": int(down),
+            "distance": int(distance),
+            "fieldPosition": int(yardline),
+            "quarter": int(quarter),
+            "timeRemaining": f"{int(seconds) // 60}:{int(seconds) % 60:02d}",
+        }
+        for down, distance, yardline, quarter, seconds in states
+    ]
+    success_probs, expected_yards = scorer.score([_base_features(situation) for situation in situations])
+    n = len(CANDIDATE_ARRAYS)
+    success_probs = success_probs.reshape(len(states), n)
+    expected_yards = expected_yards.reshape(len(states), n)
+
+    picks = np.empty(len(states), dtype=np.int64)
+    for i, (down, distance, yardline, quarter, seconds) in enumerate(states):
+        situation = GameSituation(
+            down=int(down),
+            distance=float(distance),
+            yardline_100=float(yardline),
+            quarter=int(quarter),
+            time_remaining_seconds=int(seconds),
+            score_difference=int(start.get("scoreDifference", 0)),
+        )
+        # argmax keeps the first of tied scores, same as the ranking's stable sort
+        picks[i] = np.argmax(score_candidates(situation, CANDIDATE_ARRAYS, success_probs[i], expected_yards[i]))
+    rows = np.arange(len(states))
+    return picks, success_probs[rows, picks], expected_yards[rows, picks]
+
+
+def simulate_drives(
+    situation: Dict[str, Any],
+    success_model: Any,
+    yards_model: Any,
+    rollouts: int = 10000,
+    seed: int = 0,
+    fourth_down: str = "kick",
+    max_plays: int = MAX_PLAYS,
+    scorer: Optional[DualModelScorer] = None,
+    outcomes: Optional[OutcomeModel] = None,
+) -> Dict[str, Any]:
+    # situation uses the /recommend fields. fourth_down: "kick" (field goal in range, else punt) or "go".
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    outcomes = outcomes or outcome_model(yards_model)
+    own_scorer = scorer is None
+    scorer = scorer or DualModelScorer(success_model, yards_model, concurrent=False)
+
+    down = np.full(rollouts, int(situation["down"]), dtype=np.int64)
+    distance = np.full(rollouts, int(situation["distance"]), dtype=np.int64)
+    yardline = np.full(rollouts, int(situation["fieldPosition"]), dtype=np.int64)
+    quarter = np.full(rollouts, int(situation.get("quarter", 1)), dtype=np.int64)
+    seconds = np.full(rollouts, _parse_time_remaining(situation.get("timeRemaining", "15:00")), dtype=np.int64)
+    end = np.zeros(rollouts, dtype=np.int8)
+    plays = np.zeros(rollouts, dtype=np.int64)
+    first_down = np.zeros(rollouts, dtype=bool)
+    start = {key: value for key, value in situation.items() if key not in ("down", "distance", "fieldPosition", "quarter", "timeRemaining")}
+
+    model_calls = 0
+    scored_states = 0
+    for _ in range(max_plays):
+        live = np.flatnonzero(end == 0)
+        if len(live) == 0:
+            break
+
+        if fourth_down == "kick":
+            kicking = live[down[live] == 4]
+            in_range = kicking[yardline[kicking] <= FIELD_GOAL_RANGE]
+            made = rng.random(len(in_range)) < field_goal_probability(yardline[in_range])
+            end[in_range] = np.where(made, _END["field_goal"], _END["missed_field_goal"])
+            end[kicking[yardline[kicking] > FIELD_GOAL_RANGE]] = _END["punt"]
+            live = np.flatnonzero(end == 0)
+            if len(live) == 0:
+                break
+
+        # Trajectories in the same state get the same recommendation: score each distinct state once
+        states, inverse = np.unique(
+            np.stack([down[live], distance[live], yardline[live], quarter[live], seconds[live]], axis=1),
+            axis=0,
+            return_inverse=True,
+        )
+        inverse = inverse.reshape(-1)
+        picks, success_prob, median_yards = _choose_plays(states, start, scorer)
+        model_calls += 1
+        scored_states += len(states)
+        play = picks[inverse]
+        p_success = success_prob[inverse]
+        median = median_yards[inverse]
+        is_run = CANDIDATE_ARRAYS.is_run[play]
+
+        turnover = rng.random(len(live)) < np.where(is_run, outcomes.run_turnover_rate, outcomes.pass_turnover_rate)
+        success = rng.random(len(live)) < p_success
+        threshold = SUCCESS_FRACTION[down[live]] * distance[live]
+        yards = np.empty(len(live))
+        yards[is_run] = _sample_yards(rng, outcomes.run_residuals, median[is_run], threshold[is_run], success[is_run])
+        yards[~is_run] = _sample_yards(rng, outcomes.pass_residuals, median[~is_run], threshold[~is_run], success[~is_run])
+        yards = yards.astype(np.int64)
+
+        new_yardline = yardline[live] - yards
+        converted = yards >= distance[live]
+        touchdown = new_yardline <= 0
+        safety = new_yardline >= 100
+
+        plays[live] += 1
+        first_down[live[(converted | touchdown) & ~turnover]] = True
+        yardline[live] = np.clip(new_yardline, 0, 100)
+        distance[live] = np.where(converted, np.minimum(10, yardline[live]), distance[live] - yards)
+        down[live] = np.where(converted, 1, down[live] + 1)
+
+        seconds[live] -= np.where(is_run, PLAY_SECONDS["run"], PLAY_SECONDS["pass"])
+        expired = live[seconds[live] <= 0]
+        next_quarter = expired[np.isin(quarter[expired], (1, 3))]
+        quarter[next_quarter] += 1
+        seconds[next_quarter] += 900
+
+        # Precedence when several apply on one play: turnover, then score, then downs / clock
+        reason = np.zeros(len(live), dtype=np.int8)
+        reason[np.isin(live, expired) & ~np.isin(live, next_quarter)] = _END["end_of_half"]
+        reason[(down[live] > 4)] = _END["turnover_on_downs"]
+        reason[safety] = _END["safety"]
+        reason[touchdown] = _END["touchdown"]
+        reason[turnover] = _END["turnover"]
+        end[live] = reason
+
+    end[end == 0] = _END["max_plays"]
+    if own_scorer:
+        scorer.close()
+
+    counts = np.bincount(end, minlength=len(END_REASONS)) / rollouts
+    return {
+        "rollouts": rollouts,
+        "p_first_down": float(first_down.mean()),
+        "p_touchdown": float(counts[_END["touchdown"]]),
+        "p_field_goal": float(counts[_END["field_goal"]]),
+        "expected_points": float(POINTS[end].mean()),
+        "mean_plays": float(plays.mean()),
+        "outcomes": {name: float(counts[code]) for code, name in enumerate(END_REASONS) if code},
+        "model_calls": model_calls,
+        "scored_states": scored_states,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from .model_registry import load_active
+
+    parser = argparse.ArgumentParser(description="Monte Carlo drive simulation from one game state")
+    parser.add_argument("--down", type=int, default=1)
+    parser.add_argument("--distance", type=int, default=10)
+    parser.add_argument("--yardline", type=int, default=75, help="yards to the opponent's end zone (yardline_100)")
+    parser.add_argument("--quarter", type=int, default=1)
+    parser.add_argument("--time", default="15:00", help="time left in the quarter, MM:SS")
+    parser.add_argument("--score", type=int, default=0, help="score difference for the offense")
+    parser.add_argument("--posteam-type", choices=["home", "away"], default="home")
+    parser.add_argument("--rollouts", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fourth-down", choices=["kick", "go"], default="kick")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    success_model, yards_model, _ = load_active()
+    situation = {
+        "down": args.down,
+        "distance": args.distance,
+        "fieldPosition": args.yardline,
+        "quarter": args.quarter,
+        "timeRemaining": args.time,
+        "scoreDifference": args.score,
+        "posteam_type": args.posteam_type,
+    }
+    result = simulate_drives(situation, success_model, yards_model, args.rollouts, args.seed, args.fourth_down)
+    if args.json:
+        print(json.dumps(result, indent=1))
+        return
+    print(
+        f"{args.rollouts} drives from {args.down}&{args.distance} at the opponent's {args.yardline} "
+        f"({result['model_calls']} model calls over {result['scored_states']} distinct states, {result['seconds']:.2f}s)"
+    )
+    for key in ("p_first_down", "p_touchdown", "p_field_goal", "expected_points", "mean_plays"):
+        print(f"  {key:>16}: {result[key]:.3f}")
+    for name, share in result["outcomes"].items():
+        print(f"  {name:>16}: {share:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# Dense lookup grids of expected drive points and series conversion probability by
+# (down, distance, yardline_100), built offline by backend/ml/features/build_situation_grids.py.
+# Arrays are indexed by the raw values (down 1-4, distance 1-30 with 30 meaning 30+, yardline 1-99);
+# index 0 of each axis mirrors index 1, so a lookup is a clamp and one array read.
+ARTIFACTS_DIR = Path(__file__).resolve().parents[2] / "ml" / "artifacts"
+GRIDS_PATH = Path(os.getenv("SITUATION_GRIDS_PATH", ARTIFACTS_DIR / "situation_grids.npy"))
+
+MAX_DOWN = 4
+MAX_DISTANCE = 30
+MAX_YARDLINE = 99
+# Channels of the stored (3, 5, 31, 100) float32 array
+CHANNELS = ("ep", "conversion", "plays")
+SHAPE = (len(CHANNELS), MAX_DOWN + 1, MAX_DISTANCE + 1, MAX_YARDLINE + 1)
+
+
+def _metadata_path(path: Path) -> Path:
+    return path.with_suffix(".json")
+
+
+class SituationGrids:
+    def __init__(self, grids: np.ndarray, metadata: Dict[str, Any]):
+        self.grids = grids
+        self.ep_grid, self.conversion_grid, self.plays_grid = grids
+        self.metadata = metadata
+        self.checksum = metadata.get("sha256", "")
+
+    @staticmethod
+    def _index(down: float, distance: float, yardline_100: float) -> tuple:
+        return (
+            min(max(int(down), 1), MAX_DOWN),
+            min(max(int(round(distance)), 1), MAX_DISTANCE),
+            min(max(int(round(yardline_100)), 1), MAX_YARDLINE),
+        )
+
+    def ep(self, down: float, distance: float, yardline_100: float) -> float:
+        return float(self.ep_grid[self._index(down, distance, yardline_100)])
+
+    def conversion(self, down: float, distance: float, yardline_100: float) -> float:
+        return float(self.conversion_grid[self._index(down, distance, yardline_100)])
+
+    def lookup(self, down: np.ndarray, distance: np.ndarray, yardline_100: np.ndarray) -> tuple:
+        # Array form: (ep, conversion) for many situations at once
+        index = (
+            np.clip(np.asarray(down, dtype=np.int64), 1, MAX_DOWN),
+            np.clip(np.rint(distance).astype(np.int64), 1, MAX_DISTANCE),
+            np.clip(np.rint(yardline_100).astype(np.int64), 1, MAX_YARDLINE),
+        )
+        return self.ep_grid[index], self.conversion_grid[index]
+
+
+def save_grids(grids: np.ndarray, metadata: Dict[str, Any], path: Path = GRIDS_PATH) -> None:
+    grids = np.ascontiguousarray(grids, dtype=np.float32)
+    if grids.shape != SHAPE:
+        raise ValueError(f"expected grids of shape {SHAPE}, got {grids.shape}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(path, grids)
+    metadata = {**metadata, "channels": list(CHANNELS), "shape": list(SHAPE), "sha256": hashlib.sha256(grids.tobytes()).hexdigest()}
+    _metadata_path(path).write_text(json.dumps(metadata, indent=1))
+
+
+def load_grids(path: Path = GRIDS_PATH) -> Optional[SituationGrids]:
+    if not path.exists():
+        return None
+    grids = np.load(path)
+    metadata = json.loads(_metadata_path(path).read_text()) if _metadata_path(path).exists() else {}
+    if grids.shape != SHAPE or grids.dtype != np.float32:
+        print(f"Ignoring {path}: expected float32 {SHAPE}, found {grids.dtype} {grids.shape}; rebuild it")
+        return None
+    return SituationGrids(grids, metadata)
@@ -0,0 +1,58 @@
+# Microbenchmark: per-request candidate frame build, legacy dict path vs precomputed template.
+# Run from the repo root:  python -m backend.benchmarks.bench_candidates
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+from backend.app.services.candidates import CANDIDATE_GEOMETRY, _generate_candidates
+from backend.app.services.recommendation_service import _base_features, _load_models
+
+SAMPLE = {
+    "down": 3,
+    "distance": 7,
+    "fieldPosition": 65,
+    "quarter": 4,
+    "timeRemaining": "02:30",
+    "scoreDifference": -3,
+    "posteam_type": "home",
+}
+
+
+def legacy_frame(base: Dict[str, Any], feature_names: List[str]) -> pd.DataFrame:
+    # What every request used to do: merge the base into 138 dicts, then build and reorder a frame
+    candidates = [{**base, **candidate} for candidate in CANDIDATE_GEOMETRY]
+    return pd.DataFrame(candidates).reindex(columns=feature_names, fill_value="unknown")
+
+
+def template_frame(base: Dict[str, Any], feature_names: List[str]) -> pd.DataFrame:
+    return _generate_candidates([base], feature_names)
+
+
+def _measure(fn: Callable[[], Any], number: int) -> Dict[str, float]:
+    fn()  # warm caches (template build, pandas internals)
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+    # Peak bytes allocated while building one request's frame
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"us": seconds * 1e6, "peak_kib": peak / 1024}
+
+
+def main(number: int = 500) -> None:
+    success_model, _ = _load_models()
+    feature_names = list(success_model.feature_names_)
+    base = _base_features(SAMPLE)
+
+    assert legacy_frame(base, feature_names).astype(str).equals(template_frame(base, feature_names).astype(str))
+
+    for name, fn in (("legacy dicts", legacy_frame), ("template", template_frame)):
+        stats = _measure(lambda: fn(base, feature_names), number)
+        print(f"{name:>13}: {stats['us']:8.1f} us/request   peak {stats['peak_kib']:7.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Benchmark + equivalence check: the ETL's derived-feature stage (personnel normalization, success
+# labelling, pass depth buckets) as originally written vs the vectorized version in build_features.py,
+# over a large synthetic play-by-play frame. The outputs must match exactly before timings are printed.
+# Run from the repo root:  python -m backend.benchmarks.bench_features [--rows 1000000]
+import argparse
+import timeit
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from backend.ml.features.build_features import add_features, normalize_personnel, normalize_personnel_column
+
+PERSONNEL = [
+    "1 RB, 1 TE, 3 WR",
+    "1 RB, 2 TE, 2 WR",
+    "2 RB, 1 TE, 2 WR",
+    "1 RB, 3 TE, 1 WR",
+    "0 RB, 1 TE, 4 WR",
+    "2 QB, 1 RB, 1 TE, 2 WR",
+    "6 OL, 1 RB, 2 TE, 1 WR",
+    "1 QB, 1 RB, 1 TE, 3 WR",
+    "",
+]
+
+
+def synthetic_pbp(rows: int, seed: int = 0) -> pd.DataFrame:
+    # Value ranges / missingness of real play-by-play, including the edge cases the rules branch on
+    rng = np.random.default_rng(seed)
+    play_type = rng.choice(np.array(["run", "pass"], dtype=object), rows)
+    air_yards = rng.integers(-10, 50, rows).astype(np.float64)
+    air_yards[rng.random(rows) < 0.1] = np.nan
+    air_yards[play_type == "run"] = np.nan
+    personnel = rng.choice(np.array(PERSONNEL + [None], dtype=object), rows)
+    return pd.DataFrame(
+        {
+            "down": rng.integers(1, 5, rows).astype(np.float64),
+            "ydstogo": rng.integers(0, 25, rows).astype(np.float64),
+            "yardline_100": rng.integers(1, 100, rows).astype(np.float64),
+            "yards_gained": rng.integers(-10, 40, rows).astype(np.float64),
+            "play_type": pd.array(play_type, dtype="str"),
+            "rusher_player_name": pd.array(rng.choice(np.array(["A.Player", "B.Player", None], dtype=object), rows), dtype="str"),
+            "shotgun": rng.integers(0, 2, rows).astype(np.float64),
+            "air_yards": air_yards,
+            "offense_personnel": pd.array(personnel, dtype="str"),
+        }
+    )
+
+
+def legacy_add_features(pbp_offense: pd.DataFrame) -> pd.DataFrame:
+    # add_features before vectorization (per-row regex, five .loc masks), kept as the reference
+    pbp_offense = pbp_offense.dropna(subset=['down', 'ydstogo', 'yardline_100', 'yards_gained'])
+    pbp_offense = pbp_offense[pbp_offense["ydstogo"] > 0].copy()
+    success_conditions = [
+        (pbp_offense['down'] == 1) & (pbp_offense['yards_gained'] >= 0.4 * pbp_offense['ydstogo']),
+        (pbp_offense['down'] == 2) & (pbp_offense['yards_gained'] >= 0.6 * pbp_offense['ydstogo']),
+        (pbp_offense['down'] >= 3) & (pbp_offense['yards_gained'] >= pbp_offense['ydstogo']),
+    ]
+    pbp_offense['success'] = np.select(success_conditions, [1, 1, 1], default=0)
+    pbp_offense["run_player"] = np.where(pbp_offense["play_type"] == "run", pbp_offense["rusher_player_name"], "not_run")
+    pbp_offense["shotgun"] = np.where(pbp_offense["shotgun"] == 1, "shotgun", "under_center")
+    pbp_offense["pass_depth_bucket"] = "not_pass"
+    is_pass = pbp_offense["play_type"] == "pass"
+    conditions = [
+        pbp_offense.loc[is_pass, "air_yards"].isna(),
+        pbp_offense.loc[is_pass, "air_yards"] <= 0,
+        (pbp_offense.loc[is_pass, "air_yards"] > 0) & (pbp_offense.loc[is_pass, "air_yards"] <= 5),
+        (pbp_offense.loc[is_pass, "air_yards"] > 5) & (pbp_offense.loc[is_pass, "air_yards"] <= 15),
+        pbp_offense.loc[is_pass, "air_yards"] > 15,
+    ]
+    choices = ["no_target", "behind_los", "short", "medium", "deep"]
+    pbp_offense.loc[is_pass, "pass_depth_bucket"] = np.select(conditions, choices, default="unknown")
+    pbp_offense["down_ydstogo"] = pbp_offense["down"] * pbp_offense["ydstogo"]
+    return pbp_offense
+
+
+def _same(a: pd.Series, b: pd.Series) -> bool:
+    # Values and missing positions must match; string storage (object vs str) may differ
+    return a.index.equals(b.index) and (a.isna().to_numpy() == b.isna().to_numpy()).all() and (
+        a.dropna().astype(object).to_numpy() == b.dropna().astype(object).to_numpy()
+    ).all()
+
+
+def check_equivalence(pbp: pd.DataFrame) -> None:
+    raw = pbp["offense_personnel"]
+    expected = raw.apply(normalize_personnel)
+    assert _same(normalize_personnel_column(raw), expected), "personnel normalization differs"
+
+    expected, actual = legacy_add_features(pbp), add_features(pbp)
+    assert list(expected.columns) == list(actual.columns), "feature columns differ"
+    for column in expected.columns:
+        assert _same(actual[column], expected[column]), f"{column} differs"
+    assert actual["success"].dtype == expected["success"].dtype
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Derived-feature stage: original vs vectorized")
+    parser.add_argument("--rows", type=int, default=500_000)
+    args = parser.parse_args(argv)
+
+    pbp = synthetic_pbp(args.rows)
+    check_equivalence(pbp)
+    print(f"{args.rows} synthetic plays: outputs identical")
+
+    raw = pbp["offense_personnel"]
+    stages = {
+        "personnel": (lambda: raw.apply(normalize_personnel), lambda: normalize_personnel_column(raw)),
+        "add_features": (lambda: legacy_add_features(pbp), lambda: add_features(pbp)),
+    }
+    for name, (legacy, vectorized) in stages.items():
+        before = min(timeit.repeat(legacy, number=1, repeat=3))
+        after = min(timeit.repeat(vectorized, number=1, repeat=3))
+        print(f"{name:>13}: {before * 1e3:9.1f} ms -> {after * 1e3:8.1f} ms  ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
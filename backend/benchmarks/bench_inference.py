@@ -0,0 +1,70 @@
+# Benchmark: candidate inference through the pandas DataFrame path vs prebuilt CatBoost Pool arrays
+# vs the compiled tree tables, and the two models run back to back vs overlapped by DualModelScorer.
+# Run from the repo root:  python -m backend.benchmarks.bench_inference
+import timeit
+
+import numpy as np
+
+from backend.app.services.compiled_trees import TOLERANCE
+from backend.app.services.inference import INFERENCE_BACKENDS, DualModelScorer, predict_candidates
+from backend.app.services.recommendation_service import _base_features, _load_models
+
+SAMPLE = {
+    "down": 3,
+    "distance": 7,
+    "fieldPosition": 65,
+    "quarter": 4,
+    "timeRemaining": "02:30",
+    "scoreDifference": -3,
+    "posteam_type": "home",
+}
+
+
+def main(batch_sizes=(1, 10, 100, 500)) -> None:
+    success_model, yards_model = _load_models()
+
+    for n in batch_sizes:
+        bases = [_base_features({**SAMPLE, "distance": 1 + i % 20, "fieldPosition": 1 + i % 99}) for i in range(n)]
+
+        # All backends must produce the same predictions before their timings mean anything
+        # (CatBoost paths bit for bit, the compiled one up to summation order)
+        outputs = {backend: predict_candidates(bases, success_model, yards_model, backend) for backend in INFERENCE_BACKENDS}
+        expected = outputs["pool"]
+        for backend, (success_probs, expected_yards) in outputs.items():
+            if backend == "compiled":
+                assert np.allclose(success_probs, expected[0], rtol=0, atol=TOLERANCE)
+                assert np.allclose(expected_yards, expected[1], rtol=0, atol=TOLERANCE)
+            else:
+                assert np.array_equal(success_probs, expected[0]) and np.array_equal(expected_yards, expected[1])
+
+        number = max(1, 200 // n)
+        timings = {
+            backend: min(
+                timeit.repeat(
+                    lambda: predict_candidates(bases, success_model, yards_model, backend), number=number, repeat=5
+                )
+            )
+            / number
+            for backend in INFERENCE_BACKENDS
+        }
+        line = "   ".join(f"{backend} {seconds * 1e3:8.2f} ms" for backend, seconds in timings.items())
+        print(f"N={n:4d}: {line}   (pool {timings['pandas'] / timings['pool']:.1f}x, compiled {timings['pool'] / timings['compiled']:.1f}x vs pool)")
+
+    # Same prepared Pool, sequential vs concurrent model evaluation (needs >1 core to show a difference)
+    scorers = {"sequential": DualModelScorer(success_model, yards_model, "pool", concurrent=False)}
+    scorers["concurrent"] = DualModelScorer(success_model, yards_model, "pool", concurrent=True)
+    for n in batch_sizes:
+        bases = [_base_features({**SAMPLE, "distance": 1 + i % 20}) for i in range(n)]
+        features = scorers["sequential"].prepare(bases)
+        number = max(1, 200 // n)
+        line = "   ".join(
+            f"{name} {min(timeit.repeat(lambda: scorer.score_prepared(features), number=number, repeat=5)) / number * 1e3:8.2f} ms"
+            for name, scorer in scorers.items()
+        )
+        print(f"N={n:4d}: {line}")
+    for scorer in scorers.values():
+        scorer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+# Latency benchmark / load test for the recommend pipeline over a fixed corpus of real situations
+# from pbp_offense_chi_2025.parquet. Reports p50 / p95 / p99 and peak allocations for
+#   - each stage of a request (base features, candidate frame, candidate Pool, the two CatBoost
+#     predicts, the policy layer) at several batch sizes
+#   - the FastAPI app in-process: single requests, /recommend/batch, and concurrent clients
+# and compares them to the stored baseline, flagging regressions.
+#
+# Run from the repo root:
+#   python -m backend.benchmarks.bench_latency                   # compare with baselines/latency.json
+#   python -m backend.benchmarks.bench_latency --save-baseline   # record a new baseline
+# Baselines are machine specific: re-record them on the machine you compare on.
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from backend.app.services.candidates import CANDIDATE_GEOMETRY, _candidate_pool, _generate_candidates
+from backend.app.services.inference import DualModelScorer
+from backend.app.services.model_registry import load_active
+from backend.app.services.policy_layer import recommend_best_play_arrays
+from backend.app.services.recommendation_service import (
+    ARTIFACTS_DIR,
+    CANDIDATE_ARRAYS,
+    _base_features,
+    _policy_situation,
+)
+from backend.app.services.result_cache import RecommendationCache
+
+CORPUS_PATH = ARTIFACTS_DIR / "pbp_offense_chi_2025.parquet"
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "latency.json"
+
+CORPUS_COLUMNS = [
+    "game_id",
+    "play_id",
+    "play_type",
+    "down",
+    "ydstogo",
+    "yardline_100",
+    "qtr",
+    "quarter_seconds_remaining",
+    "score_differential",
+    "posteam_type",
+    "posteam_timeouts_remaining",
+    "defteam_timeouts_remaining",
+]
+
+
+def load_corpus(size: int = 200, path: Path = CORPUS_PATH) -> List[Dict[str, Any]]:
+    # Every k-th scrimmage play in game / play order, as /recommend request bodies -- deterministic, no RNG
+    plays = pd.read_parquet(path, columns=CORPUS_COLUMNS)
+    plays = plays[plays["play_type"].isin(["run", "pass"])].dropna().sort_values(["game_id", "play_id"])
+    plays = plays.iloc[np.linspace(0, len(plays) - 1, min(size, len(plays))).astype(int)]
+    return [
+        {
+            "down": int(row.down),
+            "distance": int(row.ydstogo),
+            "fieldPosition": int(row.yardline_100),
+            "quarter": int(row.qtr),
+            "timeRemaining": f"{int(row.quarter_seconds_remaining) // 60:02d}:{int(row.quarter_seconds_remaining) % 60:02d}",
+            "scoreDifference": int(row.score_differential),
+            "posteam_type": str(row.posteam_type),
+            "posteam_timeouts_remaining": int(row.posteam_timeouts_remaining),
+            "defteam_timeouts_remaining": int(row.defteam_timeouts_remaining),
+        }
+        for row in plays.itertuples(index=False)
+    ]
+
+
+def corpus_digest(corpus: List[Dict[str, Any]]) -> str:
+    return hashlib.sha256(json.dumps(corpus, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _summary(samples_ns: Sequence[int]) -> Dict[str, float]:
+    us = np.asarray(samples_ns, dtype=np.float64) / 1e3
+    p50, p95, p99 = np.percentile(us, [50, 95, 99])
+    return {"n": int(len(us)), "mean_us": float(us.mean()), "p50_us": float(p50), "p95_us": float(p95), "p99_us": float(p99)}
+
+
+def _peak_kib(fn: Callable[[], Any]) -> float:
+    # Peak bytes allocated by one call (traced separately: tracemalloc slows everything it watches)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def _batches(corpus: List[Dict[str, Any]], n: int) -> List[List[Dict[str, Any]]]:
+    return [corpus[i : i + n] for i in range(0, len(corpus) - n + 1, n)] or [corpus[:n]]
+
+
+def bench_stages(
+    corpus: List[Dict[str, Any]],
+    success_model: Any,
+    yards_model: Any,
+    batch_sizes: Sequence[int],
+    rounds: int,
+    min_samples: int = 50,
+) -> Dict[str, Dict[str, float]]:
+    feature_names = list(success_model.feature_names_)
+    scorer = DualModelScorer(success_model, yards_model, "pool", concurrent=False)
+    n_candidates = len(CANDIDATE_GEOMETRY)
+    results: Dict[str, Dict[str, float]] = {}
+
+    for n in batch_sizes:
+        batches = _batches(corpus, n)
+        prepared = []
+        for situations in batches:
+            bases = [_base_features(situation) for situation in situations]
+            pool = _candidate_pool(bases, success_model)
+            prepared.append((situations, bases, pool, scorer.score_prepared(pool)))
+
+        def policy(situations, bases, success_probs, expected_yards):
+            for i, (situation, base) in enumerate(zip(situations, bases)):
+                rows = slice(i * n_candidates, (i + 1) * n_candidates)
+                recommend_best_play_arrays(
+                    _policy_situation(situation, base), CANDIDATE_ARRAYS, success_probs[rows], expected_yards[rows]
+                )
+
+        stages: Dict[str, Callable[[Any], Any]] = {
+            "base_features": lambda p: [_base_features(situation) for situation in p[0]],
+            "candidate_frame": lambda p: _generate_candidates(p[1], feature_names),
+            "candidate_pool": lambda p: _candidate_pool(p[1], success_model),
+            "predict_success": lambda p: scorer._predict_success(p[2]),
+            "predict_yards": lambda p: scorer._predict_yards(p[2]),
+            "policy": lambda p: policy(p[0], p[1], *p[3]),
+        }
+        # Large batches give few samples per pass over the corpus; repeat until the tail percentiles mean something
+        passes = max(rounds, -(-min_samples // len(prepared)))
+        for stage, fn in stages.items():
+            # One unrecorded pass: warms lazy caches and the allocator, so --rounds 1 measures the same steady state
+            for p in prepared:
+                fn(p)
+            samples = []
+            for _ in range(passes):
+                for p in prepared:
+                    started = time.perf_counter_ns()
+                    fn(p)
+                    samples.append(time.perf_counter_ns() - started)
+            results[f"stage/{stage}/n={n}"] = {**_summary(samples), "peak_kib": _peak_kib(lambda: fn(prepared[0]))}
+
+    scorer.close()
+    return results
+
+
+async def _bench_api(
+    corpus: List[Dict[str, Any]], batch_sizes: Sequence[int], clients: Sequence[int], rounds: int, min_samples: int = 50
+) -> Dict[str, Dict[str, float]]:
+    import httpx  # dev requirement (requirements-dev.txt)
+
+    from backend.app.main import app
+
+    results: Dict[str, Dict[str, float]] = {}
+    async with app.router.lifespan_context(app):
+        # Measure the model path: no rate limit, result cache or precomputed table
+        app.state.limiter.enabled = False
+        app.state.models.recommendation_cache = RecommendationCache(0)
+        app.state.models.recommendation_table = None
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            async def post(path: str, body: Any, samples: List[int]) -> None:
+                started = time.perf_counter_ns()
+                response = await client.post(path, json=body)
+                samples.append(time.perf_counter_ns() - started)
+                response.raise_for_status()
+
+            await post("/recommend", corpus[0], [])
+
+            # One client, one request at a time
+            samples: List[int] = []
+            for _ in range(rounds):
+                for situation in corpus:
+                    await post("/recommend", situation, samples)
+            results["api/single"] = _summary(samples)
+
+            tracemalloc.start()
+            await post("/recommend", corpus[0], [])
+            results["api/single"]["peak_kib"] = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+
+            for n in batch_sizes:
+                samples = []
+                batches = _batches(corpus, n)
+                # Same floor on samples as the stage timings: a few big batches per pass aren't a distribution
+                for _ in range(max(rounds, -(-min_samples // len(batches)))):
+                    for situations in batches:
+                        await post("/recommend/batch", situations, samples)
+                results[f"api/batch/n={n}"] = _summary(samples)
+
+            # C clients each walking their share of the corpus; latency is per request, as each client sees it
+            for c in clients:
+                samples = []
+
+                async def run_client(k: int) -> None:
+                    for _ in range(rounds):
+                        for situation in corpus[k::c]:
+                            await post("/recommend", situation, samples)
+
+                started = time.perf_counter()
+                await asyncio.gather(*(run_client(k) for k in range(c)))
+                elapsed = time.perf_counter() - started
+                results[f"api/concurrent/c={c}"] = {**_summary(samples), "requests_per_s": len(samples) / elapsed}
+
+    return results
+
+
+def compare(
+    current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float
+) -> List[str]:
+    # A metric regresses when its p50 or p95 latency, or its peak allocation, grows by more than `tolerance`
+    regressions = []
+    for name, stats in current.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for field in ("p50_us", "p95_us", "peak_kib"):
+            if field in stats and reference.get(field):
+                ratio = stats[field] / reference[field]
+                if ratio > 1 + tolerance:
+                    regressions.append(f"{name} {field}: {reference[field]:.1f} -> {stats[field]:.1f} ({ratio:.2f}x)")
+    return regressions
+
+
+def _print_results(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'metric':<34}{'p50 us':>11}{'p95 us':>11}{'p99 us':>11}{'peak KiB':>10}{'vs base p50':>13}")
+    for name, stats in results.items():
+        reference = baseline.get(name, {}).get("p50_us")
+        change = f"{stats['p50_us'] / reference:.2f}x" if reference else "-"
+        peak = f"{stats['peak_kib']:.0f}" if "peak_kib" in stats else "-"
+        print(f"{name:<34}{stats['p50_us']:>11.1f}{stats['p95_us']:>11.1f}{stats['p99_us']:>11.1f}{peak:>10}{change:>13}")
+        if "requests_per_s" in stats:
+            print(f"{'':<34}{stats['requests_per_s']:>11.0f} req/s")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Per-stage and end-to-end latency of the recommend pipeline")
+    parser.add_argument("--corpus-size", type=int, default=200)
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 16, 128])
+    parser.add_argument("--clients", type=_int_list, default=[8, 32])
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the corpus per measurement")
+    parser.add_argument("--only", choices=["stages", "api"], default=None)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    # Run-to-run timings on a shared single-core VM vary by up to ~2x for the same code; tighten on quieter machines
+    parser.add_argument("--tolerance", type=float, default=1.0, help="allowed slowdown before a metric is flagged")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus_size)
+    digest = corpus_digest(corpus)
+    print(f"Corpus: {len(corpus)} situations from {CORPUS_PATH.name} ({digest})")
+
+    results: Dict[str, Dict[str, float]] = {}
+    if args.only != "api":
+        # The pair the API serves: the registry's ACTIVE version
+        success_model, yards_model, _ = load_active()
+        results.update(bench_stages(corpus, success_model, yards_model, args.batch_sizes, args.rounds))
+    if args.only != "stages":
+        results.update(asyncio.run(_bench_api(corpus, args.batch_sizes, args.clients, args.rounds)))
+
+    machine = {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()}
+    stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else None
+    baseline = stored["metrics"] if stored and stored.get("corpus") == digest else {}
+    if stored and not baseline:
+        print(f"Ignoring {args.baseline}: recorded over a different corpus")
+    elif stored and stored.get("machine") != machine:
+        print(f"Note: {args.baseline} was recorded on {stored.get('machine')}; expect differences unrelated to the code")
+    _print_results(results, baseline)
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        metrics = {**(stored["metrics"] if baseline else {}), **results}
+        args.baseline.write_text(
+            json.dumps(
+                {
+                    "corpus": digest,
+                    "machine": machine,
+                    "metrics": metrics,
+                },
+                indent=1,
+            )
+        )
+        print("Saved baseline to:", args.baseline.resolve())
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print("REGRESSION", line)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# Benchmark: per-request overhead of the token-bucket rate limiter (in-process and shared-memory tables)
+# vs the slowapi Limiter + SlowAPIMiddleware setup it replaced, on a trivial endpoint driven directly
+# through ASGI. Also reports how many client keys each one holds after a burst of distinct clients.
+# Run from the repo root:  python -m backend.benchmarks.bench_rate_limit
+import argparse
+import asyncio
+import time
+import timeit
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from fastapi import FastAPI, Request
+
+from backend.app.rate_limit import RateLimitMiddleware, build_buckets
+
+# High enough that nothing is rejected: every request pays the full bookkeeping path
+RATE = "1000000/minute"
+
+
+def _base_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    return app
+
+
+def _no_limit() -> Any:
+    return _base_app(), None
+
+
+def _token_buckets(shared: bool, capacity: int) -> Callable[[], Any]:
+    def build() -> Any:
+        app = _base_app()
+        buckets = build_buckets(RATE, capacity, shared)
+        app.add_middleware(RateLimitMiddleware, buckets=buckets)
+        return app, lambda: len(buckets)
+
+    return build
+
+
+def _slowapi() -> Optional[Any]:
+    try:
+        from slowapi import Limiter
+        from slowapi.errors import RateLimitExceeded
+        from slowapi.middleware import SlowAPIMiddleware
+    except ImportError:
+        return None
+
+    def get_real_ip(request: Request):
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+        return request.client.host if request.client else "127.0.0.1"
+
+    # The configuration main.py used before the token-bucket limiter
+    app = _base_app()
+    limiter = Limiter(key_func=get_real_ip, default_limits=[RATE])
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, lambda request, exc: None)
+    app.add_middleware(SlowAPIMiddleware)
+    return app, lambda: len(limiter._storage.storage)
+
+
+async def _drive(app: Any, keys: Sequence[bytes], requests: int) -> List[float]:
+    # Requests straight into the ASGI app, one at a time; returns per-request seconds
+    async def receive() -> Dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"unexpected status {message['status']}")
+
+    samples = []
+    for i in range(requests):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/ping",
+            "raw_path": b"/ping",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"bench"), (b"x-forwarded-for", keys[i % len(keys)])],
+            "client": ("10.0.0.1", 50000),
+            "server": ("bench", 80),
+        }
+        started = time.perf_counter()
+        await app(scope, receive, send)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _summary(samples: List[float]) -> str:
+    ordered = sorted(samples)
+    mean = sum(ordered) / len(ordered)
+    return f"mean {mean * 1e6:7.1f}us  p50 {ordered[len(ordered) // 2] * 1e6:7.1f}us  p99 {ordered[int(len(ordered) * 0.99)] * 1e6:7.1f}us"
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Rate limiter middleware overhead per request")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 1000, 50000], help="distinct X-Forwarded-For keys")
+    parser.add_argument("--capacity", type=int, default=65536, help="token-bucket key table size")
+    args = parser.parse_args(argv)
+
+    setups: Dict[str, Callable[[], Any]] = {
+        "none": _no_limit,
+        "slowapi": _slowapi,
+        "token bucket": _token_buckets(False, args.capacity),
+        "token bucket (shared)": _token_buckets(True, args.capacity),
+    }
+    for clients in args.clients:
+        keys = [f"172.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}".encode() for i in range(clients)]
+        requests = max(args.requests, clients)
+        print(f"{clients} distinct clients, {requests} requests")
+        baseline = None
+        for name, build in setups.items():
+            built = build()
+            if built is None:
+                print(f"  {name:<22} skipped (not installed)")
+                continue
+            app, key_count = built
+            asyncio.run(_drive(app, keys, min(1000, requests)))  # warm up routing / first-call costs
+            samples = asyncio.run(_drive(app, keys, requests))
+            mean = sum(samples) / len(samples)
+            if baseline is None:
+                baseline = mean
+            overhead = f"overhead {(mean - baseline) * 1e6:+6.1f}us" if name != "none" else " " * 17
+            keys_held = f"  keys held {key_count()}" if key_count is not None else ""
+            print(f"  {name:<22} {_summary(samples)}  {overhead}{keys_held}")
+
+    # The table update alone, without the ASGI round trip whose noise dominates the numbers above
+    keys = [f"172.16.{i >> 8 & 255}.{i & 255}" for i in range(1000)]
+    for shared in (False, True):
+        buckets = build_buckets(RATE, args.capacity, shared)
+        number = 100000
+        seconds = min(timeit.repeat(lambda: [buckets.acquire(key, time.monotonic()) for key in keys], number=number // len(keys), repeat=5))
+        print(f"acquire() {'shared' if shared else 'in-process'}: {seconds / number * 1e6:.2f}us per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Differential checks: each optimized path against the reference it replaced, over fixed grids of inputs.
+# Prints one line per check and exits non-zero if any of them finds a difference.
+# Run from the repo root:
+#   python -m backend.benchmarks.differential            # every check
+#   python -m backend.benchmarks.differential policy     # just the named ones
+import argparse
+import itertools
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.app.services.policy_layer import GameSituation, recommend_best_play, recommend_best_play_arrays
+from backend.app.services.recommendation_service import CANDIDATE_ARRAYS, _base_features, recommend_plays
+
+# Values either side of every threshold the policy layer branches on (red zone, two-minute drill, distance)
+POLICY_GRID = {
+    "down": [1, 2, 3, 4],
+    "distance": [1, 2, 3, 5, 6, 9, 10, 15],
+    "yardline_100": [3, 5, 6, 20, 50, 90],
+    "quarter": [1, 2, 3, 4, 5],
+    "time_remaining_seconds": [30, 120, 121, 600],
+    "score_difference": [-7, 0, 3],
+}
+
+
+# Request situations for model-level checks: both sides of the clock / score / field, home and away
+SITUATION_GRID = {
+    "down": [1, 2, 3, 4],
+    "distance": [1, 3, 7, 10, 18],
+    "fieldPosition": [2, 9, 25, 50, 80, 99],
+    "quarter": [1, 2, 4, 5],
+    "timeRemaining": ["0:40", "1:55", "9:30"],
+    "scoreDifference": [-14, -3, 0, 7],
+    "posteam_type": ["home", "away"],
+    "posteam_timeouts_remaining": [0, 3],
+}
+
+
+def _policy_predictions(rng: np.random.Generator, n: int) -> List[Dict[str, np.ndarray]]:
+    # Continuous scores, heavy ties (coarse values), and probabilities given in percent
+    return [
+        {"success_probs": rng.random(n), "expected_yards": rng.normal(4.0, 3.0, n)},
+        {"success_probs": rng.integers(0, 4, n) / 4.0, "expected_yards": rng.integers(0, 3, n).astype(np.float64)},
+        {"success_probs": rng.random(n) * 100.0, "expected_yards": rng.normal(4.0, 3.0, n)},
+    ]
+
+
+def check_policy() -> str:
+    # recommend_best_play_arrays against the dict-based recommend_best_play, same situations and predictions
+    rng = np.random.default_rng(0)
+    names = list(POLICY_GRID)
+    checked = 0
+    for values in itertools.product(*POLICY_GRID.values()):
+        situation = GameSituation(**dict(zip(names, values)))
+        for predictions in _policy_predictions(rng, len(CANDIDATE_ARRAYS)):
+            success_probs, expected_yards = predictions["success_probs"], predictions["expected_yards"]
+            candidates = [
+                {**row, "success_prob": float(p), "expected_yards": float(y)}
+                for row, p, y in zip(CANDIDATE_ARRAYS.rows, success_probs, expected_yards)
+            ]
+            expected = recommend_best_play(situation, candidates)
+            actual = recommend_best_play_arrays(situation, CANDIDATE_ARRAYS, success_probs, expected_yards)
+            if actual != expected:
+                raise AssertionError(f"policy: recommendation differs for {situation}")
+            checked += 1
+    return f"{checked} situation / prediction sets identical"
+
+
+def _situations(every: int = 7) -> List[Dict[str, Any]]:
+    # Every `every`-th point of SITUATION_GRID, so each value still appears with many combinations
+    names = list(SITUATION_GRID)
+    return [dict(zip(names, values)) for values in itertools.product(*SITUATION_GRID.values())][::every]
+
+
+def _leaves(value: Any) -> Tuple[List[Any], List[float]]:
+    # A response split into its exact parts (play fields, order, risk levels) and its floats, in order
+    if isinstance(value, dict):
+        parts = [_leaves(value[key]) for key in sorted(value)]
+        return [sorted(value)] + [leaf for exact, _ in parts for leaf in exact], [x for _, floats in parts for x in floats]
+    if isinstance(value, list):
+        parts = [_leaves(item) for item in value]
+        return [len(value)] + [leaf for exact, _ in parts for leaf in exact], [x for _, floats in parts for x in floats]
+    if isinstance(value, float):
+        return [], [value]
+    return [value], []
+
+
+def check_compiled() -> str:
+    # The "compiled" inference backend against CatBoost: raw predictions within compiled_trees.TOLERANCE,
+    # and the same recommended plays in the same order
+    from backend.app.services.compiled_trees import TOLERANCE, check
+    from backend.app.services.inference import DualModelScorer
+    from backend.app.services.model_registry import load_active
+
+    success_model, yards_model, metadata = load_active()
+    situations = _situations()
+    errors = check(success_model, yards_model, [_base_features(situation) for situation in situations])
+    if max(errors.values()) > TOLERANCE:
+        raise AssertionError(f"compiled: max |compiled - CatBoost| {errors} above {TOLERANCE:g}")
+
+    worst = 0.0
+    responses = {}
+    for backend in ("pool", "compiled"):
+        scorer = DualModelScorer(success_model, yards_model, backend, concurrent=False)
+        responses[backend] = recommend_plays(situations, success_model, yards_model, scorer=scorer)
+        scorer.close()
+    for situation, expected, actual in zip(situations, responses["pool"], responses["compiled"]):
+        (expected_exact, expected_floats), (actual_exact, actual_floats) = _leaves(expected), _leaves(actual)
+        if actual_exact != expected_exact:
+            raise AssertionError(f"compiled: different recommendation for {situation}")
+        worst = max([worst] + [abs(a - b) for a, b in zip(actual_floats, expected_floats) if a != b])
+    # successProbability is in percent: 100x the probability's tolerance
+    if worst > 100 * TOLERANCE:
+        raise AssertionError(f"compiled: response values differ by up to {worst:.1e}")
+    return (
+        f"version {metadata.get('version')}, {len(situations)} situations: max prediction error success "
+        f"{errors['success']:.1e} / yards {errors['yards']:.1e}, same plays and order, response floats within {worst:.1e}"
+    )
+
+
+def check_features(rows: int = 200_000) -> str:
+    # The vectorized ETL stages (personnel normalization, add_features) against the original row-wise code
+    from backend.benchmarks.bench_features import check_equivalence, synthetic_pbp
+
+    check_equivalence(synthetic_pbp(rows))
+    return f"{rows} synthetic plays identical"
+
+
+CHECKS: Dict[str, Callable[[], str]] = {
+    "policy": check_policy,
+    "compiled": check_compiled,
+    "features": check_features,
+}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Optimized paths vs their reference implementations")
+    parser.add_argument("checks", nargs="*", help=f"any of {', '.join(CHECKS)} (default: all)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks {unknown}; expected some of {list(CHECKS)}")
+
+    failed = []
+    for name in args.checks or list(CHECKS):
+        try:
+            print(f"{name:>9}: {CHECKS[name]()}")
+        except AssertionError as exc:
+            print(f"{name:>9}: FAILED {exc}")
+            failed.append(name)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,91 @@
+import argparse
+import json
+import os
 import re
-import nflreadpy as nfl
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
 import pandas as pd
 import numpy as np
 import pyarrow as pa
-from pathlib import Path
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import requests
+
+# Streaming ETL: one season at a time, nflverse parquet files are downloaded to a local cache and scanned
+# with only the columns below; the team / run-pass filters are pushed into the scan (row groups that
+# can't match are skipped) so full-width, full-league frames are never materialized. Output is written
+# chunk by chunk, so peak memory depends on the chunk size, not on how many seasons are built.
+#
+# The output is a feature store: a Parquet dataset partitioned as season=YYYY/team=XXX/, plus a manifest
+# of the game_ids already in it. Reruns skip those games in the scan and only append new ones, so the
+# weekly update re-fetches the current season's file (--refresh) but processes just the new games.
+#
+#   python -m backend.ml.features.build_features                          # CHI, 2025
+#   python -m backend.ml.features.build_features --teams CHI GB --seasons 2022 2023 2024 2025
+#   python -m backend.ml.features.build_features --seasons 2025 --refresh  # weekly update
+
+NFLVERSE_RELEASES = "https://github.com/nflverse/nflverse-data/releases/download"
+PBP_URL = NFLVERSE_RELEASES + "/pbp/play_by_play_{season}.parquet"
+PARTICIPATION_URL = NFLVERSE_RELEASES + "/pbp_participation/pbp_participation_{season}.parquet"
+
+ARTIFACTS_DIR = Path(__file__).resolve().parents[1] / "artifacts"
+RAW_DIR = Path(os.getenv("NFLVERSE_CACHE_DIR", ARTIFACTS_DIR / "raw"))
+FEATURE_STORE_DIR = Path(os.getenv("FEATURE_STORE_DIR", ARTIFACTS_DIR / "feature_store"))
+# Leading underscore: Parquet dataset discovery skips it
+MANIFEST_NAME = "_manifest.json"
+
+# Everything training, the API benchmarks and the derived features below read from play-by-play
+PBP_COLUMNS = [
+    "game_id",
+    "play_id",
+    "season",
+    "week",
+    "game_date",
+    "posteam",
+    "defteam",
+    "posteam_type",
+    "play_type",
+    "down",
+    "ydstogo",
+    "yardline_100",
+    "qtr",
+    "quarter_seconds_remaining",
+    "half_seconds_remaining",
+    "game_seconds_remaining",
+    "score_differential",
+    "posteam_timeouts_remaining",
+    "defteam_timeouts_remaining",
+    "no_huddle",
+    "shotgun",
+    "run_location",
+    "run_gap",
+    "rusher_player_name",
+    "pass_location",
+    "air_yards",
+    "yards_gained",
+    "epa",
+    # Turnover flags for the drive simulator's outcome model (backend/app/services/simulation.py)
+    "interception",
+    "fumble_lost",
+    # Series / drive outcomes for the expected-points and conversion grids (build_situation_grids.py)
+    "series_success",
+    "fixed_drive_result",
+]
+PARTICIPATION_COLUMNS = ["nflverse_game_id", "play_id", "possession_team", "offense_personnel"]
+
+# Column order of every file in the store; season and team live in the partition path
+STORE_COLUMNS = [c for c in PBP_COLUMNS if c != "season"] + [
+    "offense_personnel",
+    "success",
+    "run_player",
+    "pass_depth_bucket",
+    "down_ydstogo",
+]
+
+CHUNK_ROWS = 16_384
 
 
 def normalize_personnel(raw: str) -> str:
@@ -16,125 +98,263 @@ def normalize_personnel(raw: str) -> str:
     te = counts.get('TE', 0)
     return f"{rb}{te}"
 
-pbp = nfl.load_pbp(seasons=[2025])
-pbp_par = nfl.load_participation(seasons=[2025])
-
-pbp_pandas = pbp.to_pandas()
-pbp_participation_pandas = pbp_par.to_pandas()
-
-# Only take offense_personnel (plus id columns) for Bears offense
-pbp_participation_pandas = pbp_participation_pandas[pbp_participation_pandas['possession_team'] == 'CHI']
-off_personnel_bears = pbp_participation_pandas[['nflverse_game_id', 'play_id', 'offense_personnel']]
-
-off_personnel_bears = off_personnel_bears.rename(columns={"nflverse_game_id": "game_id"})
-
-# Normalize raw personnel strings to standard NFL {#RB}{#TE} codes before merge
-off_personnel_bears['offense_personnel'] = off_personnel_bears['offense_personnel'].apply(normalize_personnel)
-
-# Merge just offense_personnel onto pbp; keeps all pbp rows, adds NaN for any play without mapping
-pbp_pandas = pd.merge(
-    pbp_pandas,
-    off_personnel_bears,
-    on=['game_id', 'play_id'],
-    how='left'
-)
-
-# Filter to 2025 Bears offensive plays early to keep memory manageable.
-pbp_2025 = pbp_pandas[pbp_pandas['season'] == 2025]
-pbp_bears = pbp_2025[pbp_2025['posteam'] == 'CHI']
-pbp_offense_raw = pbp_bears[pbp_bears['play_type'].isin(['run', 'pass'])]
-
-##all of bears offensive plays in pbp_offense_raw (pandas dataframe); important to note we're not training on penalties/no play
-
-pbp_offense = pbp_offense_raw.copy()
-
-# Drop rows with missing core fields and filter out 0 ydstogo plays
-pbp_offense = pbp_offense.dropna(subset=['down', 'ydstogo', 'yardline_100', 'yards_gained'])
-pbp_offense = pbp_offense[pbp_offense["ydstogo"] > 0]
-
-# Success definition: 40/60/100 rule by down.
-success_conditions = [
-    (pbp_offense['down'] == 1) & (pbp_offense['yards_gained'] >= 0.4 * pbp_offense['ydstogo']),
-    (pbp_offense['down'] == 2) & (pbp_offense['yards_gained'] >= 0.6 * pbp_offense['ydstogo']),
-    (pbp_offense['down'] >= 3) & (pbp_offense['yards_gained'] >= pbp_offense['ydstogo']),
-]
-pbp_offense['success'] = np.select(success_conditions, [1, 1, 1], default=0)
-
-
-
-
-###Adding in Rusher
-pbp_offense["run_player"] = np.where(
-    pbp_offense["play_type"] == "run",
-    pbp_offense["rusher_player_name"],  
-    "not_run"
-)
-
-
-###Shotgun v. Under Center
-pbp_offense["shotgun"] = np.where(pbp_offense["shotgun"] == 1, "shotgun", "under_center")
-
-
-
-# pass_depth_bucket
-if 'air_yards' in pbp_offense.columns:
-    pbp_offense["pass_depth_bucket"] = "not_pass"  
-
-    is_pass = pbp_offense["play_type"] == "pass"
-
-    conditions = [
-        pbp_offense.loc[is_pass, "air_yards"].isna(),
-        pbp_offense.loc[is_pass, "air_yards"] <= 0,
-        (pbp_offense.loc[is_pass, "air_yards"] > 0) & (pbp_offense.loc[is_pass, "air_yards"] <= 5),
-        (pbp_offense.loc[is_pass, "air_yards"] > 5) & (pbp_offense.loc[is_pass, "air_yards"] <= 15),
-        pbp_offense.loc[is_pass, "air_yards"] > 15,
-    ]
-    choices = ["no_target", "behind_los", "short", "medium", "deep"]
-
-    pbp_offense.loc[is_pass, "pass_depth_bucket"] = np.select(conditions, choices, default="unknown")
-else:
-    pbp_offense["pass_depth_bucket"] = "unknown"
-
-#####
-###Interaction Terms
-# Interaction term to capture down-and-distance context.
-######
-pbp_offense["down_ydstogo"] = pbp_offense["down"] * pbp_offense["ydstogo"]
-
-
-
-
-
-
-
-
-##Might have to look at taking out Caleb's rushing since there have been no designed QB runs
-
-
-#####
-###Saving data
-####
-ARTIFACTS_DIR = Path(__file__).resolve().parents[1] / "artifacts"
-ARTIFACTS_DIR.mkdir(exist_ok=True)
-
-parquet_path = ARTIFACTS_DIR / "pbp_offense_chi_2025.parquet"
-csv_path = ARTIFACTS_DIR / "pbp_offense_chi_2025.csv"
-
-pbp_offense.to_parquet(parquet_path, index=False)
-pbp_offense.to_csv(csv_path, index=False)
-
-
-
-
-print("Offense personnel unique values:", pbp_offense["offense_personnel"].unique())
-
-
-
-print("Saved parquet to:", parquet_path.resolve())
-print("Saved csv to:", csv_path.resolve())
-
-print(pbp_offense.head())
-print(pbp_offense.shape)
-print(pbp_offense["game_id"].nunique())
 
-print(np.unique(pbp_offense["run_player"]))
\ No newline at end of file
+def normalize_personnel_column(raw: pd.Series) -> pd.Series:
+    # normalize_personnel over a whole column. A season has only a few dozen distinct personnel strings,
+    # so they are factorized and parsed once each: extractall finds the same "<count> <position>" matches
+    # as re.finditer, and the last count seen for a position wins, as in the dict comprehension.
+    codes, uniques = pd.factorize(raw)
+    uniques = pd.Series(uniques, dtype=object)
+    is_str = np.fromiter((isinstance(v, str) for v in uniques), dtype=bool, count=len(uniques))
+
+    matches = uniques[is_str].astype(object).str.extractall(r'(\d+)\s+(\w+)')
+    counts = (
+        matches[0].astype(np.int64)
+        .groupby([matches.index.get_level_values(0), matches[1]])
+        .last()
+        .unstack()
+        .reindex(index=np.flatnonzero(is_str), columns=["QB", "RB", "TE"])
+    )
+    qb = counts["QB"].fillna(1).to_numpy()
+    rb = counts["RB"].fillna(0).to_numpy(dtype=np.int64)
+    te = counts["TE"].fillna(0).to_numpy(dtype=np.int64)
+
+    normalized = np.full(len(uniques), "unknown", dtype=object)
+    normalized[is_str] = np.where(qb >= 2, "wildcat", np.char.add(rb.astype(str), te.astype(str)))
+    # factorize codes missing values as -1: they map to the extra "unknown" slot
+    return pd.Series(np.append(normalized, "unknown")[codes], index=raw.index, name=raw.name)
+
+
+def _cached_download(url: str, path: Path, refresh: bool = False) -> Path:
+    # Streamed to disk in blocks; the file is only scanned afterwards, never held in memory whole
+    if path.exists() and not refresh:
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix(".part")
+    print("Downloading", url)
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(partial, "wb") as f:
+            for block in response.iter_content(chunk_size=1 << 20):
+                f.write(block)
+    partial.rename(path)
+    return path
+
+
+def _scan(path: Path, columns: List[str], filter: ds.Expression) -> Iterator[pa.RecordBatch]:
+    dataset = ds.dataset(path, format="parquet")
+    # Older seasons lack some columns; project whatever exists and add the rest as nulls downstream
+    available = [c for c in columns if c in dataset.schema.names]
+    return dataset.to_batches(columns=available, filter=filter, batch_size=CHUNK_ROWS)
+
+
+def _season_personnel(season: int, teams: Sequence[str], refresh: bool = False) -> pd.DataFrame:
+    path = _cached_download(
+        PARTICIPATION_URL.format(season=season), RAW_DIR / f"pbp_participation_{season}.parquet", refresh
+    )
+    batches = list(_scan(path, PARTICIPATION_COLUMNS, ds.field("possession_team").isin(teams)))
+    personnel = pa.Table.from_batches(batches) if batches else pa.table({c: [] for c in PARTICIPATION_COLUMNS})
+    personnel = personnel.select(["nflverse_game_id", "play_id", "offense_personnel"]).to_pandas()
+    personnel = personnel.rename(columns={"nflverse_game_id": "game_id"})
+
+    # Normalize raw personnel strings to standard NFL {#RB}{#TE} codes before merge
+    personnel['offense_personnel'] = normalize_personnel_column(personnel['offense_personnel'])
+    return personnel
+
+
+def _labels(choices: List[str], codes: np.ndarray, index: pd.Index) -> pd.Series:
+    # String column from small integer codes: a take from the few labels, no per-row Python strings
+    return pd.Series(choices, dtype="str").take(codes.astype(np.intp)).set_axis(index)
+
+
+def add_features(pbp_offense: pd.DataFrame) -> pd.DataFrame:
+    ##important to note we're not training on penalties/no play
+
+    # Drop rows with missing core fields and filter out 0 ydstogo plays
+    pbp_offense = pbp_offense.dropna(subset=['down', 'ydstogo', 'yardline_100', 'yards_gained'])
+    pbp_offense = pbp_offense[pbp_offense["ydstogo"] > 0].copy()
+
+    # Success definition: 40/60/100 rule by down.
+    down = pbp_offense['down'].to_numpy()
+    ydstogo = pbp_offense['ydstogo'].to_numpy()
+    required = np.select([down == 1, down == 2], [0.4 * ydstogo, 0.6 * ydstogo], default=ydstogo)
+    pbp_offense['success'] = ((down >= 1) & (pbp_offense['yards_gained'].to_numpy() >= required)).astype(np.int64)
+
+    ###Adding in Rusher
+    pbp_offense["run_player"] = pbp_offense["rusher_player_name"].where(pbp_offense["play_type"] == "run", "not_run")
+
+    ###Shotgun v. Under Center
+    pbp_offense["shotgun"] = _labels(["under_center", "shotgun"], pbp_offense["shotgun"].to_numpy() == 1, pbp_offense.index)
+
+    # pass_depth_bucket: one ordered select over the pass rows' air yards (first matching bucket wins)
+    if 'air_yards' in pbp_offense.columns:
+        is_pass = (pbp_offense["play_type"] == "pass").to_numpy(dtype=bool, na_value=False)
+        air_yards = pbp_offense["air_yards"].to_numpy(dtype=np.float64, na_value=np.nan)[is_pass]
+
+        depth = np.zeros(len(pbp_offense), dtype=np.int8)
+        depth[is_pass] = np.select(
+            [np.isnan(air_yards), air_yards <= 0, air_yards <= 5, air_yards <= 15, air_yards > 15], [1, 2, 3, 4, 5], default=6
+        )
+        pbp_offense["pass_depth_bucket"] = _labels(
+            ["not_pass", "no_target", "behind_los", "short", "medium", "deep", "unknown"], depth, pbp_offense.index
+        )
+    else:
+        pbp_offense["pass_depth_bucket"] = "unknown"
+
+    #####
+    ###Interaction Terms
+    # Interaction term to capture down-and-distance context.
+    ######
+    pbp_offense["down_ydstogo"] = pbp_offense["down"] * pbp_offense["ydstogo"]
+
+    ##Might have to look at taking out Caleb's rushing since there have been no designed QB runs
+    return pbp_offense
+
+
+def season_chunks(
+    season: int, teams: Sequence[str], done: Optional[Dict[str, List[str]]] = None, refresh: bool = False
+) -> Iterator[pd.DataFrame]:
+    # Offensive run / pass plays of `teams` in one season, with personnel and derived features, in chunks.
+    # Games listed in `done` (per team) are filtered out in the scan.
+    path = _cached_download(PBP_URL.format(season=season), RAW_DIR / f"play_by_play_{season}.parquet", refresh)
+    personnel = _season_personnel(season, teams, refresh)
+
+    done = done or {}
+    offense = None
+    for team in teams:
+        team_plays = ds.field("posteam") == team
+        if done.get(team):
+            team_plays = team_plays & ~ds.field("game_id").isin(done[team])
+        offense = team_plays if offense is None else offense | team_plays
+    plays = offense & ds.field("play_type").isin(["run", "pass"])
+
+    for batch in _scan(path, PBP_COLUMNS, plays):
+        if batch.num_rows == 0:
+            continue
+        chunk = batch.to_pandas().reindex(columns=PBP_COLUMNS)
+
+        # Merge just offense_personnel onto pbp; keeps all pbp rows, adds NaN for any play without mapping
+        chunk = pd.merge(chunk, personnel, on=['game_id', 'play_id'], how='left')
+        chunk = add_features(chunk)
+        if len(chunk):
+            yield chunk
+
+
+def _store_schema(table: pa.Table) -> pa.Schema:
+    # A column that happens to be all null in the first chunk must still accept strings later
+    return pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in table.schema])
+
+
+def load_manifest(store: Path = FEATURE_STORE_DIR) -> Dict[str, Dict[str, List[str]]]:
+    # {"2025": {"CHI": [game_id, ...]}} -- games already in the store, by season and team
+    path = store / MANIFEST_NAME
+    return json.loads(path.read_text())["games"] if path.exists() else {}
+
+
+def _save_manifest(store: Path, games: Dict[str, Dict[str, List[str]]]) -> None:
+    # Written after the data files, and atomically: an interrupted run just redoes its games
+    partial = store / (MANIFEST_NAME + ".part")
+    partial.write_text(json.dumps({"updated": time.strftime("%Y-%m-%dT%H:%M:%S"), "games": games}, indent=1))
+    os.replace(partial, store / MANIFEST_NAME)
+
+
+class _PartitionWriters:
+    # One new part file per season/team partition touched by this run, opened on first write
+    def __init__(self, store: Path):
+        self.store = store
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self._writers: Dict[tuple, pq.ParquetWriter] = {}
+        self._schema: Optional[pa.Schema] = None
+
+    def write(self, season: int, team: str, chunk: pd.DataFrame) -> None:
+        table = pa.Table.from_pandas(chunk.reindex(columns=STORE_COLUMNS), preserve_index=False)
+        if self._schema is None:
+            self._schema = _store_schema(table)
+        writer = self._writers.get((season, team))
+        if writer is None:
+            directory = self.store / f"season={season}" / f"team={team}"
+            directory.mkdir(parents=True, exist_ok=True)
+            writer = self._writers[(season, team)] = pq.ParquetWriter(directory / f"part-{self.run_id}.parquet", self._schema)
+        writer.write_table(table.cast(self._schema))
+
+    def close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+
+
+def update_store(
+    seasons: Sequence[int], teams: Sequence[str], store: Path = FEATURE_STORE_DIR, refresh: bool = False
+) -> Dict[str, int]:
+    # Appends plays from games not yet in the manifest; returns new plays per "season/team"
+    games = load_manifest(store)
+    added: Dict[str, int] = {}
+    writers = _PartitionWriters(store)
+    try:
+        for season in seasons:
+            done = games.setdefault(str(season), {})
+            for chunk in season_chunks(season, teams, done, refresh):
+                for team, plays in chunk.groupby("posteam", sort=False):
+                    writers.write(season, team, plays)
+                    done.setdefault(team, [])
+                    done[team].extend(g for g in plays["game_id"].unique() if g not in done[team])
+                    added[f"{season}/{team}"] = added.get(f"{season}/{team}", 0) + len(plays)
+    finally:
+        writers.close()
+    _save_manifest(store, games)
+    return added
+
+
+def import_parquet(path: Path, store: Path = FEATURE_STORE_DIR) -> Dict[str, int]:
+    # Seed the store from a flat file written by the old single-file build (e.g. pbp_offense_chi_2025.parquet)
+    games = load_manifest(store)
+    frame = pd.read_parquet(path, columns=STORE_COLUMNS + ["season"])
+    added: Dict[str, int] = {}
+    writers = _PartitionWriters(store)
+    try:
+        for (season, team), plays in frame.groupby(["season", "posteam"], sort=True):
+            done = games.setdefault(str(int(season)), {}).setdefault(team, [])
+            plays = plays[~plays["game_id"].isin(done)]
+            if len(plays):
+                writers.write(int(season), team, plays)
+                done.extend(plays["game_id"].unique())
+                added[f"{int(season)}/{team}"] = len(plays)
+    finally:
+        writers.close()
+    _save_manifest(store, games)
+    return added
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build / update the offensive play feature store from nflverse play-by-play")
+    parser.add_argument("--seasons", type=int, nargs="+", default=[2025])
+    parser.add_argument("--teams", nargs="+", default=["CHI"])
+    parser.add_argument("--refresh", action="store_true", help="re-download the season files (picks up new games)")
+    parser.add_argument("--store", type=Path, default=FEATURE_STORE_DIR)
+    parser.add_argument("--import-parquet", type=Path, help="seed the store from a flat features parquet instead")
+    args = parser.parse_args(argv)
+
+    #####
+    ###Saving data
+    ####
+    args.store.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    if args.import_parquet is not None:
+        added = import_parquet(args.import_parquet, args.store)
+    else:
+        added = update_store(args.seasons, args.teams, args.store, args.refresh)
+
+    for partition, rows in sorted(added.items()):
+        print(f"  {partition}: +{rows} plays")
+    if not added:
+        print("  no new games")
+    print(f"Updated {args.store.resolve()} in {time.perf_counter() - started:.1f}s")
+
+    pbp_offense = pd.read_parquet(
+        args.store, columns=["game_id", "offense_personnel", "run_player"], filters=[("team", "in", args.teams)]
+    )
+    print("Offense personnel unique values:", pbp_offense["offense_personnel"].unique())
+    print(len(pbp_offense), "plays from", pbp_offense["game_id"].nunique(), "games")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backend.app.services.situation_grids import GRIDS_PATH, MAX_DISTANCE, MAX_DOWN, MAX_YARDLINE, SHAPE, save_grids
+from backend.ml.training.data import FEATURE_STORE_DIR, TRAIN_SEASONS, TRAIN_TEAMS, load_store_columns
+
+# Offline stage: aggregate play-by-play into smoothed, dense expected-points and conversion grids by
+# (down, distance, yardline_100), saved for the API's policy layer (backend/app/services/situation_grids.py).
+#   EP         = points the offense scores on the current drive (TD 7, FG 3, opponent TD -7, safety -2)
+#   conversion = P(the current series reaches a first down or touchdown), nflverse series_success
+#
+#   python -m backend.ml.features.build_situation_grids                       # feature store, training slice
+#   python -m backend.ml.features.build_situation_grids --seasons 2023 2024 2025 --teams CHI GB
+#   python -m backend.ml.features.build_situation_grids --input a.parquet b.parquet   # flat files instead
+
+DRIVE_POINTS = {"Touchdown": 7.0, "Field goal": 3.0, "Opp touchdown": -7.0, "Safety": -2.0}
+
+# Gaussian bandwidths in yards (distance, yardline). The fine estimate is shrunk toward the coarse
+# one, and the coarse one toward the down's average, each with PRIOR_PLAYS pseudo-plays.
+FINE_BANDWIDTH = (1.5, 5.0)
+COARSE_BANDWIDTH = (4.0, 15.0)
+PRIOR_PLAYS = 5.0
+
+COLUMNS = ["down", "ydstogo", "yardline_100", "series_success", "fixed_drive_result"]
+
+
+def load_plays(
+    paths: Optional[Sequence[Path]] = None,
+    seasons: Optional[Sequence[int]] = None,
+    teams: Optional[Sequence[str]] = None,
+    store: Path = FEATURE_STORE_DIR,
+) -> pd.DataFrame:
+    # Flat play-by-play files if given, otherwise the seasons / teams slice of the feature store
+    if paths:
+        plays = pd.concat([pd.read_parquet(path, columns=COLUMNS) for path in paths], ignore_index=True)
+    else:
+        plays = load_store_columns(COLUMNS, seasons, teams, store)
+    plays = plays.dropna(subset=["down", "ydstogo", "yardline_100"])
+    plays = plays[plays["down"].between(1, MAX_DOWN) & plays["yardline_100"].between(1, MAX_YARDLINE)]
+    return plays
+
+
+def _kernel(size: int, bandwidth: float) -> np.ndarray:
+    # Row i: Gaussian weights of every position j around i
+    positions = np.arange(size)
+    return np.exp(-0.5 * ((positions[:, None] - positions[None, :]) / bandwidth) ** 2)
+
+
+def _smooth(grid: np.ndarray, bandwidth: Tuple[float, float]) -> np.ndarray:
+    # Separable kernel smoothing over distance and yardline, per down: K_d @ grid[down] @ K_y^T
+    k_distance = _kernel(grid.shape[1], bandwidth[0])
+    k_yardline = _kernel(grid.shape[2], bandwidth[1])
+    return np.einsum("ij,djk,lk->dil", k_distance, grid, k_yardline)
+
+
+def _estimate(sums: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # Kernel-weighted mean per cell, shrunk toward progressively coarser estimates where plays are sparse.
+    # Index 0 of the distance / yardline axes never has plays, so it's excluded and mirrored afterwards.
+    sums, counts = sums[:, 1:, 1:], counts[:, 1:, 1:]
+    totals = counts.sum(axis=(1, 2))
+    overall = sums.sum() / max(counts.sum(), 1.0)
+    down_mean = np.where(totals > 0, sums.sum(axis=(1, 2)) / np.maximum(totals, 1.0), overall)[:, None, None]
+
+    coarse_sums, coarse_counts = _smooth(sums, COARSE_BANDWIDTH), _smooth(counts, COARSE_BANDWIDTH)
+    coarse = (coarse_sums + PRIOR_PLAYS * down_mean) / (coarse_counts + PRIOR_PLAYS)
+    fine_sums, fine_counts = _smooth(sums, FINE_BANDWIDTH), _smooth(counts, FINE_BANDWIDTH)
+    fine = (fine_sums + PRIOR_PLAYS * coarse) / (fine_counts + PRIOR_PLAYS)
+
+    dense = np.empty((fine.shape[0], fine.shape[1] + 1, fine.shape[2] + 1))
+    dense[:, 1:, 1:] = fine
+    dense[:, 0, :] = dense[:, 1, :]
+    dense[:, :, 0] = dense[:, :, 1]
+    return dense
+
+
+def build_grids(plays: pd.DataFrame) -> np.ndarray:
+    down = plays["down"].to_numpy(dtype=np.int64)
+    distance = np.clip(plays["ydstogo"].to_numpy(dtype=np.int64), 1, MAX_DISTANCE)
+    yardline = plays["yardline_100"].to_numpy(dtype=np.int64)
+    points = plays["fixed_drive_result"].map(DRIVE_POINTS).fillna(0.0).to_numpy(dtype=np.float64)
+    converted = plays["series_success"].fillna(0.0).to_numpy(dtype=np.float64)
+
+    # Per-cell play counts and target sums, over downs 1-4
+    cells = (down - 1, distance, yardline)
+    counts = np.zeros((MAX_DOWN, MAX_DISTANCE + 1, MAX_YARDLINE + 1))
+    np.add.at(counts, cells, 1.0)
+    point_sums = np.zeros_like(counts)
+    np.add.at(point_sums, cells, points)
+    conversion_sums = np.zeros_like(counts)
+    np.add.at(conversion_sums, cells, converted)
+
+    grids = np.zeros(SHAPE, dtype=np.float32)
+    grids[0, 1:] = _estimate(point_sums, counts)
+    grids[1, 1:] = np.clip(_estimate(conversion_sums, counts), 0.0, 1.0)
+    grids[2, 1:] = counts
+    grids[:, 0] = grids[:, 1]
+    return grids
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the expected-points / conversion lookup grids")
+    parser.add_argument("--store", type=Path, default=FEATURE_STORE_DIR)
+    parser.add_argument("--seasons", type=int, nargs="+", default=TRAIN_SEASONS)
+    parser.add_argument("--teams", nargs="+", default=TRAIN_TEAMS)
+    parser.add_argument("--input", type=Path, nargs="+", help="flat play-by-play parquet file(s) instead of the store")
+    parser.add_argument("--out", type=Path, default=GRIDS_PATH)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    plays = load_plays(args.input, args.seasons, args.teams, args.store)
+    grids = build_grids(plays)
+    if args.input:
+        inputs: List[str] = [path.name for path in args.input]
+    else:
+        inputs = [f"{args.store.name}/season={season}/team={team}" for season in args.seasons for team in args.teams]
+    save_grids(
+        grids,
+        {
+            "inputs": inputs,
+            "plays": len(plays),
+            "fine_bandwidth": FINE_BANDWIDTH,
+            "coarse_bandwidth": COARSE_BANDWIDTH,
+            "prior_plays": PRIOR_PLAYS,
+            "built": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        args.out,
+    )
+    print(f"Built grids from {len(plays)} plays in {time.perf_counter() - started:.2f}s -> {args.out.resolve()}")
+    for down, distance, yardline in ((1, 10, 75), (1, 10, 25), (3, 2, 50), (3, 8, 50), (4, 1, 40), (1, 5, 5)):
+        print(
+            f"  {down}&{distance} at the {yardline}: EP {grids[0, down, distance, yardline]:.2f}, "
+            f"conversion {grids[1, down, distance, yardline]:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
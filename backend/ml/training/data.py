@@ -0,0 +1,79 @@
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# Feature set for training (kept here for reproducible experiments).
+FEATURE_COLUMNS = [
+    "down",
+    "ydstogo",
+    "yardline_100",
+    "game_seconds_remaining",
+    "half_seconds_remaining",
+    "score_differential",
+    "posteam_timeouts_remaining",
+    "defteam_timeouts_remaining",
+    "no_huddle",
+    "posteam_type",
+    "play_type",
+    "run_location",
+    "run_gap",
+    "run_player",
+    "pass_location",
+    "pass_depth_bucket",
+    "shotgun",
+    "offense_personnel",
+]
+
+TARGET_COLUMNS = ["success", "yards_gained"]
+
+ARTIFACTS_DIR = Path(__file__).resolve().parents[1] / "artifacts"
+
+# Partitioned season=/team= dataset written by backend/ml/features/build_features.py
+FEATURE_STORE_DIR = Path(os.getenv("FEATURE_STORE_DIR", ARTIFACTS_DIR / "feature_store"))
+
+# Slice to train on, e.g. TRAIN_SEASONS=2023,2024,2025 TRAIN_TEAMS=CHI
+TRAIN_SEASONS = [int(season) for season in os.getenv("TRAIN_SEASONS", "2025").split(",")]
+TRAIN_TEAMS = os.getenv("TRAIN_TEAMS", "CHI").split(",")
+
+
+def load_store_columns(
+    columns: Sequence[str],
+    seasons: Optional[Sequence[int]] = None,
+    teams: Optional[Sequence[str]] = None,
+    store: Path = FEATURE_STORE_DIR,
+) -> pd.DataFrame:
+    # Partition filters are pushed down: only the matching season/team files are opened, and only these columns read
+    return pd.read_parquet(
+        store,
+        columns=list(columns),
+        filters=[("season", "in", list(seasons or TRAIN_SEASONS)), ("team", "in", list(teams or TRAIN_TEAMS))],
+    )
+
+
+def load_training_frame(
+    seasons: Optional[Sequence[int]] = None, teams: Optional[Sequence[str]] = None, store: Path = FEATURE_STORE_DIR
+) -> Tuple[pd.DataFrame, List[str]]:
+    # Features + targets + game_id for the slice, and the categorical feature names
+    ##reading in data, getting relevant data, and dropping na
+    dfraw = load_store_columns(FEATURE_COLUMNS + TARGET_COLUMNS + ["game_id"], seasons, teams, store)
+
+    dftrain = dfraw[FEATURE_COLUMNS + TARGET_COLUMNS + ["game_id"]]
+
+    # object (pandas < 3) or str (pandas >= 3) columns are the categoricals
+    categorical_cols = [col for col in FEATURE_COLUMNS if not pd.api.types.is_numeric_dtype(dftrain[col])]
+    for col in categorical_cols:
+        dftrain[col] = dftrain[col].fillna("unknown")
+
+    dftrain = dftrain.dropna(subset=TARGET_COLUMNS).reset_index(drop=True)
+    return dftrain, categorical_cols
+
+
+def holdout_masks(dftrain: pd.DataFrame, test_size: float = 0.1, random_state: int = 0) -> Tuple[pd.Series, pd.Series]:
+    # Split by unique game_id to avoid leakage.
+    from sklearn.model_selection import train_test_split
+
+    game_ids = pd.unique(dftrain["game_id"].to_numpy())
+    train_games, validate_games = train_test_split(game_ids, test_size=test_size, random_state=random_state)
+    return dftrain["game_id"].isin(train_games), dftrain["game_id"].isin(validate_games)
@@ -0,0 +1,260 @@
+import argparse
+import runpy
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from catboost import Pool
+
+from backend.app.services.model_registry import activate, load_active, pair_metrics, publish
+from backend.ml.training.data import ARTIFACTS_DIR, TRAIN_SEASONS, TRAIN_TEAMS, load_training_frame
+
+# Weekly refresh without a full retrain. The active registry pair keeps boosting (CatBoost init_model)
+# on the games added to the feature store since it was trained, plus a replay sample of older games.
+# The new trees reuse the base model's quantization borders, which are cached per model under
+# INCREMENTAL_DIR.
+# The most recent --holdout-games new games are held out. They check the base pair for drift, early-stop the
+# new trees and score the result; the published pair is then refit with them, using the same number of trees.
+# Scores on these holdouts are recorded as "holdout_metrics", and the next refresh compares its base pair's
+# score against them (train.py's "metrics" come from a random game split, so they aren't comparable).
+# When drift says the base pair is stale, a full retrain (train.py) runs instead.
+#
+#   python -m backend.ml.training.incremental                     # refresh and publish
+#   python -m backend.ml.training.incremental --dry-run           # drift report only
+#   python -m backend.ml.training.incremental --full              # force a full retrain
+#   python -m backend.ml.training.incremental --trained-through 2025_18_DET_CHI   (base without a game list)
+
+INCREMENTAL_DIR = ARTIFACTS_DIR / "incremental"
+
+LABELS = {"success": "success", "yards": "yards_gained"}
+
+# Drift thresholds for falling back to a full retrain
+MAX_PSI = 0.25  # population stability index of a feature, base training games vs new games
+MAX_UNSEEN_SHARE = 0.05  # share of new plays with a category value the base never trained on
+MAX_AUC_DROP = 0.03  # base pair's AUC on the holdout games vs its recorded holdout_metrics AUC
+MAX_MAE_RISE = 0.10  # same for yards MAE, relative
+
+# Situation and play-mix features compared between old and new games. Game-level context (home / away,
+# score, clock, timeouts) is left out: over a few games it always shifts, without the plays changing.
+DRIFT_COLUMNS = ["down", "ydstogo", "yardline_100", "play_type", "run_location", "pass_location", "pass_depth_bucket", "shotgun", "offense_personnel"]
+
+
+def chronological(games: Sequence[str]) -> List[str]:
+    # nflverse game ids start with season_week, so they sort by date
+    return sorted(games)
+
+
+def trained_games(metadata: Dict[str, Any], games: Sequence[str], trained_through: Optional[str]) -> Optional[List[str]]:
+    # Games the base pair has seen: fit on, or early-stopped on (train.py's validation games)
+    training = metadata.get("training", {})
+    recorded = training.get("games")
+    if recorded is not None:
+        return sorted(set(recorded) | set(training.get("validation_games", [])))
+    if trained_through is not None:
+        return [game for game in games if game <= trained_through]
+    return None
+
+
+def psi(expected: pd.Series, actual: pd.Series, bins: int = 10) -> float:
+    # Population stability index: numeric columns on the expected side's quantile bins, categoricals per value
+    if pd.api.types.is_numeric_dtype(expected):
+        edges = np.unique(np.quantile(expected.dropna(), np.linspace(0, 1, bins + 1)))
+        edges[0], edges[-1] = -np.inf, np.inf
+        e = np.histogram(expected.dropna(), edges)[0].astype(float)
+        a = np.histogram(actual.dropna(), edges)[0].astype(float)
+    else:
+        values = pd.Index(expected.unique()).union(actual.unique())
+        e = expected.value_counts().reindex(values, fill_value=0).to_numpy(dtype=float)
+        a = actual.value_counts().reindex(values, fill_value=0).to_numpy(dtype=float)
+    e = np.maximum(e / max(e.sum(), 1.0), 1e-4)
+    a = np.maximum(a / max(a.sum(), 1.0), 1e-4)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def drift_report(
+    old: pd.DataFrame,
+    new: pd.DataFrame,
+    categorical_cols: List[str],
+    recorded: Dict[str, float],
+    holdout: Dict[str, float],
+) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "psi": {col: round(psi(old[col], new[col]), 4) for col in DRIFT_COLUMNS},
+        "unseen_share": {col: round(float((~new[col].isin(old[col].unique())).mean()), 4) for col in categorical_cols},
+        "holdout": {name: round(float(value), 4) for name, value in holdout.items()},
+        "recorded": recorded,
+    }
+    reasons = [f"{col} PSI {value:.2f}" for col, value in report["psi"].items() if value > MAX_PSI]
+    reasons += [f"{col}: {share:.0%} of new plays unseen" for col, share in report["unseen_share"].items() if share > MAX_UNSEEN_SHARE]
+    if "auc" in recorded and "auc" in holdout and recorded["auc"] - holdout["auc"] > MAX_AUC_DROP:
+        reasons.append(f"holdout AUC {holdout['auc']:.3f} vs {recorded['auc']:.3f}")
+    if "mae" in recorded and "mae" in holdout and holdout["mae"] > recorded["mae"] * (1 + MAX_MAE_RISE):
+        reasons.append(f"holdout MAE {holdout['mae']:.3f} vs {recorded['mae']:.3f}")
+    report["reasons"] = reasons
+    return report
+
+
+def border_file(model: Any, cache_dir: Path = INCREMENTAL_DIR) -> Path:
+    # The base model's float feature borders in CatBoost's input_borders format, written once per model
+    path = cache_dir / f"{model.get_metadata()['model_guid']}.borders.tsv"
+    if not path.exists():
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            for feature, borders in sorted(model.get_borders().items()):
+                f.writelines(f"{feature}\t{border!r}\n" for border in borders)
+        tmp.rename(path)
+    return path
+
+
+def continue_training(
+    base: Any,
+    train: pd.DataFrame,
+    label: str,
+    categorical_cols: List[str],
+    iterations: int,
+    learning_rate: float,
+    borders: Path,
+    val: Optional[pd.DataFrame] = None,
+) -> Tuple[Any, int]:
+    # New trees on top of the base model; with a validation frame they early-stop on it.
+    # Returns the model and the number of trees it added.
+    params = {
+        key: value
+        for key, value in base.get_params().items()
+        if key in ("loss_function", "eval_metric", "depth", "l2_leaf_reg", "random_seed", "random_state")
+    }
+    model = type(base)(
+        **params, iterations=iterations, learning_rate=learning_rate, input_borders=str(borders), verbose=0, allow_writing_files=False
+    )
+    features = list(base.feature_names_)
+    train_pool = Pool(train[features], train[label], cat_features=categorical_cols)
+    eval_set = Pool(val[features], val[label], cat_features=categorical_cols) if val is not None else None
+    model.fit(
+        train_pool,
+        init_model=base,
+        eval_set=eval_set,
+        use_best_model=eval_set is not None,
+        early_stopping_rounds=max(20, iterations // 10) if eval_set is not None else None,
+    )
+    return model, model.tree_count_ - base.tree_count_
+
+
+def full_retrain() -> str:
+    # train.py is a script: it fits both models on the whole slice and publishes them
+    return runpy.run_module("backend.ml.training.train", run_name="__main__")["version"]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Warm-start the active model pair on newly added games")
+    parser.add_argument("--holdout-games", type=int, default=2, help="most recent games held out for drift / validation")
+    parser.add_argument("--iterations", type=int, default=300, help="upper bound on trees added per model")
+    parser.add_argument("--learning-rate", type=float, default=0.03)
+    parser.add_argument("--replay", type=float, default=0.25, help="fraction of previously trained plays mixed back in")
+    parser.add_argument("--trained-through", help="last game the base pair saw, if its metadata has no game list")
+    parser.add_argument("--dry-run", action="store_true", help="report new games and drift, don't train")
+    parser.add_argument("--full", action="store_true", help="full retrain regardless of drift")
+    parser.add_argument("--activate", action="store_true", help="activate the result unless it's worse on the holdout")
+    args = parser.parse_args(argv)
+    if args.holdout_games < 1:
+        parser.error("--holdout-games must be at least 1")
+
+    started = time.perf_counter()
+    frame, categorical_cols = load_training_frame()
+    base_success, base_yards, metadata = load_active()
+    base_version = metadata.get("version")
+    games = chronological(frame["game_id"].unique())
+    trained = trained_games(metadata, games, args.trained_through)
+    if trained is None:
+        parser.error(f"version {base_version} doesn't record its training games; pass --trained-through GAME_ID")
+    trained_set = set(trained)
+    new_games = [game for game in games if game not in trained_set]
+    print(f"Base {base_version}: {len(trained_set & set(games))} games trained, {len(new_games)} new: {', '.join(new_games) or '-'}")
+    if len(new_games) <= args.holdout_games and not args.full:
+        print(f"Need more than {args.holdout_games} new games (the holdout) to continue training; nothing to do")
+        return
+    # Held out from the new games only: the base pair must not have trained on them
+    holdout_games = new_games[-args.holdout_games :]
+
+    holdout = frame[frame["game_id"].isin(holdout_games)]
+    old = frame[frame["game_id"].isin(trained_set) & ~frame["game_id"].isin(holdout_games)]
+    new = frame[frame["game_id"].isin(new_games)]
+    base_holdout = pair_metrics(base_success, base_yards, holdout) if len(holdout) else {}
+    report = drift_report(old, new, categorical_cols, metadata.get("holdout_metrics", {}), base_holdout)
+    print(f"Holdout ({', '.join(holdout_games) or '-'}), base pair: " + " ".join(f"{k}={v:.3f}" for k, v in report["holdout"].items()))
+    worst = sorted(report["psi"].items(), key=lambda item: -item[1])[:3]
+    print("Largest PSI: " + ", ".join(f"{col} {value:.3f}" for col, value in worst))
+    for reason in report["reasons"]:
+        print("  drift:", reason)
+    if args.dry_run:
+        return
+
+    if args.full or report["reasons"]:
+        print("Full retrain" + (" (forced)" if args.full else " (drift)"))
+        version = full_retrain()
+        if args.activate:
+            activate(version)
+            print("Activated", version)
+        print(f"Done in {time.perf_counter() - started:.1f}s")
+        return
+
+    # Training rows: new games outside the holdout, plus a replay sample of what the base already saw
+    replay = old.sample(frac=args.replay, random_state=0) if args.replay > 0 else old.iloc[:0]
+    fit_rows = pd.concat([new[~new["game_id"].isin(holdout_games)], replay])
+    final_rows = pd.concat([new, replay])
+
+    bases = {"success": base_success, "yards": base_yards}
+    validated, added, final = {}, {}, {}
+    for name, base in bases.items():
+        borders = border_file(base)
+        # The validated fit picks the number of trees; the published model is refit with the holdout games included
+        validated[name], added[name] = continue_training(
+            base, fit_rows, LABELS[name], categorical_cols, args.iterations, args.learning_rate, borders, val=holdout
+        )
+        final[name] = base
+        if added[name] > 0:
+            final[name], _ = continue_training(
+                base, final_rows, LABELS[name], categorical_cols, added[name], args.learning_rate, borders
+            )
+    metrics = pair_metrics(validated["success"], validated["yards"], holdout)
+    print(
+        f"Continued: +{added['success']} / +{added['yards']} trees on {len(fit_rows)} plays; holdout "
+        + " ".join(f"{k}={v:.3f}" for k, v in metrics.items())
+    )
+
+    version = publish(
+        final["success"],
+        final["yards"],
+        metrics,
+        notes=f"incremental from {base_version}",
+        extra={
+            "holdout_metrics": {name: round(float(value), 6) for name, value in metrics.items()},
+            "training": {
+                "seasons": TRAIN_SEASONS,
+                "teams": TRAIN_TEAMS,
+                # Rows of the published (refit) models: new games including the holdout, plus the replay sample
+                "rows": len(final_rows),
+                "games": sorted(trained_set | set(new_games)),
+                "mode": "incremental",
+                "base": base_version,
+                "trees_added": added,
+                "holdout_games": holdout_games,
+            },
+            "drift": report,
+        },
+    )
+    print("Published model version:", version)
+    baseline = report["holdout"]
+    if args.activate:
+        if metrics["auc"] >= baseline["auc"] - 0.005 and metrics["mae"] <= baseline["mae"] * 1.01:
+            activate(version)
+            print("Activated", version)
+        else:
+            print(f"Not activated: worse than {base_version} on the holdout games")
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostClassifier, CatBoostRegressor, Pool
+from sklearn.metrics import mean_absolute_error, roc_auc_score
+from sklearn.model_selection import GroupKFold
+
+from backend.ml.training.data import ARTIFACTS_DIR, FEATURE_COLUMNS, TRAIN_SEASONS, TRAIN_TEAMS, load_training_frame
+
+# Grouped K-fold hyperparameter sweep for both models. Every (config, target, fold) fit is a job on a
+# process pool; each job gets `threads_per_job` CatBoost threads so jobs x threads fills the machine
+# without oversubscribing it. The quantized training Pool of each (target, fold) is built once per set of
+# quantization parameters, saved under the cache dir and loaded by every config that needs it.
+#
+#   python -m backend.ml.training.sweep                                   # default grid, 5 folds
+#   python -m backend.ml.training.sweep --param depth=4,6 --param learning_rate=0.05,0.1 --jobs 8
+#   python -m backend.ml.training.sweep --publish                         # also register the best pair
+#   python -m backend.ml.training.sweep --activate                        # register it and serve it
+
+SWEEP_DIR = ARTIFACTS_DIR / "sweep"
+
+DEFAULT_GRID: Dict[str, List[Any]] = {
+    "depth": [4, 6, 8],
+    "learning_rate": [0.03, 0.05, 0.1],
+    "l2_leaf_reg": [3, 10],
+}
+
+# Same objectives as train.py; the label column, artifact name and registry metrics of each model
+TARGETS: Dict[str, Dict[str, Any]] = {
+    "success": {
+        "label": "success",
+        "model": CatBoostClassifier,
+        "params": {"loss_function": "Logloss", "eval_metric": "AUC"},
+        "artifact": "success_classifier_CatBoost",
+        "pickle": "success_classifier_CatBoost_pipeline.pkl",
+        "metrics": ("auc",),
+    },
+    "yards": {
+        "label": "yards_gained",
+        "model": CatBoostRegressor,
+        "params": {"loss_function": "Quantile:alpha=0.5", "eval_metric": "Quantile:alpha=0.5"},
+        "artifact": "yards_gained",
+        "pickle": "yards_gained_pipeline.pkl",
+        "metrics": ("mae", "rmse"),
+    },
+}
+
+# Pool.quantize parameters: configs that differ in any of them need their own quantized Pools
+QUANTIZATION_PARAMS = (
+    "border_count",
+    "max_bin",
+    "feature_border_type",
+    "per_float_feature_quantization",
+    "nan_mode",
+    "input_borders",
+    "dev_max_subset_size_for_build_borders",
+)
+
+# Set in each worker process by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+def _parse_param(spec: str) -> Tuple[str, List[Any]]:
+    # "depth=4,6,8" -> ("depth", [4, 6, 8]); values are parsed as JSON where possible
+    name, _, values = spec.partition("=")
+    parsed = []
+    for value in values.split(","):
+        try:
+            parsed.append(json.loads(value))
+        except json.JSONDecodeError:
+            parsed.append(value)
+    return name, parsed
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def grouped_folds(frame: pd.DataFrame, n_folds: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    # Whole games go to one side of each split, as in train.py's game_id holdout
+    return list(GroupKFold(n_splits=n_folds).split(frame, groups=frame["game_id"]))
+
+
+def _quantization(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: params[name] for name in QUANTIZATION_PARAMS if name in params}
+
+
+def _cache_key(frame: pd.DataFrame, n_folds: int, quantization: Dict[str, Any]) -> str:
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    digest.update(f"{n_folds}:{json.dumps(quantization, sort_keys=True)}:{','.join(FEATURE_COLUMNS)}".encode())
+    return digest.hexdigest()[:16]
+
+
+def build_pool_cache(
+    frame: pd.DataFrame,
+    categorical_cols: List[str],
+    folds: List[Tuple[np.ndarray, np.ndarray]],
+    cache_dir: Path,
+    quantization: Dict[str, Any],
+) -> Dict[Tuple[str, int], Path]:
+    # One quantized training Pool per (target, fold), reused by every config. Validation folds stay raw:
+    # CatBoost quantizes them with the training pool's borders at fit time.
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cat_features = [FEATURE_COLUMNS.index(col) for col in categorical_cols]
+    paths: Dict[Tuple[str, int], Path] = {}
+    for target, spec in TARGETS.items():
+        for k, (train_index, _) in enumerate(folds):
+            path = cache_dir / f"{target}_fold{k}.bin"
+            if not path.exists():
+                rows = frame.iloc[train_index]
+                pool = Pool(rows[FEATURE_COLUMNS], rows[spec["label"]], cat_features=cat_features)
+                pool.quantize(**quantization)
+                pool.save(str(path))
+            paths[(target, k)] = path
+    return paths
+
+
+def _init_worker(seasons: List[int], teams: List[str], n_folds: int) -> None:
+    frame, categorical_cols = load_training_frame(seasons, teams)
+    _worker["frame"] = frame
+    _worker["cat_features"] = [FEATURE_COLUMNS.index(col) for col in categorical_cols]
+    _worker["folds"] = grouped_folds(frame, n_folds)
+    _worker["eval_pools"] = {}
+
+
+def _eval_pool(target: str, k: int) -> Pool:
+    key = (target, k)
+    if key not in _worker["eval_pools"]:
+        rows = _worker["frame"].iloc[_worker["folds"][k][1]]
+        _worker["eval_pools"][key] = Pool(
+            rows[FEATURE_COLUMNS], rows[TARGETS[target]["label"]], cat_features=_worker["cat_features"]
+        )
+    return _worker["eval_pools"][key]
+
+
+def _score(target: str, labels: pd.Series, model: Any, pool: Pool) -> float:
+    if target == "success":
+        return float(roc_auc_score(labels, model.predict_proba(pool)[:, 1]))
+    return float(mean_absolute_error(labels, model.predict(pool)))
+
+
+def _fit_job(
+    target: str, config: Dict[str, Any], k: int, pool_path: str, base: Dict[str, Any], threads: int
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    spec = TARGETS[target]
+    # The quantization parameters are already baked into the cached Pool
+    params = {name: value for name, value in {**base, **config}.items() if name not in QUANTIZATION_PARAMS}
+    model = spec["model"](**spec["params"], **params, thread_count=threads, random_state=0, verbose=0, allow_writing_files=False)
+    eval_pool = _eval_pool(target, k)
+    model.fit(Pool(f"quantized://{pool_path}"), eval_set=eval_pool, use_best_model=True)
+    labels = _worker["frame"][spec["label"]].iloc[_worker["folds"][k][1]]
+    return {
+        "target": target,
+        "config": json.dumps(config, sort_keys=True),
+        "fold": k,
+        "score": _score(target, labels, model, eval_pool),
+        "best_iteration": model.get_best_iteration(),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def summarize(results: List[Dict[str, Any]]) -> pd.DataFrame:
+    # One row per (target, config): fold mean / std of AUC (success, higher is better) or MAE (yards, lower)
+    table = (
+        pd.DataFrame(results)
+        .groupby(["target", "config"])
+        .agg(
+            score=("score", "mean"),
+            score_std=("score", "std"),
+            best_iteration=("best_iteration", "mean"),
+            fit_seconds=("seconds", "sum"),
+            folds=("fold", "count"),
+        )
+        .reset_index()
+    )
+    table["metric"] = np.where(table["target"] == "success", "auc", "mae")
+    table["rank"] = (
+        table.assign(key=np.where(table["target"] == "success", -table["score"], table["score"]))
+        .groupby("target")["key"]
+        .rank(method="first")
+        .astype(int)
+    )
+    return table.sort_values(["target", "rank"]).reset_index(drop=True)
+
+
+def fit_best(
+    table: pd.DataFrame, frame: pd.DataFrame, categorical_cols: List[str], base: Dict[str, Any], threads: int, out_dir: Path
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # Refit each target's best config on the whole slice, for the fold-average number of iterations.
+    # Returns the summary per target and the refit models.
+    import joblib
+
+    cat_features = [FEATURE_COLUMNS.index(col) for col in categorical_cols]
+    best: Dict[str, Any] = {}
+    models: Dict[str, Any] = {}
+    for target, spec in TARGETS.items():
+        rows = table[(table["target"] == target) & (table["rank"] == 1)]
+        if rows.empty:
+            continue
+        row = rows.iloc[0]
+        config = json.loads(row["config"])
+        params = {**base, **config, "iterations": int(round(row["best_iteration"])) + 1}
+        params.pop("early_stopping_rounds", None)
+        model = spec["model"](**spec["params"], **params, thread_count=threads, random_state=0, verbose=0, allow_writing_files=False)
+        model.fit(Pool(frame[FEATURE_COLUMNS], frame[spec["label"]], cat_features=cat_features))
+
+        model.save_model(str(out_dir / f"{spec['artifact']}.cbm"))
+        joblib.dump(model, out_dir / spec["pickle"])
+        best[target] = {"config": config, "iterations": params["iterations"], row["metric"]: row["score"]}
+        models[target] = model
+    return best, models
+
+
+def publish_best(best: Dict[str, Any], models: Dict[str, Any], frame: pd.DataFrame, args: argparse.Namespace) -> str:
+    # Registers the refit pair with its cross-validated metrics; a target left out of the sweep keeps the
+    # active version's model and metrics
+    from backend.app.services.model_registry import load_active, publish
+
+    active_success, active_yards, metadata = load_active()
+    pair = {"success": active_success, "yards": active_yards, **models}
+    metrics: Dict[str, float] = {}
+    for target, spec in TARGETS.items():
+        if target in best:
+            metrics.update({name: best[target][name] for name in spec["metrics"] if name in best[target]})
+        else:
+            metrics.update({name: value for name, value in metadata.get("metrics", {}).items() if name in spec["metrics"]})
+    return publish(
+        pair["success"],
+        pair["yards"],
+        metrics,
+        notes=f"sweep.py ({args.folds}-fold CV metrics)",
+        extra={
+            "training": {
+                "seasons": args.seasons,
+                "teams": args.teams,
+                "rows": len(frame),
+                "games": sorted(frame["game_id"].unique().tolist()),
+            },
+            "sweep": {"folds": args.folds, "best": best, "base": metadata.get("version") if len(models) < len(TARGETS) else None},
+        },
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Grouped K-fold hyperparameter sweep for the CatBoost models")
+    parser.add_argument("--param", action="append", type=_parse_param, default=[], help="grid axis, e.g. depth=4,6,8")
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--early-stopping", type=int, default=200)
+    parser.add_argument("--border-count", type=int, default=254)
+    parser.add_argument("--jobs", type=int, default=cpus, help="parallel fits (processes)")
+    parser.add_argument("--threads-per-job", type=int, default=None, help="CatBoost threads per fit (default cpus / jobs)")
+    parser.add_argument("--seasons", type=int, nargs="+", default=TRAIN_SEASONS)
+    parser.add_argument("--teams", nargs="+", default=TRAIN_TEAMS)
+    parser.add_argument("--out", type=Path, default=SWEEP_DIR)
+    parser.add_argument("--publish", action="store_true", help="register the best pair as a new model version")
+    parser.add_argument("--activate", action="store_true", help="register the best pair and make it the served version")
+    args = parser.parse_args(argv)
+
+    grid = dict(args.param) if args.param else DEFAULT_GRID
+    configs = expand_grid(grid)
+    threads = args.threads_per_job or max(1, cpus // args.jobs)
+    base = {"iterations": args.iterations, "early_stopping_rounds": args.early_stopping, "border_count": args.border_count}
+
+    frame, categorical_cols = load_training_frame(args.seasons, args.teams)
+    folds = grouped_folds(frame, args.folds)
+    started = time.perf_counter()
+    # Quantized pools per cache key, and each config's pools (configs sharing quantization share them)
+    pools: Dict[str, Dict[Tuple[str, int], Path]] = {}
+    config_pools: List[Dict[Tuple[str, int], Path]] = []
+    for config in configs:
+        quantization = _quantization({**base, **config})
+        key = _cache_key(frame, args.folds, quantization)
+        if key not in pools:
+            pools[key] = build_pool_cache(frame, categorical_cols, folds, args.out / "cache" / key, quantization)
+        config_pools.append(pools[key])
+    print(
+        f"{len(frame)} plays, {frame['game_id'].nunique()} games; {len(pools)} set(s) of quantized pools in "
+        f"{args.out / 'cache'} ({time.perf_counter() - started:.1f}s)"
+    )
+
+    jobs = [(target, i, k) for target in args.targets for i in range(len(configs)) for k in range(args.folds)]
+    print(f"{len(configs)} configs x {len(args.targets)} targets x {args.folds} folds = {len(jobs)} fits, {args.jobs} at a time x {threads} threads")
+
+    results: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=args.jobs, initializer=_init_worker, initargs=(args.seasons, args.teams, args.folds)
+    ) as executor:
+        futures = [
+            executor.submit(_fit_job, target, configs[i], k, str(config_pools[i][(target, k)]), base, threads)
+            for target, i, k in jobs
+        ]
+        for i, future in enumerate(as_completed(futures), 1):
+            results.append(future.result())
+            if i % max(1, len(jobs) // 20) == 0 or i == len(jobs):
+                print(f"  {i}/{len(jobs)} fits ({time.perf_counter() - started:.0f}s)")
+
+    table = summarize(results)
+    args.out.mkdir(parents=True, exist_ok=True)
+    table.to_csv(args.out / "results.csv", index=False)
+    with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+        print(table[["target", "rank", "metric", "score", "score_std", "best_iteration", "config"]].to_string(index=False))
+
+    best, models = fit_best(table, frame, categorical_cols, base, cpus, args.out)
+    (args.out / "best.json").write_text(json.dumps({"seasons": args.seasons, "teams": args.teams, "folds": args.folds, "best": best}, indent=1))
+    print("Saved results and best models to:", args.out.resolve())
+
+    if (args.publish or args.activate) and best:
+        version = publish_best(best, models, frame, args)
+        print("Published model version:", version)
+        if args.activate:
+            from backend.app.services.model_registry import activate
+
+            activate(version)
+            print("Activated", version)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,16 @@
-from pathlib import Path
-import pandas as pd
-
 ##ML libraries
 from sklearn.linear_model import LogisticRegression
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.pipeline import Pipeline
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, roc_auc_score, mean_absolute_error, mean_squared_error
 from catboost import CatBoostClassifier, CatBoostRegressor
 from sklearn.base import clone
 import joblib
 
-# Feature set for training (kept here for reproducible experiments).
-FEATURE_COLUMNS = [
-    "down",
-    "ydstogo",
-    "yardline_100",
-    "game_seconds_remaining",
-    "half_seconds_remaining",
-    "score_differential",
-    "posteam_timeouts_remaining",
-    "defteam_timeouts_remaining",
-    "no_huddle",
-    "posteam_type",
-    "play_type",
-    "run_location",
-    "run_gap",
-    "run_player",
-    "pass_location",
-    "pass_depth_bucket",
-    "shotgun",
-    "offense_personnel",
-]
-
-TARGET_COLUMNS = ["success", "yards_gained"]
-
-DATA_PATH = Path(__file__).resolve().parents[1] / "artifacts" / "pbp_offense_chi_2025.parquet"
-
-
-##reading in data, getting relevant data, and dropping na
-dfraw = pd.read_parquet(DATA_PATH)
+from backend.ml.training.data import ARTIFACTS_DIR, FEATURE_COLUMNS, holdout_masks, load_training_frame
 
-dftrain = dfraw[FEATURE_COLUMNS + TARGET_COLUMNS + ["game_id"]]
-
-for col in FEATURE_COLUMNS:
-    if dftrain[col].dtype == "object":
-        dftrain[col] = dftrain[col].fillna("unknown")
-
-dftrain = dftrain.dropna(subset=TARGET_COLUMNS)
+dftrain, categorical_cols = load_training_frame()
 
 # Split features/targets.
 X = dftrain[FEATURE_COLUMNS]
@@ -56,11 +18,7 @@ y_success = dftrain["success"]
 y_yards = dftrain["yards_gained"]
 
 # Split by unique game_id to avoid leakage.
-game_ids = dftrain["game_id"].unique()
-train_games, validate_games = train_test_split(game_ids, test_size=0.1, random_state=0)
-
-train_mask = dftrain["game_id"].isin(train_games)
-val_mask = dftrain["game_id"].isin(validate_games)
+train_mask, val_mask = holdout_masks(dftrain)
 
 X_train = X[train_mask]
 y_train_success = y_success[train_mask]
@@ -73,7 +31,6 @@ y_val_yards = y_yards[val_mask]
 
 
 # Identify categorical vs numeric columns.
-categorical_cols = [col for col in FEATURE_COLUMNS if X[col].dtype == "object"]
 numeric_cols = [col for col in FEATURE_COLUMNS if col not in categorical_cols]
 
 # Preprocessing: one-hot for categoricals, standardize numeric features.
@@ -85,8 +42,6 @@ preprocessor = ColumnTransformer(
     remainder="drop",
 )
 
-
-ARTIFACTS_DIR = Path(__file__).resolve().parents[1] / "artifacts"
 ARTIFACTS_DIR.mkdir(exist_ok=True)
 
 
@@ -138,6 +93,8 @@ print(f"Validation AUC for classification with CatBoost: {val_auc:.3f}")
 
 #Saving Classification to artifacts
 joblib.dump(cb_clf, ARTIFACTS_DIR / "success_classifier_CatBoost_pipeline.pkl")
+# Native format, loaded by the API without unpickling
+cb_clf.save_model(str(ARTIFACTS_DIR / "success_classifier_CatBoost.cbm"))
 
 
 
@@ -169,3 +126,29 @@ print(f"Validation RMSE for yards (CatBoost): {val_rmse:.3f}")
 
 
 joblib.dump(cb_reg, ARTIFACTS_DIR / "yards_gained_pipeline.pkl")
+cb_reg.save_model(str(ARTIFACTS_DIR / "yards_gained.cbm"))
+
+
+# Register the pair as a new version; the API switches to it once it's activated:
+#   python -m backend.app.services.model_registry activate <version>
+from backend.app.services.model_registry import publish
+from backend.ml.training.data import TRAIN_SEASONS, TRAIN_TEAMS
+
+version = publish(
+    cb_clf,
+    cb_reg,
+    {"auc": val_auc, "mae": val_mae, "rmse": val_rmse},
+    notes="train.py",
+    extra={
+        "training": {
+            "seasons": TRAIN_SEASONS,
+            "teams": TRAIN_TEAMS,
+            "rows": int(train_mask.sum()),
+            # Games the models were fit on, and the validation games they early-stopped on; the weekly
+            # incremental refresh (backend/ml/training/incremental.py) treats both as seen
+            "games": sorted(dftrain.loc[train_mask, "game_id"].unique().tolist()),
+            "validation_games": sorted(dftrain.loc[val_mask, "game_id"].unique().tolist()),
+        }
+    },
+)
+print("Published model version:", version)